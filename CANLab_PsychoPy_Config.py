@@ -49,6 +49,9 @@ autorespond = 1
 biopac_exists = 1
 thermode_exists = 0
 eyetracker_exists = 1
+biopac_simulated = int(os.environ.get('CANLAB_SIMULATE_BIOPAC', 0)) # 1 to use a simulated LabJack U3 (biopacSimulator.py) when there's no hardware
+biopac_pulse_width = None # Seconds each Biopac marker stays high, e.g. .01; None keeps markers high until the routine ends
+record_frames = 0 # 1 to record every flip time (see FrameLog): a _frames.tsv per run, and dropped frames and onset error in each trial
 
 endExpNow = False  # flag for 'escape' or other condition => quit the exp
 frameTolerance = 0.001  # how close to onset before 'same' frame
@@ -96,27 +99,32 @@ if biopac_exists == 1:
     # Check to see if u3 was imported correctly with: help('u3')
     # Check to see if u3 is calibrated correctly with: cal_data = biopac.getCalibrationData()
     # Check to see the data at the FIO, EIO, and CIO ports: biopac.getFeedback(u3.PortStateWrite(State = [0, 0, 0]))
-    try:
-        from psychopy.hardware.labjacks import U3
-        # from labjack import u3
-    except ImportError:
-        import u3
-    # Function defining setData to use the FIOports (address 6000)
-    def biopacSetData(self, byte, endian='big', address=6000): 
-        if endian=='big':
-            byteStr = '{0:08b}'.format(byte)[-1::-1]
-        else:
-            byteStr = '{0:08b}'.format(byte)
-        [self.writeRegister(address+pin, int(entry)) for (pin, entry) in enumerate(byteStr)]
-    biopac = U3()
-    biopac.setData = biopacSetData
+    # Make sure biopacControl.py is in the same directory
+    from biopacControl import PortStateMarkers, MarkerWriter
+    if biopac_simulated == 1:
+        # Records every line change with its time instead of driving the Biopac; see biopac.transitions()
+        from biopacSimulator import SimulatedU3, PortStateWrite
+        biopac = SimulatedU3(clock=globalClock)
+        biopac.setData = PortStateMarkers(endian='big', port_state_write=PortStateWrite)
+    else:
+        try:
+            from psychopy.hardware.labjacks import U3
+            # from labjack import u3
+        except ImportError:
+            from u3 import U3
+        biopac = U3()
+        # setData writes all 8 FIO lines in one USB transaction; call it as biopac.setData(biopac, code)
+        biopac.setData = PortStateMarkers(endian='big')
     # Set all FIO bits to digital output and set to low (i.e. “0")
     # The list in square brackets represent what’s desired for the FIO, EIO, CIO ports. We will only change the FIO port's state.
     biopac.configIO(FIOAnalog=0, EIOAnalog=0)
     for FIONUM in range(8):
         biopac.setFIOState(fioNum = FIONUM, state=0)
+    # All markers are written by this thread, off the frame loop: win.callOnFlip(biopacMarkers.onFlip, code), or biopacMarkers.write(code)
+    # With biopac_pulse_width set, each code is a pulse that resets itself; see MarkerWriter for how overlapping pulses are ordered
+    biopacMarkers = MarkerWriter(biopac, clock=globalClock, pulse_width=biopac_pulse_width).start()
     # Set all channels to 0 before the experiment begins.
-    biopac.setData(biopac, 0)
+    biopacMarkers.write(0)
 
 # Medoc TSA2 parameters ______________________________________________
 # Initialize the Medoc TSA2 thermal stimulation delivery device
@@ -128,6 +136,8 @@ if thermode_exists == 1:
     # Import medocControl library, python library custom written for Medoc with pyMedoc pollforchange functionality. 
     # Make sure medocControl.py is in the same directory 
     from medocControl import *
+    # Background asyncio loop for AsyncMedocClient commands, so routines can keep flipping frames while the MMS responds (see waitForThermode)
+    thermodeLoop = ThermodeEventLoop().start()
 
 if eyetracker_exists == 1:
     # Import Eyetracker library. 
@@ -301,14 +311,14 @@ if eyetracker_exists == 1:
         pylink.openGraphicsEx(genv)
 
         if biopac_exists:
-            biopac.setData(biopac, 0)
-            biopac.setData(biopac, biopacCode) # Start demarcation of the T1 task in Biopac Acqknowledge
+            biopacMarkers.write(0)
+            biopacMarkers.write(biopacCode) # Start demarcation of the T1 task in Biopac Acqknowledge
 
         el_tracker.doTrackerSetup()
         # You can do fancy stuff with this if you press Enter and click the mouse. Otherwise you will want to press C, V, and O to start the scan.
 
         if biopac_exists:
-            biopac.setData(biopac, 0)
+            biopacMarkers.write(0)
     
     def startEyetracker(el_tracker, source, destination, biopacCode=None):
         ## This should go in there:
@@ -320,8 +330,8 @@ if eyetracker_exists == 1:
         # event_over_link (1-yes, 0-no)
         try:
             if biopac_exists==1:
-                biopac.setData(biopac, 0)
-                biopac.setData(biopac, biopacCode)
+                biopacMarkers.write(0)
+                biopacMarkers.write(biopacCode)
             el_tracker.startRecording(1, 1, 1, 1)
 
         except RuntimeError as error:
@@ -332,7 +342,7 @@ if eyetracker_exists == 1:
         pylink.pumpDelay(100)
         el_tracker.sendMessage('Run Starts')
         if biopac_exists==1:
-            biopac.setData(biopac, 0)
+            biopacMarkers.write(0)
 
     def stopEyeTracker(el_tracker, source, destination, biopacCode=None):
         
@@ -342,8 +352,8 @@ if eyetracker_exists == 1:
         pylink.pumpDelay(100)
         el_tracker.stopRecording()
         if biopac_exists==1:
-            biopac.setData(biopac, 0)
-            biopac.setData(biopac, biopacCode)
+            biopacMarkers.write(0)
+            biopacMarkers.write(biopacCode)
 
         # Disconnect, download the EDF file, then terminate the task
         terminate_eyelink(pylink, el_tracker, source, destination)
@@ -186,10 +186,31 @@ PresentText = "The thoughts I experienced during the last scan pertained to the
 
 cueImg="path-to-cue-img.png"
 
+# Post-run rating scales as (name, type, anchor image, question, biopac code), in the order they are asked after every run.
+# Their anchor images decode in the background, and each scale and prompt is built now, so no rating starts late on its first run.
+ratingscale_dir = os.sep.join([stimuli_dir,"ratingscale"])
+postRunRatings = [("ComfortRating", "bipolar", "ComfortScale.png", ComfortText, comfort_rating),
+                  ("ValenceRating", "bipolar", "postvalenceScale.png", ValenceText, valence_rating),
+                  ("IntensityRating", "unipolar", "postintensityScale.png", IntensityText, comfort_rating),
+                  ("AvoidanceRating", "bipolar", "AvoidScale.png", AvoidText, avoid_rating),
+                  ("RelaxationRating", "bipolar", "RelaxScale.png", RelaxText, relax_rating),
+                  ("AttentionRating", "bipolar", "TaskAttentionScale.png", TaskAttentionText, taskattention_rating),
+                  ("BoredomRating", "bipolar", "BoredomScale.png", BoredomText, boredom_rating),
+                  ("AlertnessRating", "bipolar", "AlertnessScale.png", AlertnessText, alertness_rating),
+                  ("PosThxRating", "bipolar", "PosThxScale.png", PosThxText, posthx_rating),
+                  ("NegThxRating", "bipolar", "NegThxScale.png", NegThxText, negthx_rating),
+                  ("SelfRating", "bipolar", "SelfScale.png", SelfText, self_rating),
+                  ("OtherRating", "bipolar", "OtherScale.png", OtherText, other_rating),
+                  ("ImageryRating", "bipolar", "ImageryScale.png", ImageryText, posthx_rating),
+                  ("PresentRating", "bipolar", "PresentScale.png", PresentText, present_rating)]
+preloadImages(win, [os.sep.join([ratingscale_dir,ratingImg]) for ratingName, ratingType, ratingImg, ratingText, ratingCode in postRunRatings])
+for ratingName, ratingType, ratingImg, ratingText, ratingCode in postRunRatings:
+    ratingScale(win, ratingType, os.sep.join([ratingscale_dir,ratingImg])).prepare(ratingText)
+
 
 if biopac_exists:
-    biopac.setData(biopac, 0)
-    biopac.setData(biopac, task_ID) # Start demarcation of the T1 task in Biopac Acqknowledge
+    biopacMarkers.write(0)
+    biopacMarkers.write(task_ID) # Start demarcation of the T1 task in Biopac Acqknowledge
 
 """
 6. Welcome Instructions
@@ -204,6 +225,11 @@ if biopac_exists:
 #     # This allows you to control the eyetracker software!
 
 for runs in range(totalRuns):
+    if thermode_exists == 1:
+        # Every frame sent to and received from the MMS this run, for reconstructing what happened; see MedocJournalReader
+        config.journal = MedocJournal(sub_dir + os.sep + u'sub-SID%06d_ses-%02d_task-%s_run-%s_thermode.journal' % (int(expInfo['DBIC Number']), int(expInfo['session']), expName, str(runs+1)))
+        # Thermode temperature, CoVAS and test state sampled throughout the run, on its own connection so it doesn't delay trial commands
+        telemetry = MedocTelemetryRecorder(MedocClient(), clock=globalClock, rate=20).start()
     el_tracker = pylink.EyeLink("100.1.1.1")
     if eyetracker_exists==1:
         # filename can't be more than 8 characters long
@@ -237,20 +263,8 @@ for runs in range(totalRuns):
     """        
     rating_sound.stop() # A stop needs to be introduced in order to hear playback again.
     rating_sound.play() # Alert participants to make ratings.
-    bids_data=bids_data.append(showRatingScale(win, "ComfortRating", ComfortText, os.sep.join([stimuli_dir,"ratingscale","ComfortScale.png"]), type="bipolar", time=ratingTime, biopacCode=comfort_rating), ignore_index=True)
-    bids_data=bids_data.append(showRatingScale(win, "ValenceRating", ValenceText, os.sep.join([stimuli_dir,"ratingscale","postvalenceScale.png"]), type="bipolar", time=ratingTime, biopacCode=valence_rating), ignore_index=True)
-    bids_data=bids_data.append(showRatingScale(win, "IntensityRating", IntensityText, os.sep.join([stimuli_dir,"ratingscale","postintensityScale.png"]), type="unipolar", time=ratingTime, biopacCode=comfort_rating), ignore_index=True)
-    bids_data=bids_data.append(showRatingScale(win, "AvoidanceRating", AvoidText, os.sep.join([stimuli_dir,"ratingscale","AvoidScale.png"]), type="bipolar", time=ratingTime, biopacCode=avoid_rating), ignore_index=True)
-    bids_data=bids_data.append(showRatingScale(win, "RelaxationRating", RelaxText, os.sep.join([stimuli_dir,"ratingscale","RelaxScale.png"]), type="bipolar", time=ratingTime, biopacCode=relax_rating), ignore_index=True)
-    bids_data=bids_data.append(showRatingScale(win, "AttentionRating", TaskAttentionText, os.sep.join([stimuli_dir,"ratingscale","TaskAttentionScale.png"]), type="bipolar", time=ratingTime, biopacCode=taskattention_rating), ignore_index=True)
-    bids_data=bids_data.append(showRatingScale(win, "BoredomRating", BoredomText, os.sep.join([stimuli_dir,"ratingscale","BoredomScale.png"]), type="bipolar", time=ratingTime, biopacCode=boredom_rating), ignore_index=True)
-    bids_data=bids_data.append(showRatingScale(win, "AlertnessRating", AlertnessText, os.sep.join([stimuli_dir,"ratingscale","AlertnessScale.png"]), type="bipolar", time=ratingTime, biopacCode=alertness_rating), ignore_index=True)
-    bids_data=bids_data.append(showRatingScale(win, "PosThxRating", PosThxText, os.sep.join([stimuli_dir,"ratingscale","PosThxScale.png"]), type="bipolar", time=ratingTime, biopacCode=posthx_rating), ignore_index=True)
-    bids_data=bids_data.append(showRatingScale(win, "NegThxRating", NegThxText, os.sep.join([stimuli_dir,"ratingscale","NegThxScale.png"]), type="bipolar", time=ratingTime, biopacCode=negthx_rating), ignore_index=True)  
-    bids_data=bids_data.append(showRatingScale(win, "SelfRating", SelfText, os.sep.join([stimuli_dir,"ratingscale","SelfScale.png"]), type="bipolar", time=ratingTime, biopacCode=self_rating), ignore_index=True)
-    bids_data=bids_data.append(showRatingScale(win, "OtherRating", OtherText, os.sep.join([stimuli_dir,"ratingscale","OtherScale.png"]), type="bipolar", time=ratingTime, biopacCode=other_rating), ignore_index=True)
-    bids_data=bids_data.append(showRatingScale(win, "ImageryRating", ImageryText, os.sep.join([stimuli_dir,"ratingscale","ImageryScale.png"]), type="bipolar", time=ratingTime, biopacCode=posthx_rating), ignore_index=True)
-    bids_data=bids_data.append(showRatingScale(win, "PresentRating", PresentText, os.sep.join([stimuli_dir,"ratingscale","PresentScale.png"]), type="bipolar", time=ratingTime, biopacCode=present_rating), ignore_index=True)
+    for ratingName, ratingType, ratingImg, ratingText, ratingCode in postRunRatings:
+        bids_data=bids_data.append(showRatingScale(win, ratingName, ratingText, os.sep.join([ratingscale_dir,ratingImg]), type=ratingType, time=ratingTime, biopacCode=ratingCode), ignore_index=True)
     rating_sound.stop() # Stop the sound so it can be played again.
 
     if eyetracker_exists==1:
@@ -293,6 +307,25 @@ for runs in range(totalRuns):
     # Append any constants to the entire run
     bids_data_filename = sub_dir + os.sep + u'sub-SID%06d_ses-%02d_task-%s_run-%s_events.tsv' % (int(expInfo['DBIC Number']), int(expInfo['session']), expName, str(runs+1))
     bids_data.to_csv(bids_data_filename, sep="\t")
+    if biopac_exists == 1:
+        # When each Biopac marker was requested and actually written, for aligning the Acqknowledge recording
+        biopacMarkers.flush()
+        biopacMarkers.log.write(bids_data_filename.replace('_events.tsv', '_markers.tsv'), start_time=fmriStart, clear=True)
+    if record_frames == 1:
+        # Every flip this run, with intervals over 1.5 refresh periods flagged as dropped frames
+        frameLog.write(bids_data_filename.replace('_events.tsv', '_frames.tsv'), start_time=fmriStart)
+        frameLog.clear()
+    if thermode_exists == 1:
+        # Stop sampling first, so no late sample lands in a closed journal or in the next run's metrics
+        telemetry.stop()
+        # The run's thermode trace as a BIDS _physio.tsv.gz with its JSON sidecar
+        telemetry.flush(bids_data_filename.replace('_events.tsv', '_physio.tsv.gz'), start_time=fmriStart)
+        telemetry.client.close()
+        # Latency histograms and retry counters for every thermode command this run
+        metrics.dump(sub_dir + os.sep + u'sub-SID%06d_ses-%02d_task-%s_run-%s_thermode.json' % (int(expInfo['DBIC Number']), int(expInfo['session']), expName, str(runs+1)))
+        metrics.reset()
+        config.journal.close()
+        config.journal = None
     bids_data=pd.DataFrame(columns=varNames) # Clear it out for a new file.
 
     el_tracker.close()
@@ -37,6 +37,9 @@ except ImportError:
 
 import random
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
 
 from CANLab_PsychoPy_Config import *
 
@@ -158,8 +161,8 @@ def nextRun(win, advanceKey='e', text=in_between_run_msg, biopacCode=between_run
     message.draw()
     win.callOnFlip(print, text)
     if biopac_exists:
-        win.callOnFlip(biopac.setData, biopac,0)
-        win.callOnFlip(biopac.setData, biopac,biopacCode)
+        win.callOnFlip(biopacMarkers.onFlip, 0, "NextRun")
+        win.callOnFlip(biopacMarkers.onFlip, biopacCode, "NextRun")
     win.flip()
     # Autoresponder
     if autorespond != 1:
@@ -180,7 +183,11 @@ def endScan(win, advanceKey='e', text=end_msg, biopacCode=end_task):
     """
     showText(win, "EndScan", text, advanceKey=advanceKey, noRecord=True, biopacCode=biopacCode)
     if biopac_exists == 1:
+        biopacMarkers.stop()  # Write any markers still queued
+        print(biopacMarkers.summary())  # How long after their flips the markers landed
         biopac.close()  # Close the labjack U3 device to end communication with the Biopac MP150
+    if getattr(win, 'imageCache', None) is not None:
+        win.imageCache.close()  # Stop the image decoding threads and release the textures
   
     win.close()  # close the window
     core.quit()
@@ -205,189 +212,615 @@ def wait(name, time=None, advanceKey=None, noRecord=False):
     else:
         return
 
-def showText(win, name, text, strColor='white', fontSize=.05, strPos=(0, 0), time=None, advanceKey='space', biopacCode=None, noRecord=False):
-    """Show some text, press a key to advance or wait a certain amount of time. By default returns the onset and timings as a dictionary to be concatenated to your BIDS datafile, but this is optional. 
-        You're responsible for your own word-wrapping! Use \n or something.
+def waitForThermode(win, command, timeout=None):
+    """Wait for a thermode command while continuing to flip the window and check for ['esc'], so a slow MMS never freezes the display.
+        Whatever is set to autoDraw stays on screen while waiting. Requires thermode_exists == 1.
 
-        Warning: Either 'time' or 'advanceKey' should be initialized, or you will be stuck and you need to press ['esc'].
+    Args:
+        win (visual.Window): Pass in the Window to keep flipping.
+        command (coroutine or concurrent.futures.Future): An AsyncMedocClient coroutine, e.g. thermode.send('trigger'), which is run on thermodeLoop, or a Future returned by thermodeLoop.submit().
+        timeout (float, optional): Seconds to wait before giving up and raising TimeoutError. Defaults to None (wait indefinitely).
+
+    Returns:
+        The result of the command, e.g. a medocResponse.
+    """
+    if hasattr(command, 'done'):
+        future = command
+    else:
+        future = thermodeLoop.submit(command)
+    waitClock = core.Clock()
+    while not future.done():
+        # check for quit (typically the Esc key)
+        if endExpNow or defaultKeyboard.getKeys(keyList=["escape"]):
+            future.cancel()
+            core.quit()
+        if timeout is not None and waitClock.getTime() > timeout:
+            future.cancel()
+            raise TimeoutError("Thermode command did not finish within %s seconds" % timeout)
+        images = getattr(win, 'imageCache', None)
+        if images is not None and images.pending:
+            images.upload(deadline=win.getFutureFlipTime(clock=None) - win.monitorFramePeriod / 2.)
+        win.flip()
+    return future.result()
+
+class RoutineComponent():
+    """
+    A stimulus drawn by runRoutine from start until stop seconds after the routine's first flip.
+
+    e.g. : RoutineComponent(Text), or RoutineComponent(Cue, start=.5, stop=1.5) to show Cue for one second of a longer routine
+    """
+    __slots__ = ('stim', 'start', 'stop')
+
+    def __init__(self, stim, start=0., stop=None):
+        """
+        Args:
+            stim: Any PsychoPy stimulus with setAutoDraw, e.g. a visual.TextStim, visual.ImageStim or visual.MovieStim3.
+            start (float, optional): Seconds after the routine's first flip to start drawing. Defaults to 0.
+            stop (float, optional): Seconds after the routine's first flip to stop drawing. Defaults to None, drawn until the routine ends.
+        """
+        self.stim = stim
+        self.start = start
+        self.stop = stop
+
+
+class _RoutineStart():
+    __slots__ = ('tStartRefresh',)
+
+
+class FrameLog():
+    """
+    Every flip time of a run, for checking timing quality without a photodiode. Turn it on with record_frames = 1 in your config.py.
+    runRoutine gets a preallocated buffer per routine from begin(), stores one timestamp per flip, and hands it back to end(), which
+    flags intervals longer than dropThreshold refresh periods as dropped frames and returns the routine's summary for its trial dict.
+    write() saves a run's flips as a TSV next to its _events.tsv.
+    e.g. : frameLog.write(bids_data_filename.replace('_events.tsv', '_frames.tsv'), start_time=fmriStart)
+           frameLog.clear()
+    """
+    columns = ('routine', 'frame', 'flip', 'interval', 'dropped')
+
+    def __init__(self, framePeriod=None, dropThreshold=1.5, capacity=65536):
+        """
+        Args:
+            framePeriod (float, optional): Seconds per refresh. Defaults to None, the window's monitorFramePeriod.
+            dropThreshold (float, optional): Intervals longer than this many refresh periods count as dropped frames. Defaults to 1.5.
+            capacity (int, optional): Flips held for a run before the arrays grow. Defaults to 65536, about 9 minutes at 120 Hz.
+        """
+        self.framePeriod = framePeriod
+        self.dropThreshold = dropThreshold
+        self.flip = np.zeros(capacity, dtype=np.float64)
+        self.frame = np.zeros(capacity, dtype=np.int32)
+        self.routine = np.zeros(capacity, dtype=np.int32)
+        self.routines = []     # routine names, indexed by the routine column
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def begin(self, win, time=None):
+        """
+        Args:
+            win (visual.Window): The Window the routine flips.
+            time (float, optional): Routine length in seconds, if it's timed. Defaults to None.
+
+        Returns:
+            np.ndarray: A buffer for the routine's flip times, with room for 'time' seconds of flips and some to spare.
+        """
+        if self.framePeriod is None:
+            self.framePeriod = win.monitorFramePeriod
+        frames = 10. / self.framePeriod if time is None else time / self.framePeriod
+        return np.empty(int(frames * 1.25) + 16, dtype=np.float64)
+
+    def end(self, name, flips, count, onset=None):
+        """
+        Add a routine's flips to the run and summarize them.
+
+        Args:
+            name (str): The routine's condition name.
+            flips (np.ndarray): The buffer from begin(), holding flip times from win.flip().
+            count (int): Number of flips stored in it.
+            onset (float, optional): The onset recorded for the routine, on globalClock. Defaults to None.
+
+        Returns:
+            dict: frames, dropped_frames, max_frame_interval, and onset_error (first flip minus the recorded onset), in seconds.
+        """
+        # win.flip() reports PsychoPy's own clock; put the flips on globalClock, like onsets and markers
+        flips = flips[:count] + (globalClock.getTime() - logging.defaultClock.getTime())
+        while self.count + count > len(self.flip):
+            for column in ('flip', 'frame', 'routine'):
+                array = getattr(self, column)
+                grown = np.zeros(2 * len(array), dtype=array.dtype)
+                grown[:len(array)] = array
+                setattr(self, column, grown)
+        self.routines.append(str(name))
+        self.flip[self.count:self.count + count] = flips
+        self.frame[self.count:self.count + count] = np.arange(count)
+        self.routine[self.count:self.count + count] = len(self.routines) - 1
+        self.count += count
+
+        intervals = np.diff(flips)
+        return {'frames': count,
+                'dropped_frames': int(np.count_nonzero(intervals > self.dropThreshold * self.framePeriod)),
+                'max_frame_interval': float(intervals.max()) if len(intervals) else None,
+                'onset_error': float(flips[0] - onset) if count and onset is not None else None}
+
+    def clear(self):
+        self.count = 0
+        self.routines = []
+
+    def write(self, path, start_time=0.):
+        """
+        Save the run's flips as a tab-separated file with a header row. The first flip of each routine has no interval.
+
+        Args:
+            path (str): File to write, e.g. the run's _events.tsv with _frames.tsv in place of _events.tsv.
+            start_time (float, optional): globalClock time of the run's start, e.g. fmriStart; flips are written relative to it, like onsets. Defaults to 0.
+        """
+        limit = self.dropThreshold * self.framePeriod if self.framePeriod else float('inf')
+        with open(path, 'w') as f:
+            f.write('\t'.join(self.columns) + '\n')
+            for i in range(self.count):
+                if self.frame[i] == 0:
+                    f.write('%s\t0\t%.5f\tn/a\t0\n' % (self.routines[self.routine[i]], self.flip[i] - start_time))
+                else:
+                    interval = self.flip[i] - self.flip[i - 1]
+                    f.write('%s\t%d\t%.5f\t%.5f\t%d\n' % (self.routines[self.routine[i]], self.frame[i], self.flip[i] - start_time,
+                                                         interval, interval > limit))
+
+
+# Flip times for every routine when record_frames == 1, saved per run by your experiment script
+frameLog = FrameLog()
+
+
+class TextStimCache():
+    """
+    One window's TextStims, kept by (text, font, height, color, wrapWidth, pos), so showing the same text again costs a dictionary
+    lookup instead of a fresh layout and glyph upload. Holds at most capacity stimuli, evicting the least recently used.
+    Get a window's cache with textStimCache(win); showText, showTextAndImg and showFixation use it.
+    e.g. : Fixation = textStimCache(win).get('+', height=.1)
+    """
+    def __init__(self, win, capacity=64):
+        """
+        Args:
+            win (visual.Window): The Window the stimuli draw to.
+            capacity (int, optional): Most TextStims kept at once. Defaults to 64.
+        """
+        self.win = win
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._stims = OrderedDict()
+
+    def __len__(self):
+        return len(self._stims)
+
+    def get(self, text, font='Arial', height=.05, color='white', wrapWidth=1.6, pos=(0, 0)):
+        """
+        Returns:
+            visual.TextStim: The cached stimulus for these settings, created on first use.
+        """
+        key = (text, font, height, _hashable(color), wrapWidth, _hashable(pos))
+        stim = self._stims.get(key)
+        if stim is not None:
+            self.hits += 1
+            self._stims.move_to_end(key)
+            return stim
+        self.misses += 1
+        stim = visual.TextStim(self.win, name='Text',
+            text=text,
+            font = font,
+            pos=pos, height=height, wrapWidth=wrapWidth, ori=0,
+            color=color, colorSpace='rgb', opacity=1,
+            languageStyle='LTR',
+            depth=0.0,
+            anchorHoriz='center')
+        if len(self._stims) >= self.capacity:
+            self._stims.popitem(last=False)
+        self._stims[key] = stim
+        return stim
+
+    def clear(self):
+        self._stims.clear()
+
+
+def _hashable(value):
+    # colors and positions come in as lists or arrays as often as tuples
+    if isinstance(value, (list, np.ndarray)):
+        return tuple(np.asarray(value).ravel().tolist())
+    return value
+
+
+def textStimCache(win, capacity=64):
+    """Return the window's TextStimCache, creating it on first use.
 
     Args:
-        win (visual.Window): Pass in the Window to draw text to. 
-        name (str): String name of the textblock being shown. e.g., "Instructions".
-        text (str): Text string to display to the Window. 
-        strColor (list or str, optional): [r,g,b] color list or PsychoPy color keyword string. Defaults to 'white'.
-        fontSize (float, optional): Size of the text in PsychoPy height. Defaults to .05% of the screen.
-        strPos (tuple, optional): Tuple of (x, y) coordinates of where on the screen the text should appear. Defaults to the middle of the screen at (0, 0).
-        time (int, optional): Time to display the stimuli on screen. Defaults to None.
-        advanceKey (str, optional): Keypress required to end the display of text and advance. Defaults to 'space'.
+        win (visual.Window): The Window the stimuli draw to.
+        capacity (int, optional): Most TextStims kept, if the cache is created now. Defaults to 64.
+
+    Returns:
+        TextStimCache: The window's cache.
+    """
+    cache = getattr(win, 'textStimCache', None)
+    if cache is None:
+        cache = win.textStimCache = TextStimCache(win, capacity)
+    return cache
+
+
+class CachedImage():
+    """
+    A handle from preloadImages: the file is decoded on a worker thread, then turned into an ImageStim (the texture upload) on the
+    render thread. Pass it to showImg, showTextAndImg or showRatingScale in place of the image path.
+    """
+    __slots__ = ('path', 'future', 'stim', 'nbytes')
+
+    def __init__(self, path):
+        self.path = path
+        self.future = None
+        self.stim = None
+        self.nbytes = 0
+
+    def __repr__(self):
+        if self.stim is not None:
+            state = 'uploaded'
+        elif self.future is not None:
+            state = 'decoded' if self.future.done() else 'decoding'
+        else:
+            state = 'evicted'
+        return "CachedImage(%r, %s)" % (self.path, state)
+
+
+def _decodeImage(path):
+    # PIL releases the GIL while it decodes, so the pool decodes alongside the frame loop
+    image = Image.open(path)
+    image.load()
+    if image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+        image = image.convert('RGBA')
+    return image
+
+
+class ImageCache():
+    """
+    One window's images, decoded ahead of time and kept as ImageStims, so an image routine's first frame doesn't wait on the disk,
+    the decoder or the texture upload. preload() decodes files on a worker pool; decoded images are uploaded on the render thread
+    when runRoutine or waitForThermode have time to spare before a flip; stim() returns the ImageStim for a handle or path, uploading
+    right away if it hasn't been yet. Uploaded textures are evicted least recently used first once they total more than budget bytes.
+    Get a window's cache with imageCache(win), or preload through preloadImages(win, paths).
+    """
+    def __init__(self, win, budget=512 * 2**20, workers=4):
+        """
+        Args:
+            win (visual.Window): The Window the images draw to.
+            budget (int, optional): Bytes of uploaded textures to keep. Defaults to 512 MB.
+            workers (int, optional): Decoding threads. Defaults to 4.
+        """
+        self.win = win
+        self.budget = budget
+        self.workers = workers
+        self.nbytes = 0
+        self.pending = collections.deque()     # handles waiting to be uploaded, in the order they were preloaded
+        self._images = OrderedDict()           # path -> CachedImage, least recently used first
+        self._pool = None
+
+    def __len__(self):
+        return len(self._images)
+
+    def preload(self, paths):
+        """
+        Start decoding image files in the background.
+
+        Args:
+            paths (list): Image file paths.
+
+        Returns:
+            list: A CachedImage handle for each path.
+        """
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='ImageCache')
+        handles = []
+        for path in paths:
+            image = self._images.get(path)
+            if image is None:
+                image = self._images[path] = CachedImage(path)
+            else:
+                self._images.move_to_end(path)
+            if image.stim is None and image.future is None:
+                image.future = self._pool.submit(_decodeImage, path)
+                self.pending.append(image)
+            handles.append(image)
+        return handles
+
+    def upload(self, deadline=None):
+        """
+        Upload decoded images on the render thread, in preload order, stopping at one that is still decoding.
+
+        Args:
+            deadline (float, optional): Don't start another upload after this time on PsychoPy's clock, e.g. well before the next flip. Defaults to None.
+        """
+        while self.pending:
+            image = self.pending[0]
+            if image.stim is not None or image.future is None:  # uploaded on demand, or evicted meanwhile
+                self.pending.popleft()
+                continue
+            if not image.future.done() or (deadline is not None and logging.defaultClock.getTime() > deadline):
+                return
+            self.pending.popleft()
+            self._upload(image)
+
+    def _upload(self, image):
+        decoded = image.future.result() if image.future is not None else _decodeImage(image.path)
+        image.future = None
+        image.stim = visual.ImageStim(
+            win=self.win,
+            name=os.path.basename(image.path),
+            image=decoded,
+            mask=None,
+            ori=0,
+            color=[1,1,1], colorSpace='rgb', opacity=1,
+            flipHoriz=False, flipVert=False,
+            texRes=512, interpolate=True, depth=0.0)
+        image.nbytes = decoded.width * decoded.height * len(decoded.getbands())
+        self.nbytes += image.nbytes
+        self._evict(keep=image)
+
+    def _evict(self, keep):
+        for path, image in list(self._images.items()):
+            if self.nbytes <= self.budget:
+                return
+            if image is keep or image.stim is None:
+                continue
+            del self._images[path]
+            image.stim = None
+            self.nbytes -= image.nbytes
+
+    def stim(self, image, name=None, pos=(0, 0), size=None):
+        """
+        Args:
+            image (CachedImage or str): A handle from preload(), or an image path, which is loaded now if it wasn't preloaded.
+            name (str, optional): Name to give the stimulus. Defaults to None, the file name.
+            pos (tuple, optional): Position to draw it at. Defaults to (0, 0).
+            size (tuple, optional): Size to draw it at. Defaults to None, the image's own size.
+
+        Returns:
+            visual.ImageStim: The image's stimulus, ready to draw.
+        """
+        path = image.path if isinstance(image, CachedImage) else image
+        cached = self._images.get(path)
+        if cached is None:
+            # evicted, or never preloaded
+            cached = self._images[path] = image if isinstance(image, CachedImage) else CachedImage(path)
+        else:
+            self._images.move_to_end(path)
+        if cached.stim is None:
+            self._upload(cached)
+        stim = cached.stim
+        stim.name = name if name is not None else os.path.basename(path)
+        stim.pos = pos
+        stim.size = size
+        return stim
+
+    def clear(self):
+        self._images.clear()
+        self.pending.clear()
+        self.nbytes = 0
+
+    def close(self):
+        """Stop the decoding threads, dropping any decodes not yet started, and release every uploaded texture. The cache can be used again afterwards.
+        """
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        # handles may still be held by the task, so drop their stimuli and decodes too, not just the cache's references
+        for image in self._images.values():
+            image.stim = None
+            image.future = None
+            image.nbytes = 0
+        self.clear()
+
+
+def imageCache(win, budget=512 * 2**20):
+    """Return the window's ImageCache, creating it on first use.
+
+    Args:
+        win (visual.Window): The Window the images draw to.
+        budget (int, optional): Bytes of uploaded textures to keep, if the cache is created now. Defaults to 512 MB.
+
+    Returns:
+        ImageCache: The window's cache.
+    """
+    cache = getattr(win, 'imageCache', None)
+    if cache is None:
+        cache = win.imageCache = ImageCache(win, budget)
+    return cache
+
+
+def preloadImages(win, paths):
+    """Decode image files on worker threads ahead of the routines that show them; the textures are uploaded during spare time in later frames.
+        Pass the returned handles, or the same paths, to showImg, showTextAndImg or showRatingScale.
+
+    Args:
+        win (visual.Window): Pass in the Window the images will be drawn to.
+        paths (list): String paths to the image files.
+
+    Returns:
+        list: A CachedImage handle for each path.
+    """
+    return imageCache(win).preload(paths)
+
+
+def runRoutine(win, name, components, time=None, advanceKey=None, biopacCode=None, onStart=None, onFrame=None, noRecord=False):
+    """Run one routine: draw the components on their schedule, cue biopac on the first flip, and end after 'time', on a keypress, or when onFrame says so.
+       This is the frame loop behind showText, showImg, showTextAndImg, showMovie and showRatingScale. The start/stop schedule and which checks to run
+       are worked out before the first flip, so each frame costs one getFutureFlipTime call plus only the checks this routine uses.
+
+       Warning: Either 'time', 'advanceKey' or 'onFrame' should end the routine, or you will be stuck and you need to press ['esc'].
+
+    Args:
+        win (visual.Window): Pass in the Window to draw to.
+        name (str): String name of the condition being shown. e.g., "Instructions".
+        components (list): RoutineComponents, or plain stimuli to draw for the whole routine.
+        time (float, optional): Seconds from the first flip until the routine ends. Defaults to None.
+        advanceKey (str or list, optional): Keypress that ends the routine. Defaults to None.
         biopacCode (int, optional): Integer representing the 8-bit digital channel to toggle for biopac Acqknowledge Software. Defaults to None.
+        onStart (callable, optional): Called once before the first flip, e.g. to win.callOnFlip a clock reset. Defaults to None.
+        onFrame (callable, optional): Called every frame with t, the time on the routine clock; returning True ends the routine. Defaults to None.
         noRecord (bool, optional): Don't return the Dictionary of onset and duration. Defaults to False.
 
     Returns:
-        dict: The dictionary of onset, duration, and condition to be concatenated into your BIDS datafile.
+        dict: The dictionary of onset, duration, and condition to be concatenated into your BIDS datafile, with keys and rt if a key ended the routine,
+              and with record_frames == 1, the FrameLog summary of its flips.
     """
-    ## Intialize the Objects
-    TextClock = core.Clock()
-    TextKB = keyboard.Keyboard()
-    Text = visual.TextStim(win, name='Text', 
-        text=text,
-        font = 'Arial',
-        pos=strPos, height=fontSize, wrapWidth=1.6, ori=0, 
-        color=strColor, colorSpace='rgb', opacity=1, 
-        languageStyle='LTR',
-        depth=0.0, 
-        anchorHoriz='center')
-    
-    # ------Prepare to start Routine "Text"-------
-    routineTimer.reset()
+    ## Build the schedule: (seconds after the first flip, draw or not, stimulus), in order
+    stims = []
+    schedule = []
+    for component in components:
+        if not isinstance(component, RoutineComponent):
+            component = RoutineComponent(component)
+        stims.append(component.stim)
+        schedule.append((component.start - frameTolerance, True, component.stim))
+        if component.stop is not None and (time is None or component.stop < time):
+            schedule.append((component.stop - frameTolerance, False, component.stim))
+    schedule.sort(key=lambda event: event[0])
+    schedule.append((float('inf'), None, None))  # sentinel, so the loop never checks the length
+    nextEvent = 0
+    nextEventTime = schedule[0][0]
+    endTime = time - frameTolerance if time is not None else float('inf')
+
+    RoutineKB = keyboard.Keyboard() if advanceKey is not None else None
+    flips = frameLog.begin(win, time) if record_frames == 1 else None
+    images = getattr(win, 'imageCache', None)
+    uploadMargin = win.monitorFramePeriod / 2.
+    nFlips = 0
+    simulate = RoutineKB is not None and autorespond == 1
+    keys = None
+    rt = None
+    started = _RoutineStart()
 
+    # ------Prepare to start Routine-------
+    routineTimer.reset()
     if time is not None:
         routineTimer.add(time)
+    RoutineClock = core.Clock()
+    RoutineClock.reset(-win.getFutureFlipTime(clock="now"))  # t0 is time of first possible flip
 
-    continueRoutine = True
-    # update component parameters for each repeat
-    TextKB.keys = []
-    TextKB.rt = []
-    _TextKB_allKeys = []
-    # Update instructions and cues based on current run's body-sites:
-  
-    # keep track of which components have finished
-    TextComponents = [Text, TextKB]
-
-    for thisComponent in TextComponents:
-        thisComponent.tStart = None
-        thisComponent.tStop = None
-        thisComponent.tStartRefresh = None
-        thisComponent.tStopRefresh = None
-        if hasattr(thisComponent, 'status'):
-            thisComponent.status = NOT_STARTED
-    # reset timers
-    t = 0
-    _timeToFirstFrame = win.getFutureFlipTime(clock="now")
-    TextClock.reset(-_timeToFirstFrame)  # t0 is time of first possible flip
-    frameN = -1
-
-    # -------Run Routine "Text"-------
     # Record onset time
     if noRecord==False:
         global fmriStart
-        onset = globalClock.getTime() - fmriStart 
+        onset = globalClock.getTime() - fmriStart
 
-    while continueRoutine:
-        # get current time
-        t = TextClock.getTime()
-        tThisFlip = win.getFutureFlipTime(clock=TextClock)
-        tThisFlipGlobal = win.getFutureFlipTime(clock=None)
-        frameN = frameN + 1  # number of completed frames (so 0 is the first frame)
-        # update/draw components on each frame
-        
-        # *Text* updates
-        if Text.status == NOT_STARTED and tThisFlip >= 0.0-frameTolerance:
-            # keep track of start time/frame for later
-            Text.frameNStart = frameN  # exact frame index
-            Text.tStart = t  # local t and not account for scr refresh
-            Text.tStartRefresh = tThisFlipGlobal  # on global time
-            win.timeOnFlip(Text, 'tStartRefresh')  # time at next scr refresh
-            Text.setAutoDraw(True)
-        if Text.status == STARTED:
-            # is it time to stop? (based on global clock, using actual start)
-            if time is not None and tThisFlipGlobal > Text.tStartRefresh + time-frameTolerance:
-                # keep track of stop time/frame for later
-                Text.tStop = t  # not accounting for scr refresh
-                Text.frameNStop = frameN  # exact frame index
-                win.timeOnFlip(TextKB, 'tStopRefresh')  # time at next scr refresh
-                Text.setAutoDraw(False)
-        
-        # *TextKB* updates
-        waitOnFlip = False
-        if TextKB.status == NOT_STARTED and tThisFlip >= 0.0-frameTolerance:
-            # keep track of start time/frame for later
-            TextKB.frameNStart = frameN  # exact frame index
-            TextKB.tStart = t  # local t and not account for scr refresh
-            TextKB.tStartRefresh = tThisFlipGlobal  # on global time
-            win.timeOnFlip(TextKB, 'tStartRefresh')  # time at next scr refresh
-            TextKB.status = STARTED
-            # keyboard checking is just starting
-            waitOnFlip = True
-            win.callOnFlip(print, "Showing "+name)
-            if biopac_exists == 1 and biopacCode is not None:
-                win.callOnFlip(print, "Cueing Off All Biopac Channels")  
-                win.callOnFlip(biopac.setData, biopac, 0)
-                win.callOnFlip(print, "Cueing Biopac Channel: " + str(biopacCode))
-                win.callOnFlip(biopac.setData, biopac, biopacCode)
-            win.callOnFlip(TextKB.clock.reset)  # t=0 on next screen flip
-            win.callOnFlip(TextKB.clearEvents, eventType='keyboard')  # clear events on next screen flip
-        if TextKB.status == STARTED and not waitOnFlip:
-            if advanceKey is not None:
-                theseKeys = TextKB.getKeys(keyList=advanceKey, waitRelease=False)
-                _TextKB_allKeys.extend(theseKeys)
-                if len(_TextKB_allKeys):
-                    TextKB.keys = _TextKB_allKeys[-1].name  # just the last key pressed
-                    TextKB.rt = _TextKB_allKeys[-1].rt
-                    # a response ends the routine
-                    continueRoutine = False
-            # is it time to stop? (based on global clock, using actual start)
-            if time is not None and tThisFlipGlobal > TextKB.tStartRefresh + time-frameTolerance:
-                # keep track of stop time/frame for later
-                TextKB.tStop = t  # not accounting for scr refresh
-                TextKB.frameNStop = frameN  # exact frame index
-                win.timeOnFlip(TextKB, 'tStopRefresh')  # time at next scr refresh
-                continueRoutine = False
-        
+    # -------Run Routine-------
+    t = 0
+    tThisFlipGlobal = win.getFutureFlipTime(clock=None)
+    started.tStartRefresh = tThisFlipGlobal
+    win.timeOnFlip(started, 'tStartRefresh')  # actual time of the first flip, which the schedule is timed from
+    win.callOnFlip(print, "Showing "+name)
+    if biopac_exists == 1 and biopacCode is not None:
+        win.callOnFlip(print, "Cueing Off All Biopac Channels")
+        win.callOnFlip(biopacMarkers.onFlip, 0, name)
+        win.callOnFlip(print, "Cueing Biopac Channel: " + str(biopacCode))
+        win.callOnFlip(biopacMarkers.onFlip, biopacCode, name)
+    if RoutineKB is not None:
+        win.callOnFlip(RoutineKB.clock.reset)  # t=0 on next screen flip
+        win.callOnFlip(RoutineKB.clearEvents, eventType='keyboard')  # clear events on next screen flip
+    if onStart is not None:
+        onStart()
+    firstFrame = True
+
+    while True:
+        # time of the coming flip, from the routine's first flip
+        tNext = tThisFlipGlobal - started.tStartRefresh
+        while tNext >= nextEventTime:
+            schedule[nextEvent][2].setAutoDraw(schedule[nextEvent][1])
+            nextEvent += 1
+            nextEventTime = schedule[nextEvent][0]
+        if tNext > endTime:
+            break
+        # keyboard checking starts the frame after its clock reset
+        if RoutineKB is not None and not firstFrame:
+            theseKeys = RoutineKB.getKeys(keyList=advanceKey, waitRelease=False)
+            if theseKeys:
+                keys = theseKeys[-1].name  # just the last key pressed
+                rt = theseKeys[-1].rt
+                break
         # Autoresponder
-        if t >= thisSimKey.rt and autorespond == 1:
-            _TextKB_allKeys.extend([thisSimKey]) 
+        if simulate and t >= thisSimKey.rt:
+            keys = thisSimKey.name
+            rt = thisSimKey.rt
+            break
+        if onFrame is not None and onFrame(t):
+            break
 
         # check for quit (typically the Esc key)
         if endExpNow or defaultKeyboard.getKeys(keyList=["escape"]):
             core.quit()
-        
-        # check if all components have finished
-        if not continueRoutine:  # a component has requested a forced-end of Routine
-            break
-        continueRoutine = False  # will revert to True if at least one component still running
-        for thisComponent in TextComponents:
-            if hasattr(thisComponent, "status") and thisComponent.status != FINISHED:
-                continueRoutine = True
-                break  # at least one component has not yet finished
-        
-        # refresh the screen
-        if continueRoutine:  # don't flip if this routine is over or we'll get a blank screen
-            win.flip()
-
-    # -------Ending Routine "Text"-------
+        # upload preloaded images while at least half a frame is left before the flip
+        if images is not None and images.pending:
+            images.upload(deadline=tThisFlipGlobal - uploadMargin)
+
+        tFlip = win.flip()
+        if flips is not None:
+            if nFlips == len(flips):
+                flips = np.concatenate((flips, np.empty(len(flips))))
+            flips[nFlips] = tFlip
+            nFlips += 1
+        firstFrame = False
+        t = RoutineClock.getTime()
+        tThisFlipGlobal = win.getFutureFlipTime(clock=None)
+
+    # -------Ending Routine-------
     print("Offset " + name)
     if biopac_exists == 1 and biopacCode is not None:
         print("CueOff Channel: " + str(biopacCode))
-        biopac.setData(biopac, 0)
-    for thisComponent in TextComponents:
-        if hasattr(thisComponent, "setAutoDraw"):
-            thisComponent.setAutoDraw(False)
-    # the Routine "Text" was not non-slip safe, so reset the non-slip timer
+        biopacMarkers.write(0, routine=name)
+    for stim in stims:
+        stim.setAutoDraw(False)
+    # the Routine was not non-slip safe, so reset the non-slip timer
     routineTimer.reset()
-        
-    # check responses
-    if TextKB.keys in ['', [], None]:  # No response was made
-        TextKB.keys = None
-    
+    if flips is not None:
+        frameSummary = frameLog.end(name, flips, nFlips, onset + fmriStart if noRecord==False else None)
+
     if noRecord==False:
-        bids_trial={'onset': onset,'duration': t,'condition': name, 'biopac_channel': biopacCode}    
-        if TextKB.keys != None:  # we had a response
-            bids_trial['keys'] = TextKB.keys
-            bids_trial['rt']=TextKB.rt
+        bids_trial={'onset': onset,'duration': t,'condition': name, 'biopac_channel': biopacCode}
+        if keys is not None:  # we had a response
+            bids_trial['keys'] = keys
+            bids_trial['rt'] = rt
+        if flips is not None:
+            bids_trial.update(frameSummary)
         return bids_trial
     else:
         return
 
+def showText(win, name, text, strColor='white', fontSize=.05, strPos=(0, 0), time=None, advanceKey='space', biopacCode=None, noRecord=False):
+    """Show some text, press a key to advance or wait a certain amount of time. By default returns the onset and timings as a dictionary to be concatenated to your BIDS datafile, but this is optional.
+        You're responsible for your own word-wrapping! Use \n or something.
+
+        Warning: Either 'time' or 'advanceKey' should be initialized, or you will be stuck and you need to press ['esc'].
+
+    Args:
+        win (visual.Window): Pass in the Window to draw text to.
+        name (str): String name of the textblock being shown. e.g., "Instructions".
+        text (str): Text string to display to the Window.
+        strColor (list or str, optional): [r,g,b] color list or PsychoPy color keyword string. Defaults to 'white'.
+        fontSize (float, optional): Size of the text in PsychoPy height. Defaults to .05% of the screen.
+        strPos (tuple, optional): Tuple of (x, y) coordinates of where on the screen the text should appear. Defaults to the middle of the screen at (0, 0).
+        time (int, optional): Time to display the stimuli on screen. Defaults to None.
+        advanceKey (str, optional): Keypress required to end the display of text and advance. Defaults to 'space'.
+        biopacCode (int, optional): Integer representing the 8-bit digital channel to toggle for biopac Acqknowledge Software. Defaults to None.
+        noRecord (bool, optional): Don't return the Dictionary of onset and duration. Defaults to False.
+
+    Returns:
+        dict: The dictionary of onset, duration, and condition to be concatenated into your BIDS datafile.
+    """
+    Text = textStimCache(win).get(text, height=fontSize, color=strColor, pos=strPos)
+    return runRoutine(win, name, [Text], time=time, advanceKey=advanceKey, biopacCode=biopacCode, noRecord=noRecord)
+
 def showImg(win, name, imgPath, imgPos=[0,0], imgSize=(.5, .5), time=None, advanceKey=None, biopacCode=None, noRecord=False):
-    """Show an image, press a key to advance or wait a certain amount of time. By default returns the onset and timings as a dictionary to be concatenated to your BIDS datafile, but this is optional. 
-        
+    """Show an image, press a key to advance or wait a certain amount of time. By default returns the onset and timings as a dictionary to be concatenated to your BIDS datafile, but this is optional.
+
        Warning: Either 'time' or 'advanceKey' should be initialized, or you will be stuck and you need to press ['esc'].
 
     Args:
-        win (visual.Window): Pass in the Window to draw text to. 
+        win (visual.Window): Pass in the Window to draw text to.
         name (str): String name of the image being shown. e.g., "Instructional Image".
-        imgPath (str): String path to the image file.
+        imgPath (str or CachedImage): String path to the image file, or its handle from preloadImages.
         imgPos (list, optional): List of [x, y] coordinates of where on the screen the image should appear. Defaults to the middle of the screen, [0,0].
         imgSize (tuple, optional): Tuple (x, y) in Psychopy height for how large the image should be. Defaults to a (.05%, .05%) of the screen image.
         time (int, optional): Time to display the stimuli on screen. Defaults to None.
@@ -398,163 +831,8 @@ def showImg(win, name, imgPath, imgPos=[0,0], imgSize=(.5, .5), time=None, advan
     Returns:
         Dict: The Dictionary of onset, duration, and condition to be concatenated into your BIDS datafile.
     """
-    ## Intialize the Objects
-    ImageClock = core.Clock()
-    ImageKB = keyboard.Keyboard()
-    Img = visual.ImageStim(
-        win=win,
-        name=name,
-        image=imgPath,
-        mask=None,
-        ori=0, 
-        pos=imgPos, 
-        size=imgSize,
-        color=[1,1,1], colorSpace='rgb', opacity=1,
-        flipHoriz=False, flipVert=False,
-        texRes=512, interpolate=True, depth=0.0)
-
-    # ------Prepare to start Routine "Image"-------
-    routineTimer.reset()
-    
-    if time is not None:
-        routineTimer.add(time)
-
-    continueRoutine = True
-    # update component parameters for each repeat
-    ImageKB.keys = []
-    ImageKB.rt = []
-    _ImageKB_allKeys = []
-    # Update instructions and cues based on current run's body-sites:
-  
-    # keep track of which components have finished
-    if advanceKey is None:
-        ImageComponents = [Img]
-    else:
-        ImageComponents = [Img, ImageKB]
-
-    for thisComponent in ImageComponents:
-        thisComponent.tStart = None
-        thisComponent.tStop = None
-        thisComponent.tStartRefresh = None
-        thisComponent.tStopRefresh = None
-        if hasattr(thisComponent, 'status'):
-            thisComponent.status = NOT_STARTED
-    # reset timers
-    t = 0
-    _timeToFirstFrame = win.getFutureFlipTime(clock="now")
-    ImageClock.reset(-_timeToFirstFrame)  # t0 is time of first possible flip
-    frameN = -1
-
-    # -------Run Routine "ImageClock"-------
-    # Record onset time
-    if noRecord==False:
-        global fmriStart
-        onset = globalClock.getTime() - fmriStart
-
-    while continueRoutine:
-        # get current time
-        t = ImageClock.getTime()
-        tThisFlip = win.getFutureFlipTime(clock=ImageClock)
-        tThisFlipGlobal = win.getFutureFlipTime(clock=None)
-        frameN = frameN + 1  # number of completed frames (so 0 is the first frame)
-        # update/draw components on each frame
-
-        # *Img* updates
-        if Img.status == NOT_STARTED and tThisFlip >= 0.0-frameTolerance:
-            # keep track of start time/frame for later
-            Img.frameNStart = frameN  # exact frame index
-            Img.tStart = t  # local t and not account for scr refresh
-            Img.tStartRefresh = tThisFlipGlobal  # on global time
-            win.timeOnFlip(Img, 'tStartRefresh')  # time at next scr refresh
-            Img.setAutoDraw(True)
-            win.callOnFlip(print, "Showing "+name)
-            if biopac_exists == 1 and biopacCode is not None:
-                win.callOnFlip(print, "Cueing Off All Biopac Channels")   
-                win.callOnFlip(biopac.setData, biopac, 0)
-                win.callOnFlip(print, "Cueing Biopac Channel: " + str(biopacCode))
-                win.callOnFlip(biopac.setData, biopac, biopacCode)
-        if Img.status == STARTED:
-            # is it time to stop? (based on global clock, using actual start)
-            if time is not None and tThisFlipGlobal > Img.tStartRefresh + time-frameTolerance:
-                # keep track of stop time/frame for later
-                Img.tStop = t  # not accounting for scr refresh
-                Img.frameNStop = frameN  # exact frame index
-                win.timeOnFlip(Img, 'tStopRefresh')  # time at next scr refresh
-                Img.setAutoDraw(False)
-        
-        if advanceKey is not None:
-            # *ImageKB* updates
-            waitOnFlip = False
-            if ImageKB.status == NOT_STARTED and tThisFlip >= 0.0-frameTolerance:
-                # keep track of start time/frame for later
-                ImageKB.frameNStart = frameN  # exact frame index
-                ImageKB.tStart = t  # local t and not account for scr refresh
-                ImageKB.tStartRefresh = tThisFlipGlobal  # on global time
-                win.timeOnFlip(ImageKB, 'tStartRefresh')  # time at next scr refresh
-            if ImageKB.status == STARTED and not waitOnFlip:
-                # keyboard checking is just starting
-                waitOnFlip = True
-                win.callOnFlip(ImageKB.clock.reset)  # t=0 on next screen flip
-                win.callOnFlip(ImageKB.clearEvents, eventType='keyboard')  # clear events on next screen flip
-                # is it time to stop? (based on global clock, using actual start)
-                if time is not None and tThisFlipGlobal > ImageKB.tStartRefresh + time-frameTolerance:
-                    # keep track of stop time/frame for later
-                    ImageKB.tStop = t  # not accounting for scr refresh
-                    ImageKB.frameNStop = frameN  # exact frame index
-                    win.timeOnFlip(ImageKB, 'tStopRefresh')  # time at next scr refresh
-                    continueRoutine = False         
-                theseKeys = ImageKB.getKeys(keyList=advanceKey, waitRelease=False)
-                _ImageKB_allKeys.extend(theseKeys)
-                if len(_ImageKB_allKeys):
-                    ImageKB.keys = _ImageKB_allKeys[-1].name  # just the last key pressed
-                    ImageKB.rt = _ImageKB_allKeys[-1].rt
-                    # a response ends the routine
-                    continueRoutine = False
-        
-        # Autoresponder
-        if t >= thisSimKey.rt and autorespond == 1:
-            _ImageKB_allKeys.extend([thisSimKey]) 
-
-        # check for quit (typically the Esc key)
-        if endExpNow or defaultKeyboard.getKeys(keyList=["escape"]):
-            core.quit()
-        
-        # check if all components have finished
-        if not continueRoutine:  # a component has requested a forced-end of Routine
-            break
-        continueRoutine = False  # will revert to True if at least one component still running
-        for thisComponent in ImageComponents:
-            if hasattr(thisComponent, "status") and thisComponent.status != FINISHED:
-                continueRoutine = True
-                break  # at least one component has not yet finished
-        
-        # refresh the screen
-        if continueRoutine:  # don't flip if this routine is over or we'll get a blank screen
-            win.flip()
-
-    # -------Ending Routine "Image"-------
-    print("Offset " + name)
-    if biopac_exists == 1 and biopacCode is not None:
-        print("CueOff Channel: " + str(biopacCode))
-        biopac.setData(biopac, 0)
-    for thisComponent in ImageComponents:
-        if hasattr(thisComponent, "setAutoDraw"):
-            thisComponent.setAutoDraw(False)
-    # the Routine "Image" was not non-slip safe, so reset the non-slip timer
-    routineTimer.reset()           
-    
-    # check responses
-    if ImageKB.keys in ['', [], None]:  # No response was made
-        ImageKB.keys = None
- 
-    if noRecord==False:
-        bids_trial={'onset': onset,'duration': t,'condition': name, 'biopac_channel': biopacCode}    
-        if ImageKB.keys != None:  # we had a response
-            bids_trial['keys'] = ImageKB.keys
-            bids_trial['rt']=ImageKB.rt
-        return bids_trial
-    else:
-        return
+    Img = imageCache(win).stim(imgPath, name=name, pos=imgPos, size=imgSize)
+    return runRoutine(win, name, [Img], time=time, advanceKey=advanceKey, biopacCode=biopacCode, noRecord=noRecord)
 
 def preloadMovie(win, name, movPath):
     """It's recommended that you preload Movies prior to playing them because Initializes and returns the visual.MovieStim3 file. Prepares the movie to be played a single time, in the middle of the screen.
@@ -581,7 +859,7 @@ def showMovie(win, movie, name=None, biopacCode=None, noRecord=False):
     """Play the movie. It will only play for 10 seconds in debug mode. By default returns the onset and timings as a dictionary to be concatenated to your BIDS datafile, but this is optional.
 
     Args:
-        win (visual.Window): Pass in the Window to draw text to. 
+        win (visual.Window): Pass in the Window to draw text to.
         movie (visual.MovieStim3): Play a preloaded movie.
         name (str): String name of the movie being shown. e.g., "Inscapes".
         biopacCode (int, optional): Integer representing the 8-bit digital channel to toggle for biopac Acqknowledge Software. Defaults to None.
@@ -590,115 +868,17 @@ def showMovie(win, movie, name=None, biopacCode=None, noRecord=False):
     Returns:
         dict: The Dictionary of onset, duration, and condition to be concatenated into your BIDS datafile.
     """
-
-    if debug==1:
-        movie_duration=10
-
     if name==None:
         name = movie.name
 
-    MovieClock = core.Clock()
-    # ------Prepare to start Routine "Movie"-------
-    continueRoutine = True
-
     movie_duration = movie.duration
-
     if debug==1:
         movie_duration = 10     # debugging
-    routineTimer.reset()
-    routineTimer.add(movie_duration)
-
-    # keep track of which components have finished
-    MovieComponents = [movie]
-    for thisComponent in MovieComponents:
-        thisComponent.tStart = None
-        thisComponent.tStop = None
-        thisComponent.tStartRefresh = None
-        thisComponent.tStopRefresh = None
-        if hasattr(thisComponent, 'status'):
-            thisComponent.status = NOT_STARTED
-    # reset timers
-    t = 0
-    _timeToFirstFrame = win.getFutureFlipTime(clock="now")
-    MovieClock.reset(-_timeToFirstFrame)  # t0 is time of first possible flip
-    frameN = -1
-    
-    # -------Run Routine "Movie"-------
-    # Record onset time
-    if noRecord==False:
-        global fmriStart
-        onset = globalClock.getTime() - fmriStart
-    
-    while continueRoutine and routineTimer.getTime() > 0:
-        # get current time
-        t = MovieClock.getTime()
-        tThisFlip = win.getFutureFlipTime(clock=MovieClock)
-        tThisFlipGlobal = win.getFutureFlipTime(clock=None)
-        frameN = frameN + 1  # number of completed frames (so 0 is the first frame)
-        # update/draw components on each frame
-        
-        # *movie* updates
-        if movie.status == NOT_STARTED and tThisFlip >= 0.0-frameTolerance:
-            # keep track of start time/frame for later
-            movie.frameNStart = frameN  # exact frame index
-            movie.tStart = t  # local t and not account for scr refresh
-            movie.tStartRefresh = tThisFlipGlobal  # on global time
-            win.timeOnFlip(movie, 'tStartRefresh')  # time at next scr refresh
-            movie.setAutoDraw(True)
-            
-            win.callOnFlip(print, "Showing "+name)
-            if biopac_exists == 1 and biopacCode is not None:
-                win.callOnFlip(print, "Cueing Off All Biopac Channels")  
-                win.callOnFlip(biopac.setData, biopac, 0)
-                win.callOnFlip(print, "Cueing Biopac Channel: " + str(biopacCode))
-                win.callOnFlip(biopac.setData, biopac, biopacCode)
-        # if movie.status == STARTED:  # one frame should pass before updating params and completing
-            # updating other components during *movie*
-            # movie.setMovie(movieOrder[0]['runseq'][runLoop.thisTrialN+1]['moviefile'])
-            if tThisFlipGlobal > movie.tStartRefresh + movie_duration-frameTolerance:
-                # keep track of stop time/frame for later
-                movie.tStop = t  # not accounting for scr refresh
-                movie.frameNStop = frameN  # exact frame index
-                win.timeOnFlip(movie, 'tStopRefresh')  # time at next scr refresh
-                movie.setAutoDraw(False)
-        if movie.status == FINISHED:  # force-end the routine
-            continueRoutine = False
-        
-        # check for quit (typically the Esc key)
-        if endExpNow or defaultKeyboard.getKeys(keyList=["escape"]):
-            core.quit()
-        
-        # check if all components have finished
-        if not continueRoutine:  # a component has requested a forced-end of Routine
-            break
-        continueRoutine = False  # will revert to True if at least one component still running
-        for thisComponent in MovieComponents:
-            if hasattr(thisComponent, "status") and thisComponent.status != FINISHED:
-                continueRoutine = True
-                break  # at least one component has not yet finished
-        
-        # refresh the screen
-        if continueRoutine:  # don't flip if this routine is over or we'll get a blank screen
-            win.flip()
-
-    # -------Ending Routine "Movie"-------
-    movie.stop()
-    
-    print("Offset " + name)
-    if biopac_exists == 1 and biopacCode is not None:
-        print("CueOff Channel: " + str(biopacCode))
-        biopac.setData(biopac, 0)
-    for thisComponent in MovieComponents:
-        if hasattr(thisComponent, "setAutoDraw"):
-            thisComponent.setAutoDraw(False)
-    # the Routine "Movie" was not non-slip safe, so reset the non-slip timer
-    routineTimer.reset()
 
-    if noRecord==False:
-        bids_trial={'onset': onset,'duration': t,'condition': name, 'biopac_channel': biopacCode}    
-        return bids_trial
-    else:
-        return
+    # the movie can finish before its duration is up, which force-ends the routine
+    bids_trial = runRoutine(win, name, [movie], time=movie_duration, biopacCode=biopacCode, onFrame=lambda t: movie.status == FINISHED, noRecord=noRecord)
+    movie.stop()
+    return bids_trial
 
 
 def showFixation(win, name, type='big', size=None, pos=(0, 0), col='white', time=5, biopacCode=None, noRecord=False):
@@ -728,16 +908,17 @@ def showFixation(win, name, type='big', size=None, pos=(0, 0), col='white', time
     return showText(win, name, '+', strColor=col, fontSize=size, strPos=pos, time=time, advanceKey=None, biopacCode=biopacCode, noRecord=noRecord)
 
 
+
 def showTextAndImg(win, name, text, imgPath, strColor='white', fontSize=.05, strPos=(0, -.25), imgSize=(.40,.40), imgPos=(0, .2), time=None, advanceKey='space', biopacCode=None, noRecord=False):
-    """Show an image with text together, press a key to advance or wait a certain amount of time. By default returns the onset and timings as a dictionary to be concatenated to your BIDS datafile, but this is optional. 
-       You are responsible for your own word-wrapping! Use \n judiciously. 
+    """Show an image with text together, press a key to advance or wait a certain amount of time. By default returns the onset and timings as a dictionary to be concatenated to your BIDS datafile, but this is optional.
+       You are responsible for your own word-wrapping! Use \n judiciously.
        Warning: Either 'time' or 'advanceKey' should be initialized, or you will be stuck and you need to press ['esc'].
 
     Args:
-        win (visual.Window): Pass in the Window to draw text to. 
+        win (visual.Window): Pass in the Window to draw text to.
         name (str): String name of the condition being shown. e.g., "Image with Instructions".
         text (str): String text to be displayed onscreen.
-        imgPath (str): String path to the image file.
+        imgPath (str or CachedImage): String path to the image file, or its handle from preloadImages.
         strColor (str, optional): _description_. Defaults to 'white'.
         fontSize (float, optional): _description_. Defaults to .05.
         strPos (tuple, optional): Tuple of (x, y) coordinates of where on the screen the text should appear. Defaults to (0, .5).
@@ -751,188 +932,9 @@ def showTextAndImg(win, name, text, imgPath, strColor='white', fontSize=.05, str
     Returns:
         dict: The Dictionary of onset, duration, and condition to be concatenated into your BIDS datafile.
     """
-    ## Intialize the Objects
-    TextImageClock = core.Clock()
-    TextImageKB = keyboard.Keyboard()
-    Text = visual.TextStim(win, name='Text', 
-        text=text,
-        font = 'Arial',
-        pos=strPos, height=fontSize, wrapWidth=1.6, ori=0, 
-        color=strColor, colorSpace='rgb', opacity=1, 
-        languageStyle='LTR',
-        depth=0.0, 
-        anchorHoriz='center')
-    Img = visual.ImageStim(
-        win=win,
-        name='Image',
-        image=imgPath,
-        mask=None,
-        ori=0, 
-        pos=imgPos, 
-        size=imgSize,
-        color=[1,1,1], colorSpace='rgb', opacity=1,
-        flipHoriz=False, flipVert=False,
-        texRes=512, interpolate=True, depth=0.0)
-    
-    # ------Prepare to start Routine "TextImage"-------
-    routineTimer.reset()
-
-    if time is not None:
-        routineTimer.add(time)
-
-    continueRoutine = True
-    # update component parameters for each repeat
-    TextImageKB.keys = []
-    TextImageKB.rt = []
-    _TextImageKB_allKeys = []
-    # Update instructions and cues based on current run's body-sites:
-  
-    # keep track of which components have finished
-    TextImageComponents = [Text, Img, TextImageKB]
-
-    for thisComponent in TextImageComponents:
-        thisComponent.tStart = None
-        thisComponent.tStop = None
-        thisComponent.tStartRefresh = None
-        thisComponent.tStopRefresh = None
-        if hasattr(thisComponent, 'status'):
-            thisComponent.status = NOT_STARTED
-    # reset timers
-    t = 0
-    _timeToFirstFrame = win.getFutureFlipTime(clock="now")
-    TextImageClock.reset(-_timeToFirstFrame)  # t0 is time of first possible flip
-    frameN = -1
-
-    # -------Run Routine "TextImage"-------
-    # Record onset time
-    if noRecord==False:
-        global fmriStart
-        onset = globalClock.getTime() - fmriStart
-
-    while continueRoutine:
-        # get current time
-        t = TextImageClock.getTime()
-        tThisFlip = win.getFutureFlipTime(clock=TextImageClock)
-        tThisFlipGlobal = win.getFutureFlipTime(clock=None)
-        frameN = frameN + 1  # number of completed frames (so 0 is the first frame)
-        # update/draw components on each frame
-        
-        # *Text* updates
-        if Text.status == NOT_STARTED and tThisFlip >= 0.0-frameTolerance:
-            # keep track of start time/frame for later
-            Text.frameNStart = frameN  # exact frame index
-            Text.tStart = t  # local t and not account for scr refresh
-            Text.tStartRefresh = tThisFlipGlobal  # on global time
-            win.timeOnFlip(Text, 'tStartRefresh')  # time at next scr refresh
-            Text.setAutoDraw(True)
-        if Text.status == STARTED:
-            # is it time to stop? (based on global clock, using actual start)
-            if time is not None and tThisFlipGlobal > Text.tStartRefresh + time-frameTolerance:
-                # keep track of stop time/frame for later
-                Text.tStop = t  # not accounting for scr refresh
-                Text.frameNStop = frameN  # exact frame index
-                win.timeOnFlip(TextImageKB, 'tStopRefresh')  # time at next scr refresh
-                Text.setAutoDraw(False)
-
-        # *Img* updates
-        if Img.status == NOT_STARTED and tThisFlip >= 0.0-frameTolerance:
-            # keep track of start time/frame for later
-            Img.frameNStart = frameN  # exact frame index
-            Img.tStart = t  # local t and not account for scr refresh
-            Img.tStartRefresh = tThisFlipGlobal  # on global time
-            win.timeOnFlip(Img, 'tStartRefresh')  # time at next scr refresh
-            Img.setAutoDraw(True)
-        if Img.status == STARTED:
-            # is it time to stop? (based on global clock, using actual start)
-            if time is not None and tThisFlipGlobal > Img.tStartRefresh + time-frameTolerance:
-                # keep track of stop time/frame for later
-                Img.tStop = t  # not accounting for scr refresh
-                Img.frameNStop = frameN  # exact frame index
-                win.timeOnFlip(TextImageKB, 'tStopRefresh')  # time at next scr refresh
-                Img.setAutoDraw(False)
-        
-        # *TextImageKB* updates
-        waitOnFlip = False
-        if TextImageKB.status == NOT_STARTED and tThisFlip >= 0.0-frameTolerance:
-            # keep track of start time/frame for later
-            TextImageKB.frameNStart = frameN  # exact frame index
-            TextImageKB.tStart = t  # local t and not account for scr refresh
-            TextImageKB.tStartRefresh = tThisFlipGlobal  # on global time
-            win.timeOnFlip(TextImageKB, 'tStartRefresh')  # time at next scr refresh
-            TextImageKB.status = STARTED
-
-            # keyboard checking is just starting
-            waitOnFlip = True
-            win.callOnFlip(print, "Showing "+name)
-            if biopac_exists == 1 and biopacCode is not None:
-                win.callOnFlip(print, "Cueing Off All Biopac Channels") 
-                win.callOnFlip(biopac.setData, biopac, 0)
-                win.callOnFlip(print, "Cueing Biopac Channel: " + str(biopacCode))
-                win.callOnFlip(biopac.setData, biopac, biopacCode)
-            if biopac_exists == 1:
-                win.callOnFlip(biopac.setData, biopac, 0)
-                win.callOnFlip(biopac.setData, biopac, biopacCode)
-            win.callOnFlip(TextImageKB.clock.reset)  # t=0 on next screen flip
-            win.callOnFlip(TextImageKB.clearEvents, eventType='keyboard')  # clear events on next screen flip
-        if TextImageKB.status == STARTED and not waitOnFlip:
-            if advanceKey is not None:
-                theseKeys = TextImageKB.getKeys(keyList=advanceKey, waitRelease=False)
-                _TextImageKB_allKeys.extend(theseKeys)
-                if len(_TextImageKB_allKeys):
-                    TextImageKB.keys = _TextImageKB_allKeys[-1].name  # just the last key pressed
-                    TextImageKB.rt = _TextImageKB_allKeys[-1].rt
-                    # a response ends the routine
-                    continueRoutine = False
-            # is it time to stop? (based on global clock, using actual start)
-            if time is not None and tThisFlipGlobal > TextImageKB.tStartRefresh + time-frameTolerance:
-                # keep track of stop time/frame for later
-                TextImageKB.tStop = t  # not accounting for scr refresh
-                TextImageKB.frameNStop = frameN  # exact frame index
-                win.timeOnFlip(TextImageKB, 'tStopRefresh')  # time at next scr refresh
-                continueRoutine = False
-        
-        # Autoresponder
-        if t >= thisSimKey.rt and autorespond == 1:
-            _TextImageKB_allKeys.extend([thisSimKey]) 
-
-        # check for quit (typically the Esc key)
-        if endExpNow or defaultKeyboard.getKeys(keyList=["escape"]):
-            core.quit()
-        
-        # check if all components have finished
-        if not continueRoutine:  # a component has requested a forced-end of Routine
-            break
-        continueRoutine = False  # will revert to True if at least one component still running
-        for thisComponent in TextImageComponents:
-            if hasattr(thisComponent, "status") and thisComponent.status != FINISHED:
-                continueRoutine = True
-                break  # at least one component has not yet finished
-        
-        # refresh the screen
-        if continueRoutine:  # don't flip if this routine is over or we'll get a blank screen
-            win.flip()
-
-    # -------Ending Routine "TextImage"-------
-    print("Offset " + name)
-    if biopac_exists == 1 and biopacCode is not None:
-        print("CueOff Channel: " + str(biopacCode))
-        biopac.setData(biopac, 0)
-    for thisComponent in TextImageComponents:
-        if hasattr(thisComponent, "setAutoDraw"):
-            thisComponent.setAutoDraw(False)
-    
-    # check responses
-    if TextImageKB.keys in ['', [], None]:  # No response was made
-        TextImageKB.keys = None
-    
-    if noRecord==False:
-        bids_trial={'onset': onset,'duration': t,'condition': name, 'biopac_channel': biopacCode}    
-        if TextImageKB.keys != None:  # we had a response
-            bids_trial['keys'] = TextImageKB.keys
-            bids_trial['rt']=TextImageKB.rt
-        return bids_trial
-    else:
-        return
+    Text = textStimCache(win).get(text, height=fontSize, color=strColor, pos=strPos)
+    Img = imageCache(win).stim(imgPath, name='Image', pos=imgPos, size=imgSize)
+    return runRoutine(win, name, [Text, Img], time=time, advanceKey=advanceKey, biopacCode=biopacCode, noRecord=noRecord)
 
 # Initialize components for each Rating
 TIME_INTERVAL = 0.005   # Speed at which slider ratings udpate
@@ -947,314 +949,225 @@ unipolar_verts = [(sliderMin, .2), # left point
             (sliderMax, .2),     # right point
             (sliderMin, -.2)]   # bottom-point, # bottom-point
 
-def showRatingScale(win, name, questionText, imgPath, type="bipolar", time=5, biopacCode=None, noRecord=False, nofMRI=False):
-    """Show a binary, unipolar, or bipolar rating scale, mouseclick to submit response or wait a certain amount of time. By default returns the onset and timings as a dictionary to be concatenated to your BIDS datafile, but this is optional. 
-       You are responsible for your own word-wrapping! Use \n judiciously. 
-       Warning: Either 'time' or 'advanceKey' should be initialized, or you will be stuck and you need to press ['esc'].
+class RatingScale():
+    """
+    A binary, unipolar, or bipolar rating scale whose stimuli are built once and reused by every run(), so back-to-back ratings start
+    on the next frame instead of after building a mouse, slider, triangle, anchor image and prompt. Scales are kept per window for
+    each (type, anchor image); get one with ratingScale(win, type, imgPath), which is what showRatingScale does.
+    e.g. : comfort = ratingScale(win, "bipolar", os.sep.join([stimuli_dir,"ratingscale","ComfortScale.png"]))
+           bids_data=bids_data.append(comfort.run("ComfortRating", ComfortText, time=ratingTime, biopacCode=comfort_rating), ignore_index=True)
+    """
+    def __init__(self, win, type="bipolar", imgPath=None):
+        """
+        Args:
+            win (visual.Window): Pass in the Window to draw the scale to.
+            type (str, optional): Select type of of rating scale: 'binary', 'unipolar', or 'bipolar'. Defaults to "bipolar".
+            imgPath (str or CachedImage): String path to the anchor image file, or its handle from preloadImages.
+
+        Raises:
+            Exception: Type exception if string type specified is not 'binary', 'unipolar', or 'bipolar'.
+        """
+        if type not in ["binary", "unipolar", "bipolar"]:
+            raise Exception("Specified an invalid rating type. Please specify type = 'binary', 'unipolar', or 'bipolar' as a string")
+        self.win = win
+        self.type = type
+        self.imgPath = imgPath
+
+        # Initialize components for Routine "Rating"
+        self.mouse = event.Mouse(win=win, visible=False)
+        self.mouse.mouseClock = core.Clock()
+        self.rating = visual.Rect(win, height=ratingScaleHeight, width=abs(sliderMin), pos= [sliderMin/2, -.1], fillColor='red', lineColor='black')
+        self.triangle = None
+        if type != "binary":
+            self.triangle = visual.ShapeStim(
+                win,
+                fillColor='black', lineColor='black')
+            if type=="unipolar":
+                self.triangle.vertices=unipolar_verts
+            if type=="bipolar":
+                self.triangle.vertices=bipolar_verts
+        if type=='binary':
+            self.anchorPos, self.anchorSize = (0,0), (1, .25)
+        else:
+            self.anchorPos, self.anchorSize = (0, -0.09), (1.5, .4)
+
+        # slider state for the current run, updated by the frame callbacks
+        self.mouseX = 0
+        self.timeAtLastInterval = 0
+        self.value = None
+        self.rt = None
+        self.obtained = False
+        self.prevButtonState = None
+        self.time = None
+
+    def run(self, name, questionText, time=5, biopacCode=None, noRecord=False, nofMRI=False):
+        """Show the scale with a question, mouseclick to submit response or wait a certain amount of time. By default returns the onset and timings as a dictionary to be concatenated to your BIDS datafile, but this is optional.
+           You are responsible for your own word-wrapping! Use \n judiciously.
+
+        Args:
+            name (str): String name of the condition being shown. e.g., "Heat Intensity Rating".
+            questionText (str): String text to be displayed onscreen.
+            time (int, optional): Time to display the rating scale on screen in seconds. Defaults to 5 seconds.
+            biopacCode (int, optional): Integer representing the 8-bit digital channel to toggle for biopac Acqknowledge Software. Defaults to None.
+            noRecord (bool, optional): Don't return the Dictionary of onset and duration. Defaults to False.
+            nofMRI (bool, optional): Don't look for onset or duration times. Defaults to False.
+
+        Returns:
+            dict: The Dictionary of onset, duration, and condition to be concatenated into your BIDS datafile.
+        """
+        win = self.win
+        # the anchor image and prompt come from the window's caches, so they are shared, and placed again on every run
+        RatingAnchors = imageCache(win).stim(self.imgPath, name=name+'Anchors', pos=self.anchorPos, size=self.anchorSize)
+        RatingPrompt = self.prepare(questionText)
+        RatingComponents = [self.rating]
+        if self.triangle is not None:
+            RatingComponents.append(self.triangle)
+        RatingComponents += [RatingAnchors, RatingPrompt]
+
+        # ------Prepare to start Routine "Rating"-------
+        if self.type in ["binary", "bipolar"]:
+            self.rating.width = 0
+            self.rating.pos = (0,0)
+        if self.type=="unipolar":
+            self.rating.width = abs(sliderMin)
+            self.rating.pos = [sliderMin/2, -.1]
+        self.rating.fillColor='red'
+        self.mouse.setPos((0,0))
+        self.mouse.getRel()  # forget any movement since the last rating
+        self.mouseX = 0
+        self.timeAtLastInterval = 0
+        self.value = None
+        self.rt = None
+        self.obtained = False
+        self.time = time
+
+        bids_trial = runRoutine(win, name, RatingComponents, time=time, biopacCode=biopacCode, onStart=self._startMouse, onFrame=self._updateSlider, noRecord=noRecord or nofMRI)
+
+        if noRecord==False:
+            if nofMRI==True:
+                bids_trial={'onset': None,'duration': None,'condition': name, 'biopac_channel': biopacCode}
+            bids_trial['value'] = self.value
+            bids_trial['rt'] = self.rt
+            return bids_trial
 
-    Args:
-        win (visual.Window): Pass in the Window to draw text to. 
-        name (str): String name of the condition being shown. e.g., "Heat Intensity Rating".
-        questionText (str): String text to be displayed onscreen.
-        imgPath (str): String path to the image file.
-        type (str, optional): Select type of of rating scale: 'binary', 'unipolar', or 'bipolar'. Defaults to "bipolar".
-        time (int, optional): Time to display the rating scale on screen in seconds. Defaults to 5 seconds.
-        biopacCode (int, optional): Integer representing the 8-bit digital channel to toggle for biopac Acqknowledge Software. Defaults to None.
-        noRecord (bool, optional): Don't return the Dictionary of onset and duration. Defaults to False.
-        nofMRI (bool, optional): Don't look for onset or duration times. Defaults to False.
+        return
 
-    Raises:
-        Exception: Type exception if string type specified is not 'binary', 'unipolar', or 'bipolar'.
+    def prepare(self, questionText):
+        """Build the prompt for a question ahead of time, e.g. during setup, so its first run() doesn't lay out the text.
 
-    Returns:
-        dict: The Dictionary of onset, duration, and condition to be concatenated into your BIDS datafile.
-    """
-    if type not in ["binary", "unipolar", "bipolar"]:
-        raise Exception("Specified an invalid rating type. Please specify type = 'binary', 'unipolar', or 'bipolar' as a string")
-
-    # Initialize components for Routine "Rating"
-    RatingClock = core.Clock()
-    RatingMouse = event.Mouse(win=win)
-    RatingMouse.mouseClock = core.Clock()
-    Rating = visual.Rect(win, height=ratingScaleHeight, width=abs(sliderMin), pos= [sliderMin/2, -.1], fillColor='red', lineColor='black')
-    
-    rt = None
+        Args:
+            questionText (str): String text to be displayed onscreen.
 
-    if type is not "binary":
-        BlackTriangle = visual.ShapeStim(
-            win,
-            fillColor='black', lineColor='black')
-        if type=="unipolar":
-            BlackTriangle.vertices=unipolar_verts
-        if type=="bipolar":
-            BlackTriangle.vertices=bipolar_verts
-
-    RatingAnchors = visual.ImageStim(
-        win=win,
-        image= imgPath,
-        name=name+'Anchors', 
-        mask=None,
-        ori=0, pos=(0, -0.09), size=(1.5, .4),
-        color=[1,1,1], colorSpace='rgb', opacity=1,
-        flipHoriz=False, flipVert=False,
-        texRes=512, interpolate=True, depth=0.0)
-    if type=='binary':
-        RatingAnchors.pos=(0,0)
-        RatingAnchors.size=(1, .25)
-
-    RatingPrompt = visual.TextStim(win, name=name, 
-        text=questionText,
-        font = 'Arial',
-        pos=(0, 0.3), height=0.05, wrapWidth=None, ori=0, 
-        color='white', colorSpace='rgb', opacity=1, 
-        languageStyle='LTR',
-        depth=0.0,
-        anchorHoriz='center')
-
-    # ------Prepare to start Routine "Rating"-------
-    continueRoutine = True
-    if time is not None:
-        routineTimer.add(time)
-    # update component parameters for each repeat
-    # keep track of which components have finished
-    RatingMouse = event.Mouse(win=win, visible=False) # Re-initialize RatingMouse
-    RatingMouse.setPos((0,0))
-    timeAtLastInterval = 0
-    mouseX = 0
-    oldMouseX = 0
-
-    if type in ["binary", "bipolar"]:
-        Rating.width = 0
-        Rating.pos = (0,0)
-    if type=="unipolar":
-        Rating.width = abs(sliderMin)
-        Rating.pos = [sliderMin/2, -.1]
-    Rating.fillColor='red'
-    obtainedRating=0
-
-    if type is not 'binary':
-        RatingComponents = [RatingMouse, BlackTriangle, Rating, RatingAnchors, RatingPrompt]
-    else:
-        RatingComponents = [RatingMouse, Rating, RatingAnchors, RatingPrompt]
-    
-    for thisComponent in RatingComponents:
-        thisComponent.tStart = None
-        thisComponent.tStop = None
-        thisComponent.tStartRefresh = None
-        thisComponent.tStopRefresh = None
-        if hasattr(thisComponent, 'status'):
-            thisComponent.status = NOT_STARTED
-    # reset timers
-    t = 0
-    _timeToFirstFrame = win.getFutureFlipTime(clock="now")
-    RatingClock.reset(-_timeToFirstFrame)  # t0 is time of first possible flip
-    frameN = -1
+        Returns:
+            visual.TextStim: The prompt, from the window's TextStimCache.
+        """
+        return textStimCache(self.win).get(questionText, height=0.05, wrapWidth=None, pos=(0, 0.3))
 
-    # -------Run Routine "Rating"-------
-    # Record onset time
-    if noRecord==False | nofMRI==False:
-        global fmriStart
-        onset = globalClock.getTime() - fmriStart
+    def _startMouse(self):
+        self.mouse.mouseClock.reset()
+        self.win.callOnFlip(self.mouse.mouseClock.reset) # t=0 on next screen flip
+        self.win.callOnFlip(self.mouse.clickReset) # t=0 on next screen flip
+        self.prevButtonState = self.mouse.getPressed()  # if button is down already this ISN'T a new click
 
-    while continueRoutine:
-        if obtainedRating==0:
+    def _updateSlider(self, t):
+        type = self.type
+        Rating = self.rating
+        if not self.obtained:
+            mouseX = self.mouseX
             timeNow = globalClock.getTime()
-            if (timeNow - timeAtLastInterval) > TIME_INTERVAL:
-                mouseRel=RatingMouse.getRel()
-                mouseX=oldMouseX + mouseRel[0]
-
+            if (timeNow - self.timeAtLastInterval) > TIME_INTERVAL:
+                mouseX = mouseX + self.mouse.getRel()[0]
             if type == "binary":
                 if mouseX==0:
-                    sliderValue=0
+                    self.value = 0
                     Rating.width = 0
                 else:
                     if mouseX>0:
                         Rating.pos = (.28,0)
-                        sliderValue=1
+                        self.value = 1
                     elif mouseX<0:
                         Rating.pos = (-.4,0)
-                        sliderValue=-1
+                        self.value = -1
                     Rating.width = .5
-            if type == "unipolar":
-                Rating.pos = ((sliderMin + mouseX)/2,0)
-                Rating.width = abs((mouseX-sliderMin))
-            if type == "bipolar":
-                Rating.pos = (mouseX/2,0)
-                Rating.width = abs(mouseX)
-            if type in ["unipolar", "bipolar"]:
-                if mouseX > sliderMax:
-                    mouseX = sliderMax
-                if mouseX < sliderMin:
-                    mouseX = sliderMin
-
-            timeAtLastInterval = timeNow
-            oldMouseX=mouseX
-
-            if type=="unipolar":
-                sliderValue = (mouseX - sliderMin) / (sliderMax - sliderMin) * 100
-            if type=="bipolar":
-                sliderValue = ((mouseX - sliderMin) / (sliderMax - sliderMin) * 200)-100
-
-        # get current time
-        t = RatingClock.getTime()
-        tThisFlip = win.getFutureFlipTime(clock=RatingClock)
-        tThisFlipGlobal = win.getFutureFlipTime(clock=None)
-        frameN = frameN + 1  # number of completed frames (so 0 is the first frame)
-        # update/draw components on each frame
-        
-        # *RatingMouse* updates
-        if RatingMouse.status == NOT_STARTED and t >= 0.0-frameTolerance:
-            # keep track of start time/frame for later
-            RatingMouse.frameNStart = frameN  # exact frame index
-            RatingMouse.tStart = t  # local t and not account for scr refresh
-            RatingMouse.tStartRefresh = tThisFlipGlobal  # on global time
-            win.timeOnFlip(RatingMouse, 'tStartRefresh')  # time at next scr refresh
-            RatingMouse.status = STARTED
-            RatingMouse.mouseClock.reset()
-            win.callOnFlip(RatingMouse.mouseClock.reset) # t=0 on next screen flip
-            win.callOnFlip(RatingMouse.clickReset) # t=0 on next screen flip
-            prevButtonState = RatingMouse.getPressed()  # if button is down already this ISN'T a new click
-        if RatingMouse.status == STARTED:  # only update if started and not finished!
-            if time is not None and tThisFlipGlobal > RatingMouse.tStartRefresh + time-frameTolerance:
-                # keep track of stop time/frame for later
-                RatingMouse.tStop = t  # not accounting for scr refresh
-                RatingMouse.frameNStop = frameN  # exact frame index
-                RatingMouse.status = FINISHED
-            buttons, rtNow = RatingMouse.getPressed(getTime=True)
-            rtNow=rtNow[0]
-            if buttons != prevButtonState:  # button state changed?
-                prevButtonState = buttons
-                if sum(buttons) > 0:  # state changed to a new click
-                    obtainedRating = 1
-                    rt=rtNow
-                    if time is not None:
-                        Rating.fillColor='white'
-                    else:
-                        # abort routine on response
-                        continueRoutine = False
-        
-        # *Rating* updates
-        if Rating.status == NOT_STARTED and t >= 0.0-frameTolerance:
-            # keep track of start time/frame for later
-            Rating.frameNStart = frameN  # exact frame index
-            Rating.tStart = t  # local t and not account for scr refresh
-            Rating.tStartRefresh = tThisFlipGlobal  # on global time
-            win.callOnFlip(print, "Cueing Off All Biopac Channels")            
-            win.callOnFlip(print, "Showing "+name)
-            if biopac_exists == 1 and biopacCode is not None:
-                win.callOnFlip(biopac.setData, biopac, 0)
-                win.callOnFlip(print, "Cueing Biopac Channel: " + str(biopacCode))
-                win.callOnFlip(biopac.setData, biopac, biopacCode)
-            win.timeOnFlip(Rating, 'tStartRefresh')  # time at next scr refresh
-            Rating.setAutoDraw(True)
-        if Rating.status == STARTED:
-            # is it time to stop? (based on global clock, using actual start)
-            if time is not None and tThisFlipGlobal > Rating.tStartRefresh + time-frameTolerance:
-                # keep track of stop time/frame for later
-                Rating.tStop = t  # not accounting for scr refresh
-                Rating.frameNStop = frameN  # exact frame index
-                win.timeOnFlip(Rating, 'tStopRefresh')  # time at next scr refresh
-                Rating.setAutoDraw(False)
-        
-        if type is not 'binary':
-            # *BlackTriangle* updates
-            if BlackTriangle.status == NOT_STARTED and t >= 0.0-frameTolerance:
-                # keep track of start time/frame for later
-                BlackTriangle.frameNStart = frameN  # exact frame index
-                BlackTriangle.tStart = t  # local t and not account for scr refresh
-                BlackTriangle.tStartRefresh = tThisFlipGlobal  # on global time
-                win.timeOnFlip(BlackTriangle, 'tStartRefresh')  # time at next scr refresh
-                BlackTriangle.setAutoDraw(True)
-            if BlackTriangle.status == STARTED:
-                # is it time to stop? (based on global clock, using actual start)
-                if time is not None and tThisFlipGlobal > BlackTriangle.tStartRefresh + time-frameTolerance:
-                    # keep track of stop time/frame for later
-                    BlackTriangle.tStop = t  # not accounting for scr refresh
-                    BlackTriangle.frameNStop = frameN  # exact frame index
-                    win.timeOnFlip(BlackTriangle, 'tStopRefresh')  # time at next scr refresh
-                    BlackTriangle.setAutoDraw(False)
-        
-        # *RatingAnchors* updates
-        if RatingAnchors.status == NOT_STARTED and t >= 0.0-frameTolerance:
-            # keep track of start time/frame for later
-            RatingAnchors.frameNStart = frameN  # exact frame index
-            RatingAnchors.tStart = t  # local t and not account for scr refresh
-            RatingAnchors.tStartRefresh = tThisFlipGlobal  # on global time
-            win.timeOnFlip(RatingAnchors, 'tStartRefresh')  # time at next scr refresh
-            RatingAnchors.setAutoDraw(True)
-        if RatingAnchors.status == STARTED:
-            # is it time to stop? (based on global clock, using actual start)
-            if time is not None and tThisFlipGlobal > RatingAnchors.tStartRefresh + time-frameTolerance:
-                # keep track of stop time/frame for later
-                RatingAnchors.tStop = t  # not accounting for scr refresh
-                RatingAnchors.frameNStop = frameN  # exact frame index
-                win.timeOnFlip(RatingAnchors, 'tStopRefresh')  # time at next scr refresh
-                RatingAnchors.setAutoDraw(False)
-        
-        # *RatingPrompt* updates
-        if RatingPrompt.status == NOT_STARTED and t >= 0.0-frameTolerance:
-            # keep track of start time/frame for later
-            RatingPrompt.frameNStart = frameN  # exact frame index
-            RatingPrompt.tStart = t  # local t and not account for scr refresh
-            RatingPrompt.tStartRefresh = tThisFlipGlobal  # on global time
-            win.timeOnFlip(RatingPrompt, 'tStartRefresh')  # time at next scr refresh
-            RatingPrompt.setAutoDraw(True)
-        if RatingPrompt.status == STARTED:
-            # is it time to stop? (based on global clock, using actual start)
-            if time is not None and tThisFlipGlobal > RatingPrompt.tStartRefresh + time-frameTolerance:
-                # keep track of stop time/frame for later
-                RatingPrompt.tStop = t  # not accounting for scr refresh
-                RatingPrompt.frameNStop = frameN  # exact frame index
-                win.timeOnFlip(RatingPrompt, 'tStopRefresh')  # time at next scr refresh
-                RatingPrompt.setAutoDraw(False)
+            else:
+                if type == "unipolar":
+                    Rating.pos = ((sliderMin + mouseX)/2,0)
+                    Rating.width = abs((mouseX-sliderMin))
+                if type == "bipolar":
+                    Rating.pos = (mouseX/2,0)
+                    Rating.width = abs(mouseX)
+                mouseX = min(max(mouseX, sliderMin), sliderMax)
+                if type=="unipolar":
+                    self.value = (mouseX - sliderMin) / (sliderMax - sliderMin) * 100
+                if type=="bipolar":
+                    self.value = ((mouseX - sliderMin) / (sliderMax - sliderMin) * 200)-100
+            self.timeAtLastInterval = timeNow
+            self.mouseX = mouseX
+
+        buttons, rtNow = self.mouse.getPressed(getTime=True)
+        if buttons != self.prevButtonState:  # button state changed?
+            self.prevButtonState = buttons
+            if sum(buttons) > 0:  # state changed to a new click
+                self.obtained = True
+                self.rt = rtNow[0]
+                if self.time is not None:
+                    Rating.fillColor='white'
+                else:
+                    # abort routine on response
+                    return True
 
         # Autoresponder
         if t >= thisSimKey.rt and autorespond == 1:
             if type=='binary':
-                sliderValue = random.randint(-1,1)
+                self.value = random.randint(-1,1)
             if type=='unipolar':
-                sliderValue = random.randint(0,100)
+                self.value = random.randint(0,100)
             if type=='bipolar':
-                sliderValue = random.randint(-100,100)
-            continueRoutine = False
+                self.value = random.randint(-100,100)
+            return True
+        return False
 
-        # check for quit (typically the Esc key)
-        if endExpNow or defaultKeyboard.getKeys(keyList=["escape"]):
-            core.quit()
-        
-        # check if all components have finished
-        if not continueRoutine:  # a component has requested a forced-end of Routine
-            break
-        continueRoutine = False  # will revert to True if at least one component still running
-        for thisComponent in RatingComponents:
-            if hasattr(thisComponent, "status") and thisComponent.status != FINISHED:
-                continueRoutine = True
-                break  # at least one component has not yet finished
 
-        # refresh the screen
-        if continueRoutine:
-            win.flip()
+def ratingScale(win, type="bipolar", imgPath=None):
+    """Return the window's RatingScale for this type and anchor image, building it on first use.
 
-    # -------Ending Routine "Rating"-------
-    print("Offset " + name)
-    if biopac_exists == 1 and biopacCode is not None:
-        print("CueOff Channel: " + str(biopacCode))
-        biopac.setData(biopac, 0)
+    Args:
+        win (visual.Window): Pass in the Window to draw the scale to.
+        type (str, optional): Select type of of rating scale: 'binary', 'unipolar', or 'bipolar'. Defaults to "bipolar".
+        imgPath (str or CachedImage): String path to the anchor image file, or its handle from preloadImages.
 
-    for thisComponent in RatingComponents:
-        if hasattr(thisComponent, "setAutoDraw"):
-            thisComponent.setAutoDraw(False)
+    Returns:
+        RatingScale: The scale, ready to run().
+    """
+    scales = getattr(win, 'ratingScales', None)
+    if scales is None:
+        scales = win.ratingScales = {}
+    key = (type, imgPath.path if isinstance(imgPath, CachedImage) else imgPath)
+    scale = scales.get(key)
+    if scale is None:
+        scale = scales[key] = RatingScale(win, type, imgPath)
+    return scale
 
-    # the Routine "Rating" was not non-slip safe, so reset the non-slip timer
-    routineTimer.reset()
+def showRatingScale(win, name, questionText, imgPath, type="bipolar", time=5, biopacCode=None, noRecord=False, nofMRI=False):
+    """Show a binary, unipolar, or bipolar rating scale, mouseclick to submit response or wait a certain amount of time. By default returns the onset and timings as a dictionary to be concatenated to your BIDS datafile, but this is optional.
+       You are responsible for your own word-wrapping! Use \n judiciously.
+       The scale's stimuli are built on its first call and reused after that; see RatingScale.
 
+    Args:
+        win (visual.Window): Pass in the Window to draw text to.
+        name (str): String name of the condition being shown. e.g., "Heat Intensity Rating".
+        questionText (str): String text to be displayed onscreen.
+        imgPath (str or CachedImage): String path to the image file, or its handle from preloadImages.
+        type (str, optional): Select type of of rating scale: 'binary', 'unipolar', or 'bipolar'. Defaults to "bipolar".
+        time (int, optional): Time to display the rating scale on screen in seconds. Defaults to 5 seconds.
+        biopacCode (int, optional): Integer representing the 8-bit digital channel to toggle for biopac Acqknowledge Software. Defaults to None.
+        noRecord (bool, optional): Don't return the Dictionary of onset and duration. Defaults to False.
+        nofMRI (bool, optional): Don't look for onset or duration times. Defaults to False.
 
-    if noRecord==False:  
-        if nofMRI==False:
-            bids_trial={'onset': onset,'duration': t,'condition': name, 'value': sliderValue, 'rt': rt, 'biopac_channel': biopacCode} 
-            return bids_trial
-        if nofMRI==True:
-            bids_trial={'onset': None,'duration': None,'condition': name, 'value': sliderValue, 'rt': rt, 'biopac_channel': biopacCode} 
-            return bids_trial
+    Raises:
+        Exception: Type exception if string type specified is not 'binary', 'unipolar', or 'bipolar'.
 
-    return
\ No newline at end of file
+    Returns:
+        dict: The Dictionary of onset, duration, and condition to be concatenated into your BIDS datafile.
+    """
+    return ratingScale(win, type, imgPath).run(name, questionText, time=time, biopacCode=biopacCode, noRecord=noRecord, nofMRI=nofMRI)
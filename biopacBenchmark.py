@@ -0,0 +1,118 @@
+# biopacBenchmark.py
+# Cost and timing of Biopac markers, run against biopacSimulator's SimulatedU3 so no LabJack is needed.
+# e.g. : python biopacBenchmark.py --suite markers --markers 500 --usb-latency .0005
+# or python biopacBenchmark.py --suite routines      (needs PsychoPy and a display, e.g. xvfb-run; set eyetracker_exists = 0 without pylink)
+from time import perf_counter, sleep
+import argparse
+import os
+
+from biopacControl import PortStateMarkers, MarkerWriter, port_states
+from biopacSimulator import SimulatedU3, PortStateWrite
+
+
+def percentile(samples, q):
+    """Nearest-rank percentile of a list of samples, q in [0, 100]."""
+    ordered = sorted(samples)
+    if not ordered:
+        return float('nan')
+    rank = min(len(ordered) - 1, max(0, int(round(q / 100. * len(ordered) + .5)) - 1))
+    return ordered[rank]
+
+
+# setData as it was before PortStateMarkers, kept as the baseline
+def _legacySetData(self, byte, endian='big', address=6000):
+    if endian=='big':
+        byteStr = '{0:08b}'.format(byte)[-1::-1]
+    else:
+        byteStr = '{0:08b}'.format(byte)
+    [self.writeRegister(address+pin, int(entry)) for (pin, entry) in enumerate(byteStr)]
+
+
+def markers(name, setData, device, codes):
+    """Send each code as our routines do, 0 then the code, and report transactions and time per code."""
+    device.transactions = 0
+    latencies = []
+    for code in codes:
+        start = perf_counter()
+        setData(device, 0)
+        setData(device, code)
+        latencies.append(perf_counter() - start)
+        assert device.fio == port_states['big'][code]
+    print("%-40s %5.1f USB transactions/marker   p50 %7.3f ms   p99 %7.3f ms" % (
+        name, device.transactions / float(len(codes)), 1000 * percentile(latencies, 50), 1000 * percentile(latencies, 99)))
+
+
+def throughput(name, writer, device, codes):
+    """Queue every code at once and time until the last one is on the lines; also the cost to the caller of queueing."""
+    device.writes = []
+    start = perf_counter()
+    for code in codes:
+        writer.write(code)
+    queued = perf_counter() - start
+    writer.stop()
+    elapsed = perf_counter() - start
+    print("%-40s %8.1f markers/s   queueing %6.2f us/marker" % (name, len(device.writes) / elapsed, 1e6 * queued / len(codes)))
+
+
+def routines(args):
+    """Run each Utilities routine on a simulated U3 and report its markers' flip-to-line latency."""
+    os.environ['CANLAB_SIMULATE_BIOPAC'] = '1'
+    try:
+        import CANLab_PsychoPy_Utilities as utilities
+    except ImportError as err:
+        print("Skipping routines: %r" % err)
+        return
+    _thisDir = os.path.dirname(os.path.abspath(__file__))
+    image = os.path.join(_thisDir, 'images', 'img_1.jpg')
+    scale = os.path.join(_thisDir, 'stimuli', 'ratingscale', 'intensityScale.png')
+    device, writer = utilities.biopac, utilities.biopacMarkers
+    device.usb_latency = args.usb_latency
+    win = utilities.setupWindow(res=[800, 600])
+    utilities.fmriStart = utilities.globalClock.getTime()
+    cases = [
+        ('showText', lambda: utilities.showText(win, "Text", "Benchmark", time=args.time, biopacCode=utilities.instructions)),
+        ('showImg', lambda: utilities.showImg(win, "Image", image, time=args.time, biopacCode=utilities.cue)),
+        ('showTextAndImg', lambda: utilities.showTextAndImg(win, "TextAndImage", "Benchmark", image, time=args.time, biopacCode=utilities.cue)),
+        ('showFixation', lambda: utilities.showFixation(win, "Fixation", time=args.time, biopacCode=utilities.prefixation)),
+        ('showRatingScale', lambda: utilities.showRatingScale(win, "Rating", "How intense?", scale, type="unipolar", time=args.time, biopacCode=utilities.intensity_rating)),
+        ('nextRun', lambda: utilities.nextRun(win)),
+    ]
+    if args.movie:
+        movie = utilities.preloadMovie(win, "Movie", args.movie)
+        cases.append(('showMovie', lambda: utilities.showMovie(win, movie, "Movie", biopacCode=utilities.inscapes)))
+    for name, routine in cases:
+        latencies = []
+        for _ in range(args.repeats):
+            logged, written = len(writer.log), len(device.writes)
+            routine()
+            # let the writer finish this routine's markers before matching them to the lines
+            writer.flush()
+            latencies += [when - flip_time for flip_time, (when, fio) in zip(writer.log.requested[logged:len(writer.log)], device.writes[written:])]
+        print("%-40s %3d markers   flip-to-line p50 %7.3f ms   max %7.3f ms" % (
+            name, len(latencies), 1000 * percentile(latencies, 50), 1000 * max(latencies) if latencies else float('nan')))
+    win.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Biopac marker writes against a simulated LabJack U3.")
+    parser.add_argument('--suite', choices=['all', 'markers', 'routines'], default='all')
+    parser.add_argument('--markers', type=int, default=200, help="marker codes to send per backend")
+    parser.add_argument('--usb-latency', type=float, default=.0005, help="seconds the simulated U3 spends on each USB transaction")
+    parser.add_argument('--time', type=float, default=.5, help="seconds each routine runs")
+    parser.add_argument('--repeats', type=int, default=3, help="runs of each routine")
+    parser.add_argument('--movie', default=None, help="a movie file, to include showMovie")
+    args = parser.parse_args()
+
+    if args.suite in ('all', 'markers'):
+        codes = [code % 255 + 1 for code in range(args.markers)]
+        markers("writeRegister per pin", _legacySetData, SimulatedU3(args.usb_latency), codes)
+        portstate = PortStateMarkers(port_state_write=PortStateWrite)
+        markers("PortStateWrite", portstate, SimulatedU3(args.usb_latency), codes)
+        device = SimulatedU3(args.usb_latency)
+        throughput("MarkerWriter", MarkerWriter(device, setData=portstate).start(), device, codes)
+    if args.suite in ('all', 'routines'):
+        routines(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+# biopacControl.py
+# Digital event markers for the Biopac MP150, sent through the LabJack U3's FIO lines
+# e.g. : biopac = U3()
+#        biopac.setData = PortStateMarkers()
+#        biopac.setData(biopac, code)
+from time import perf_counter, sleep
+import queue
+import threading
+import heapq
+import itertools
+import numpy as np
+
+try:
+    from labjack import u3
+except ImportError:
+    try:
+        import u3
+    except ImportError:
+        u3 = None
+
+
+def portState(byte, endian='big'):
+    """
+    The FIO port state that puts byte on the 8 marker lines, matching the pin order of the original per-pin biopacSetData:
+    'big' drives FIO0 with the least significant bit, 'little' drives FIO0 with the most significant bit.
+    """
+    if endian == 'big':
+        return byte
+    return int('{0:08b}'.format(byte)[::-1], 2)
+
+
+# FIO state for every marker code, worked out once instead of formatting bit strings on every write
+port_states = {endian: tuple(portState(byte, endian) for byte in range(256)) for endian in ('big', 'little')}
+
+
+class PortStateMarkers():
+    """
+    Writes a marker code to all 8 FIO lines in a single U3 feedback transaction (PortStateWrite), instead of one writeRegister
+    round trip per pin. A 0-then-code pair costs 2 USB transactions instead of 16. The feedback command for each of the 256
+    codes is built once up front.
+    A drop-in for biopacSetData: assign it to biopac.setData and the existing biopac.setData(biopac, code) calls are unchanged.
+    e.g. : biopac.setData = PortStateMarkers()
+           win.callOnFlip(biopac.setData, biopac, code)
+    """
+    def __init__(self, endian='big', port_state_write=None):
+        """
+        Args:
+            endian (str): 'big' (FIO0 = least significant bit, as biopacSetData defaults to) or 'little'
+            port_state_write (callable): feedback command factory taking State and WriteMask; defaults to u3.PortStateWrite
+        """
+        if port_state_write is None:
+            if u3 is None:
+                raise ImportError("PortStateMarkers needs the LabJack u3 module (pip install LabJackPython)")
+            port_state_write = u3.PortStateWrite
+        self.endian = endian
+        # only the FIO port is written; EIO and CIO are masked out and left as they are
+        self.commands = [port_state_write(State=[state, 0, 0], WriteMask=[0xff, 0, 0]) for state in port_states[endian]]
+
+    def __call__(self, device, byte):
+        """
+        Put byte (0-255) on the marker lines of device.
+        """
+        device.getFeedback(self.commands[byte])
+
+
+class MarkerLog():
+    """
+    Every marker write as columns in preallocated NumPy arrays: code, requested (flip) time, time the write completed, and
+    routine. Routine names are stored once and referenced by index, so logging a marker allocates nothing; the arrays double
+    in the rare case a run outgrows them. write() saves a run's log as a TSV next to its _events.tsv.
+    A MarkerWriter appends from its own thread while the task reads and clears from the main thread, so every method holds a lock.
+    e.g. : biopacMarkers.log.write(bids_data_filename.replace('_events.tsv', '_markers.tsv'), start_time=fmriStart, clear=True)
+    """
+    columns = ('code', 'requested', 'written', 'latency', 'routine')
+
+    def __init__(self, capacity=4096):
+        """
+        Args:
+            capacity (int): markers held before the arrays grow; default 4096
+        """
+        self.code = np.zeros(capacity, dtype=np.uint8)
+        self.requested = np.zeros(capacity, dtype=np.float64)
+        self.written = np.zeros(capacity, dtype=np.float64)
+        self.routine = np.zeros(capacity, dtype=np.int32)
+        self.routines = ['n/a']     # routine names, indexed by the routine column
+        self._routine_index = {None: 0, 'n/a': 0}
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def _grow(self):
+        for column in ('code', 'requested', 'written', 'routine'):
+            array = getattr(self, column)
+            grown = np.zeros(2 * len(array), dtype=array.dtype)
+            grown[:len(array)] = array
+            setattr(self, column, grown)
+
+    def append(self, code, requested, written, routine=None):
+        with self._lock:
+            index = self._routine_index.get(routine)
+            if index is None:
+                index = self._routine_index[routine] = len(self.routines)
+                self.routines.append(str(routine))
+            if self.count == len(self.code):
+                self._grow()
+            i = self.count
+            self.code[i] = code
+            self.requested[i] = requested
+            self.written[i] = written
+            self.routine[i] = index
+            self.count = i + 1
+
+    def latencies(self):
+        """
+        Returns:
+            np.ndarray: seconds from each marker's requested time to its write completing
+        """
+        with self._lock:
+            return self.written[:self.count] - self.requested[:self.count]
+
+    def clear(self):
+        with self._lock:
+            self.count = 0
+
+    def write(self, path, start_time=0., clear=False):
+        """
+        Save the log as a tab-separated file with a header row.
+
+        Args:
+            path (str): file to write, e.g. the run's _events.tsv with _markers.tsv in place of _events.tsv
+            start_time (float): clock time of the run's start, e.g. fmriStart; times are written relative to it, like events onsets
+            clear (bool): empty the log in the same step, so a marker logged while the file is written goes to the next run's log
+                          rather than being lost between write() and clear(); default False
+        """
+        # copy the rows out under the lock and write the file without it, so the writer thread isn't held up by disk I/O
+        with self._lock:
+            count = self.count
+            code, requested, written, routine = self.code[:count].copy(), self.requested[:count].copy(), self.written[:count].copy(), self.routine[:count].copy()
+            routines = self.routines[:]
+            if clear:
+                self.count = 0
+        with open(path, 'w') as f:
+            f.write('\t'.join(self.columns) + '\n')
+            for i in range(count):
+                f.write('%d\t%.4f\t%.4f\t%.4f\t%s\n' % (code[i], requested[i] - start_time, written[i] - start_time,
+                                                      written[i] - requested[i], routines[routine[i]]))
+
+
+class MarkerWriter():
+    """
+    Performs marker writes on a dedicated thread so the frame loop never waits on USB.
+    Routines hand it (code, flip time) from a win.callOnFlip callback, which only timestamps and enqueues; the writer thread does
+    the USB transaction and records when it completed, so each marker's lateness relative to its flip is known.
+    Once started, send every marker through it, since the U3 isn't safe to write from two threads at once.
+
+    Markers are levels by default: a code stays on the lines until the next write, as routines write 0 then the code at onset
+    and 0 at offset. With pulse_width set, every non-zero code becomes a pulse of that width which the writer resets on its own
+    timer, and writes of 0 are dropped; the existing 0-then-code calls then produce one clean pulse per event and no reset traffic.
+    pulse() sends a pulse explicitly, with its own width and priority.
+
+    Priority rule for overlapping pulses: the lines carry one code at a time. A pulse requested while another is high waits, and
+    starts gap seconds after that one resets; waiting pulses go highest priority first, then in the order requested. A pulse with
+    a strictly higher priority than the one that is high cuts it short instead (0, then the new code). A level write takes effect
+    at once and ends any pulse that is high; pulses still waiting follow it.
+    e.g. : biopacMarkers = MarkerWriter(biopac, clock=globalClock, pulse_width=.01).start()
+           win.callOnFlip(biopacMarkers.onFlip, biopacCode)
+           biopacMarkers.pulse(response_code, priority=1)
+           ...
+           biopacMarkers.stop()
+           print(biopacMarkers.summary())
+    """
+    def __init__(self, device, setData=None, clock=None, pulse_width=None, gap=.002, approach=.002):
+        """
+        Args:
+            device (U3): the LabJack to write to
+            setData (callable): writes a code as setData(device, code); defaults to device.setData
+            clock (psychopy.core.Clock): clock for flip and write times, e.g. globalClock; anything with getTime(); defaults to perf_counter()
+            pulse_width (float): seconds a code stays high before resetting to 0; default None (codes are levels)
+            gap (float): seconds the lines stay at 0 between back-to-back pulses, so each has a rising edge to detect; default .002
+            approach (float): this close to a pulse edge, stop watching the queue and sleep straight to the edge, which is more
+                              precise than a queue timeout (time.sleep uses a high-resolution timer); default .002
+        """
+        self.device = device
+        self.setData = device.setData if setData is None else setData
+        self.clock = clock
+        self.pulse_width = pulse_width
+        self.gap = gap
+        self.approach = approach
+        self.log = MarkerLog()
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._waiting = []      # heap of (-priority, order, code, flip time, width) for pulses waiting for the lines
+        self._order = itertools.count()
+        self._reset_at = None   # perf_counter() time the pulse that is high resets
+        self._priority = None   # priority of the pulse that is high
+        self._routine = None    # routine that sent the pulse that is high
+        self._free_at = 0.      # perf_counter() time the next waiting pulse may start
+        self._flushes = []      # flush() events to set once no pulse is high or waiting
+
+    def _now(self):
+        return perf_counter() if self.clock is None else self.clock.getTime()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='MarkerWriter', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Write every marker still queued, let pulses finish, then stop the thread.
+        """
+        self._queue.put(None)
+        if self._thread is not None:
+            self._thread.join()
+
+    def flush(self, timeout=None):
+        """
+        Block until every marker queued so far has been written and every pulse has reset to 0, e.g. before saving the log at
+        the end of a run.
+
+        Returns:
+            bool: False if timeout (seconds) ran out first
+        """
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def write(self, code, flip_time=None, routine=None):
+        """
+        Queue code (0-255) for writing, as requested at flip_time (default now) by routine. A pulse if pulse_width is set.
+        """
+        flip_time = self._now() if flip_time is None else flip_time
+        if self.pulse_width is None:
+            self._queue.put((code, flip_time, None, 0, routine))
+        elif code:
+            self._queue.put((code, flip_time, self.pulse_width, 0, routine))
+
+    def onFlip(self, code, routine=None):
+        """
+        For win.callOnFlip, which calls it right after the buffer swap: stamps the flip and queues the write.
+        e.g. : win.callOnFlip(biopacMarkers.onFlip, biopacCode, name)
+        """
+        self.write(code, self._now(), routine)
+
+    def pulse(self, code, width=None, priority=0, flip_time=None, routine=None):
+        """
+        Queue a pulse: code goes high, then resets to 0 after width seconds.
+
+        Args:
+            code (int): marker code, 1-255
+            width (float): seconds high; defaults to pulse_width, or .01
+            priority (int): higher priorities go first, and cut short a lower priority pulse that is high
+            flip_time (float): time the pulse was requested for, on clock; default now
+            routine (str): name logged with the marker, e.g. the routine's name
+        """
+        width = width if width is not None else self.pulse_width if self.pulse_width is not None else .01
+        self._queue.put((code, self._now() if flip_time is None else flip_time, width, priority, routine))
+
+    def onFlipPulse(self, code, width=None, priority=0, routine=None):
+        """
+        For win.callOnFlip, like onFlip but always a pulse.
+        """
+        self.pulse(code, width, priority, self._now(), routine)
+
+    def _write(self, code, flip_time, routine):
+        try:
+            self.setData(self.device, code)
+        except Exception as err:
+            print("==> Biopac marker %d failed: %r" % (code, err))
+            return
+        self.log.append(code, flip_time, self._now(), routine)
+
+    def _sleepUntil(self, due):
+        # a blocking sleep rather than a busy-wait, which would hold the GIL and stall the render thread
+        remaining = due - perf_counter()
+        if remaining > 0:
+            sleep(remaining)
+
+    def _startPulse(self, code, flip_time, width, priority, routine):
+        self._write(code, flip_time, routine)
+        self._reset_at = perf_counter() + width
+        self._priority = priority
+        self._routine = routine
+
+    def _resetPulse(self):
+        self._sleepUntil(self._reset_at)
+        self._write(0, self._now(), self._routine)
+        self._reset_at = self._priority = self._routine = None
+        self._free_at = perf_counter() + self.gap
+
+    def _handle(self, code, flip_time, width, priority, routine):
+        if width is None:
+            self._reset_at = self._priority = self._routine = None
+            self._write(code, flip_time, routine)
+        elif self._reset_at is None and not self._waiting and perf_counter() >= self._free_at:
+            self._startPulse(code, flip_time, width, priority, routine)
+        elif self._reset_at is not None and priority > self._priority:
+            self._write(0, flip_time, routine)
+            self._startPulse(code, flip_time, width, priority, routine)
+        else:
+            heapq.heappush(self._waiting, (-priority, next(self._order), code, flip_time, width, routine))
+
+    def _run(self):
+        stopping = False
+        while True:
+            now = perf_counter()
+            if self._flushes and self._reset_at is None and not self._waiting:
+                for done in self._flushes:
+                    done.set()
+                del self._flushes[:]
+            if self._reset_at is not None:
+                if now >= self._reset_at - self.approach:
+                    self._resetPulse()
+                    continue
+                due = self._reset_at
+            elif self._waiting:
+                if now >= self._free_at - self.approach:
+                    self._sleepUntil(self._free_at)
+                    priority, _, code, flip_time, width, routine = heapq.heappop(self._waiting)
+                    self._startPulse(code, flip_time, width, -priority, routine)
+                    continue
+                due = self._free_at
+            elif stopping:
+                return
+            else:
+                due = None
+            try:
+                item = self._queue.get(timeout=None if due is None else max(0., due - now - self.approach))
+            except queue.Empty:
+                continue
+            if item is None:
+                stopping = True
+                continue
+            if isinstance(item, threading.Event):
+                # set at the top of the loop once pulses still high or waiting have been written
+                self._flushes.append(item)
+                continue
+            self._handle(*item)
+
+    def latencies(self):
+        """
+        Returns:
+            np.ndarray: seconds from each marker's flip to its write completing
+        """
+        return self.log.latencies()
+
+    def summary(self):
+        """
+        Returns:
+            dict: markers written and their flip-to-write latency in ms (mean, p50, p99, max)
+        """
+        latencies = 1000 * self.latencies()
+        if not len(latencies):
+            return {'markers': 0}
+        return {'markers': len(latencies), 'mean_ms': round(float(latencies.mean()), 3), 'p50_ms': round(float(np.percentile(latencies, 50)), 3),
+                'p99_ms': round(float(np.percentile(latencies, 99)), 3), 'max_ms': round(float(latencies.max()), 3)}
@@ -0,0 +1,124 @@
+# biopacSimulator.py
+# A stand-in for the LabJack U3 that sends our markers to the Biopac, for running and benchmarking the marker path without hardware.
+# e.g. : set biopac_simulated = 1 in CANLab_PsychoPy_Config.py (or the CANLAB_SIMULATE_BIOPAC=1 environment variable)
+from time import perf_counter, sleep
+import random
+
+
+class PortStateWrite():
+    """Stand-in for u3.PortStateWrite: the [FIO, EIO, CIO] states to write, and which bits of each to touch."""
+    def __init__(self, State=[0, 0, 0], WriteMask=[0xff, 0xff, 0xff]):
+        self.State = State
+        self.WriteMask = WriteMask
+
+
+class BitStateWrite():
+    """Stand-in for u3.BitStateWrite: one line, numbered 0-7 FIO, 8-15 EIO, 16-19 CIO."""
+    def __init__(self, IONumber, State):
+        self.IONumber = IONumber
+        self.State = State
+
+
+class SimulatedU3():
+    """
+    A drop-in for the U3 the Config opens: writeRegister, setFIOState, configIO and getFeedback behave like the device's, each
+    costing one USB transaction of usb_latency seconds. The lines change halfway through the transaction, when the command
+    reaches the device. Every write is recorded with its timestamp, so marker timing can be checked against flip times.
+    e.g. : biopac = SimulatedU3(clock=globalClock)
+           biopac.setData = PortStateMarkers(port_state_write=PortStateWrite)
+           biopac.setData(biopac, 15)
+           biopac.transitions()     # [(time, 15)]
+    """
+    def __init__(self, usb_latency=.0005, jitter=0., clock=None, seed=None):
+        """
+        Args:
+            usb_latency (float): seconds per USB transaction (command out, response back); default .5ms, about a full-speed U3
+            jitter (float): up to this many seconds added at random to each transaction; default 0
+            clock (psychopy.core.Clock): clock to timestamp writes on, e.g. globalClock; anything with getTime(); defaults to perf_counter()
+            seed (int): seed for jitter
+        """
+        self.usb_latency = usb_latency
+        self.jitter = jitter
+        self.clock = clock
+        self.transactions = 0
+        self.fio = 0
+        self.eio = 0
+        self.cio = 0
+        self.fio_analog = 0
+        self.eio_analog = 0
+        self.writes = []        # (time, FIO state) after every write that touched the FIO lines
+        self._random = random.Random(seed)
+
+    def _now(self):
+        return perf_counter() if self.clock is None else self.clock.getTime()
+
+    def _transact(self, apply):
+        # half the round trip to reach the device, half to hear back
+        self.transactions += 1
+        latency = self.usb_latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.)
+        if latency:
+            sleep(latency / 2)
+        result = apply()
+        if latency:
+            sleep(latency / 2)
+        return result
+
+    def _setLines(self, fio, eio, cio):
+        self.fio, self.eio, self.cio = fio, eio, cio
+        self.writes.append((self._now(), fio))
+
+    def _setBit(self, ionum, state):
+        lines = [self.fio, self.eio, self.cio]
+        port, bit = divmod(ionum, 8)
+        lines[port] = (lines[port] & ~(1 << bit)) | (int(bool(state)) << bit)
+        self._setLines(*lines)
+
+    def configIO(self, FIOAnalog=None, EIOAnalog=None, **kwargs):
+        def apply():
+            if FIOAnalog is not None:
+                self.fio_analog = FIOAnalog
+            if EIOAnalog is not None:
+                self.eio_analog = EIOAnalog
+            return {'FIOAnalog': self.fio_analog, 'EIOAnalog': self.eio_analog}
+        return self._transact(apply)
+
+    def setFIOState(self, fioNum, state=1):
+        self._transact(lambda: self._setBit(fioNum, state))
+
+    def writeRegister(self, addr, value):
+        # 6000-6019 are the FIO, EIO and CIO digital states
+        if 6000 <= addr < 6020:
+            return self._transact(lambda: self._setBit(addr - 6000, value))
+        return self._transact(lambda: value)
+
+    def getFeedback(self, *commandlist):
+        def apply():
+            lines = [self.fio, self.eio, self.cio]
+            for command in commandlist:
+                if isinstance(command, BitStateWrite):
+                    port, bit = divmod(command.IONumber, 8)
+                    lines[port] = (lines[port] & ~(1 << bit)) | (int(bool(command.State)) << bit)
+                else:
+                    lines = [(line & ~mask) | (state & mask) for line, state, mask in zip(lines, command.State, command.WriteMask)]
+            self._setLines(*lines)
+            return [None] * len(commandlist)
+        return self._transact(apply)
+
+    def getCalibrationData(self):
+        return {}
+
+    def close(self):
+        pass
+
+    def transitions(self):
+        """
+        Returns:
+            list: (time, FIO state) each time the marker lines changed value
+        """
+        changes = []
+        last = None
+        for when, fio in self.writes:
+            if fio != last:
+                changes.append((when, fio))
+                last = fio
+        return changes
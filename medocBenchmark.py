@@ -0,0 +1,152 @@
+# medocBenchmark.py
+# End-to-end latency benchmark for the thermode path, run against medocSimulator so no MMS is needed.
+# e.g. : python medocBenchmark.py --commands 500 --trials 5
+# or python medocBenchmark.py --suite codec
+from time import time, perf_counter
+from datetime import datetime
+import timeit as _timeit
+import argparse
+import socket
+import struct
+
+import medocControl
+from medocControl import config, sendCommand, poll_for_change, MedocClient, MedocPipeline, commandBuilder, medocResponse, command_to_id, states, test_states, response_codes
+from medocSimulator import MedocSimulator
+
+
+def percentile(samples, q):
+    """Nearest-rank percentile of a list of samples, q in [0, 100]."""
+    ordered = sorted(samples)
+    if not ordered:
+        return float('nan')
+    rank = min(len(ordered) - 1, max(0, int(round(q / 100. * len(ordered) + .5)) - 1))
+    return ordered[rank]
+
+
+def timeit(fn, repeats):
+    """Call fn() repeats times and return (latencies in s, total elapsed in s)."""
+    latencies = []
+    start = perf_counter()
+    for _ in range(repeats):
+        t0 = perf_counter()
+        fn()
+        latencies.append(perf_counter() - t0)
+    return latencies, perf_counter() - start
+
+
+def report(name, latencies, elapsed):
+    print("%-50s n=%-5d %9.1f /s   p50 %8.3f ms   p99 %8.3f ms" % (
+        name, len(latencies), len(latencies) / elapsed, 1000 * percentile(latencies, 50), 1000 * percentile(latencies, 99)))
+
+
+def trial(send, program, poll_interval, server_lag):
+    """One heat trial as run in our paradigms: SELECT_TP -> wait for RUNNING -> TRIGGER -> wait for IDLE."""
+    send('SELECT_TP', program)
+    poll(send, 'RUNNING', poll_interval, server_lag)
+    send('TRIGGER')
+    poll(send, 'IDLE', poll_interval, server_lag)
+
+
+def poll(send, desired_value, poll_interval, server_lag):
+    client = getattr(send, '__self__', None)
+    return poll_for_change(desired_value, poll_interval=poll_interval, server_lag=server_lag, client=client)
+
+
+# The codec as it was before precompiled structs and frame templates, kept as the baseline for --suite codec
+def _legacyCommandBuilder(command, parameter=None):
+    if type(command) is str:
+        command = command_to_id[command.upper()]
+    if type(parameter) is str:
+        parameter = int(parameter, 2)
+    elif type(parameter) is float:
+        parameter = 100*parameter
+    commandbytes = int(time()).to_bytes(4, 'big')
+    commandbytes += int(command).to_bytes(1, 'big')
+    if parameter:
+        commandbytes += socket.htonl(parameter).to_bytes(4, 'big')
+    return len(commandbytes).to_bytes(4, 'big') + commandbytes
+
+
+class _legacyMedocResponse():
+    def __init__(self, response):
+        self.length = struct.unpack_from('H', response[0:4])[0]
+        self.timestamp = int.from_bytes(response[4:8], 'big')
+        self.datetime = datetime.fromtimestamp(self.timestamp)
+        self.strtime = self.datetime.strftime("%Y-%m-%d %H:%M:%S")
+        self.command = int.from_bytes(response[8:9], 'big')
+        self.state = int.from_bytes(response[9:10], 'big')
+        self.teststate = int.from_bytes(response[10:11], 'big')
+        self.statestr = states.get(self.state, 'unknown state code')
+        self.teststatestr = test_states.get(self.teststate, 'unknown test state code')
+        self.respcode = struct.unpack_from('H', response[11:13])[0]
+        self.respstr = response_codes.get(self.respcode, "unknown response code")
+        self.testtime = struct.unpack_from('I', response[13:17])[0] / 1000.
+        self.temp = struct.unpack_from('h', response[17:19])[0] / 100.
+        self.CoVAS = int.from_bytes(response[19:20], 'big')
+        self.yes = int.from_bytes(response[20:21], 'big')
+        self.no = int.from_bytes(response[21:22], 'big')
+        self.message = response[22:self.length]
+        self.response = response
+
+
+def codec(repeats):
+    """Per-call encode/decode cost of the legacy and current codec; decode reads teststatestr as the polling loops do."""
+    frame = MedocSimulator().execute(command_to_id['GET_STATUS'], None)
+    cases = [
+        ("encode GET_STATUS", lambda: _legacyCommandBuilder('GET_STATUS'), lambda: commandBuilder('GET_STATUS')),
+        ("encode SELECT_TP 140", lambda: _legacyCommandBuilder('SELECT_TP', 140), lambda: commandBuilder('SELECT_TP', 140)),
+        ("decode + teststatestr", lambda: _legacyMedocResponse(frame).teststatestr, lambda: medocResponse(frame).teststatestr),
+    ]
+    for name, before, after in cases:
+        before_us = 1e6 * min(_timeit.repeat(before, number=repeats, repeat=5)) / repeats
+        after_us = 1e6 * min(_timeit.repeat(after, number=repeats, repeat=5)) / repeats
+        print("%-30s before %7.3f us   after %7.3f us   %5.1fx" % (name, before_us, after_us, before_us / after_us))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark medocControl against a simulated MMS.")
+    parser.add_argument('--suite', choices=['all', 'thermode', 'codec'], default='all')
+    parser.add_argument('--codec-repeats', type=int, default=100000, help="calls per codec timing")
+    parser.add_argument('--commands', type=int, default=200, help="GET_STATUS commands per command benchmark")
+    parser.add_argument('--polls', type=int, default=20, help="poll_for_change calls on an already-reached state")
+    parser.add_argument('--trials', type=int, default=3, help="full SELECT_TP -> TRIGGER trials")
+    parser.add_argument('--poll-interval', type=float, default=config.timedelayformedoc)
+    parser.add_argument('--server-lag', type=float, default=1.)
+    parser.add_argument('--select-delay', type=float, default=.5)
+    parser.add_argument('--ramp-time', type=float, default=.5)
+    parser.add_argument('--stimulation-time', type=float, default=1.)
+    parser.add_argument('--reset-probability', type=float, default=0., help="fraction of commands the simulator answers with a connection reset")
+    parser.add_argument('--latency', type=float, default=0., help="simulated network latency added to every response, in s")
+    args = parser.parse_args()
+
+    config.debug = 0
+    if args.suite in ('all', 'codec'):
+        codec(args.codec_repeats)
+    if args.suite == 'codec':
+        return
+    simulated = dict(select_delay=args.select_delay, ramp_time=args.ramp_time, stimulation_time=args.stimulation_time,
+                     reset_probability=args.reset_probability, seed=0, latency=args.latency)
+    # the module-level sendCommand opens a connection per command, the pooled client keeps one open
+    with MedocSimulator(close_after_response=True, **simulated) as closing, MedocSimulator(close_after_response=False, **simulated) as persistent:
+        config.address, config.port = closing.address
+        client = MedocClient(*persistent.address)
+        paths = [('sendCommand', sendCommand), ('MedocClient.sendCommand', client.sendCommand)]
+
+        for name, send in paths:
+            report(name + " GET_STATUS", *timeit(lambda: send('GET_STATUS'), args.commands))
+        for name, send in paths:
+            report(name + " poll_for_change", *timeit(lambda: poll(send, 'IDLE', args.poll_interval, args.server_lag), args.polls))
+        for name, send in paths:
+            report(name + " SELECT_TP->TRIGGER trial", *timeit(lambda: trial(send, 140, args.poll_interval, args.server_lag), args.trials))
+        # the VAS/T_DOWN/VAS/T_UP sequence from medocControl's demo, one command at a time and pipelined
+        burst = [('VAS', 4), ('T_DOWN', 500), ('VAS', 7), ('T_UP', 500)]
+        pipeline = MedocPipeline(*persistent.address)
+        report("MedocClient.sendCommand x4 burst", *timeit(lambda: [client.sendCommand(*command) for command in burst], args.commands))
+        report("MedocPipeline.submitMany x4 burst", *timeit(lambda: [f.result() for f in pipeline.submitMany(burst)], args.commands))
+        pipeline.close()
+        client.close()
+        print("resets injected: %d (sendCommand), %d (MedocClient)" % (closing.resets_injected, persistent.resets_injected))
+
+
+if __name__ == "__main__":
+    main()
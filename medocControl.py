@@ -1,10 +1,22 @@
 # medocControl.py
 # Required for Thermode Triggering
-from time import time, sleep
+from time import time, sleep, perf_counter
 from datetime import datetime
 import socket
+import asyncio
+import concurrent.futures
 import struct
+import functools
 import binascii
+import select
+import queue
+import threading
+import json
+import random
+import mmap
+import collections
+import os
+import numpy as np
 
 class ThermodeEventListener():
     def wait_for_seconds(self, seconds):
@@ -19,10 +31,127 @@ class ThermodeConfig():
     port = 20121
     debug = 1
     timedelayformedoc = 0.3
+    journal = None  # set to a MedocJournal to record every frame sent and received
 
 
 config = ThermodeConfig()   # Create a thermode config object
 
+class MedocConnectionError(ConnectionError):
+    """
+    Raised when a RetryPolicy gives up on reaching the MMS.
+    """
+
+
+class MedocFramingError(ValueError):
+    """
+    Raised when a response header announces a length no MMS response has: the byte stream is corrupt or out of step, not disconnected.
+    """
+
+
+class RetryPolicy():
+    """
+    How every thermode call retries a failed round trip: exponential backoff with jitter, bounded by both an attempt count and a total deadline,
+    so a brief MMS hiccup is recovered from in milliseconds and a dead link gives up at a predictable time instead of recursing or stalling for 15+ seconds.
+    Errors in retry_on are retried; errors in wake_on additionally send the MMS a single wake-up GET_STATUS (what the old recursive sendCommand(0) did);
+    anything else is raised immediately.
+    e.g. : config.retry_policy = RetryPolicy(deadline=2.)
+    """
+    def __init__(self, max_attempts=50, deadline=5., base_delay=.01, max_delay=config.timedelayformedoc, multiplier=2., jitter=.5,
+                 retry_on=(ConnectionError, socket.timeout), wake_on=(ConnectionResetError,)):
+        """
+        Args:
+            max_attempts (int): attempts before giving up; default 50
+            deadline (float): seconds after the first attempt to give up, whatever the attempt count; default 5s
+            base_delay (float): delay before the second retry; the first retry is immediate, since it's usually just a stale connection; default .01s
+            max_delay (float): cap on the delay between attempts; default config.timedelayformedoc
+            multiplier (float): backoff growth per attempt; default 2
+            jitter (float): fraction of each delay randomized away, so concurrent callers don't retry in lockstep; default .5
+            retry_on (tuple): exception classes to retry; default ConnectionError and socket.timeout
+            wake_on (tuple): exception classes after which to send a wake-up probe before retrying; default ConnectionResetError
+        """
+        self.max_attempts = max_attempts
+        self.deadline = deadline
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.retry_on = retry_on
+        self.wake_on = wake_on
+
+    def delay(self, failures):
+        """
+        Seconds to wait after the given number of consecutive failures.
+        """
+        if failures <= 1:
+            return 0.
+        delay = min(self.max_delay, self.base_delay * self.multiplier ** (failures - 2))
+        return delay * (1 - self.jitter * random.random())
+
+    def _failed(self, err, failures, started):
+        """Book-keeping after a failed attempt; returns the delay before the next one, or raises if it's time to give up."""
+        if not isinstance(err, self.retry_on):
+            raise err
+        if config.debug:
+            print("==> " + type(err).__name__ + ", retrying")
+        metrics.count(type(err).__name__)
+        metrics.count('retries')
+        delay = self.delay(failures)
+        elapsed = perf_counter() - started
+        if failures >= self.max_attempts or elapsed + delay > self.deadline:
+            metrics.count('give_ups')
+            raise MedocConnectionError("MMS unreachable after %d attempts in %.2f s: %s" % (failures, elapsed, err)) from err
+        return delay
+
+    def run(self, attempt, wake=None, wait=sleep):
+        """
+        Call attempt() until it returns, retrying as configured.
+
+        Args:
+            attempt (callable): performs one round trip and returns its result
+            wake (callable): one-shot wake-up probe, e.g. a lambda around wakeUp(); default None
+            wait (callable): how to wait between attempts; default time.sleep
+
+        Raises:
+            MedocConnectionError: when max_attempts or the deadline is reached
+        """
+        started = perf_counter()
+        failures = 0
+        while True:
+            try:
+                return attempt()
+            except Exception as err:
+                failures += 1
+                delay = self._failed(err, failures, started)
+                woken = wake is not None and isinstance(err, self.wake_on)
+            if woken:
+                metrics.count('wakeups')
+                wake()
+            if delay:
+                wait(delay)
+
+    async def run_async(self, attempt, wake=None):
+        """
+        asyncio version of run(): attempt is a coroutine function, and neither waits nor the wake-up probe block the event loop.
+        """
+        started = perf_counter()
+        failures = 0
+        while True:
+            try:
+                return await attempt()
+            except Exception as err:
+                failures += 1
+                delay = self._failed(err, failures, started)
+                woken = wake is not None and isinstance(err, self.wake_on)
+            if woken:
+                metrics.count('wakeups')
+                # the probe is a blocking socket call; keep it off the event loop
+                await asyncio.get_running_loop().run_in_executor(None, wake)
+            if delay:
+                await asyncio.sleep(delay)
+
+
+config.retry_policy = RetryPolicy()     # Shared by every thermode call
+
 command_to_id = {
     'GET_STATUS': 0,
     'SELECT_TP': 1,
@@ -65,6 +194,290 @@ response_codes = { 0 : "OK",
     16384: "Safety error, going to IDLE"
 }
 
+class LatencyHistogram():
+    """
+    Log-linear latency histogram in the style of HdrHistogram: each power-of-two range of microseconds is split into
+    2**sub_bucket_bits linear buckets, so recording is constant time, memory is fixed, and percentiles are accurate to about 1/16.
+    """
+    def __init__(self, sub_bucket_bits=4, max_exponent=32):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.sub_buckets = 1 << sub_bucket_bits
+        self.counts = [0] * ((max_exponent + 1) * self.sub_buckets)
+        self.total = 0
+        self.sum = 0.
+        self.min = None
+        self.max = None
+
+    def _index(self, us):
+        if us < self.sub_buckets:
+            return us
+        shift = us.bit_length() - self.sub_bucket_bits - 1
+        return min(len(self.counts) - 1, (shift + 1) * self.sub_buckets + (us >> shift) - self.sub_buckets)
+
+    def _value(self, index):
+        # midpoint of the bucket, in microseconds
+        row, sub = divmod(index, self.sub_buckets)
+        if row == 0:
+            return sub
+        shift = row - 1
+        return ((self.sub_buckets + sub) << shift) + (1 << shift) / 2.
+
+    def record(self, seconds):
+        us = max(0, int(seconds * 1e6))
+        self.counts[self._index(us)] += 1
+        self.total += 1
+        self.sum += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+    def percentile(self, q):
+        """
+        Returns:
+            float: the q-th percentile (0-100) in seconds, or None if nothing was recorded
+        """
+        if not self.total:
+            return None
+        target = max(1, int(q / 100. * self.total + .5))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self.max, max(self.min, self._value(index) / 1e6))
+
+    def snapshot(self):
+        if not self.total:
+            return {'count': 0}
+        stats = {'mean_ms': self.sum / self.total, 'min_ms': self.min, 'p50_ms': self.percentile(50),
+                 'p90_ms': self.percentile(90), 'p99_ms': self.percentile(99), 'max_ms': self.max}
+        stats = {key: round(1000 * value, 3) for key, value in stats.items()}
+        stats['count'] = self.total
+        return stats
+
+
+class MedocMetrics():
+    """
+    Where thermode time goes: per-command latency histograms for each phase of a round trip (connect, send, first_byte, response),
+    retry and reset counters, and time spent in poll_for_change. Everything in medocControl records into the module-level metrics object.
+    e.g. : print(metrics.snapshot()['commands']['TRIGGER']['response'])
+           metrics.dump(sub_dir + os.sep + 'sub-SID000099_ses-99_task-CANLab-Study_run-1_thermode.json')
+    """
+    phases = ('connect', 'send', 'first_byte', 'response')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Clear everything recorded so far, e.g. at the start of each run.
+        """
+        with self._lock:
+            self.histograms = {}
+            self.counters = {}
+            self.poll_time = LatencyHistogram()
+
+    def record(self, command, phase, seconds):
+        """
+        Record the duration of one phase of a command, e.g. metrics.record('GET_STATUS', 'response', .002).
+        """
+        if type(command) is int:
+            command = id_to_command.get(command, str(command))
+        with self._lock:
+            self.histograms.setdefault((command, phase), LatencyHistogram()).record(seconds)
+
+    def count(self, counter, n=1):
+        """
+        Increment a named counter, e.g. metrics.count('retries').
+        """
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def recordPoll(self, seconds):
+        with self._lock:
+            self.poll_time.record(seconds)
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: {'commands': {command: {phase: stats}}, 'counters': {name: count}, 'poll_for_change': stats}, with times in ms
+        """
+        with self._lock:
+            commands = {}
+            for (command, phase), histogram in sorted(self.histograms.items()):
+                commands.setdefault(command, {})[phase] = histogram.snapshot()
+            return {'commands': commands, 'counters': dict(self.counters), 'poll_for_change': self.poll_time.snapshot()}
+
+    def dump(self, path):
+        """
+        Write snapshot() as JSON, e.g. next to the run's events file.
+        """
+        with open(path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+
+metrics = MedocMetrics()    # Collects latencies and counters for every thermode command
+
+class MedocJournal():
+    """
+    Append-only binary journal of every raw frame sent to and received from the MMS, with perf_counter() timestamps.
+    Frames are handed to a background writer thread through a queue, so recording costs the sending thread about a microsecond.
+    Set config.journal to a MedocJournal to record everything medocControl sends; read it back with MedocJournalReader.
+    e.g. : config.journal = MedocJournal(sub_dir + os.sep + 'sub-SID000099_ses-99_task-CANLab-Study_run-1_thermode.journal')
+           ... run ...
+           config.journal.close()
+    """
+    magic = b'MEDOCJ01'
+    file_header = struct.Struct('<8sdd')    # magic, wall-clock time and perf_counter() time when the journal was opened
+    record_header = struct.Struct('<BdH')   # direction, perf_counter() time, frame length
+    SENT = 0
+    RECEIVED = 1
+
+    def __init__(self, path, flush_interval=.5):
+        """
+        Args:
+            path (str): journal file; appended to if it already exists
+            flush_interval (float): seconds between flushes to disk while frames are arriving; default .5s
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self._queue = queue.SimpleQueue()
+        self._file = open(path, 'ab', buffering=1 << 16)
+        self._file.write(self.file_header.pack(self.magic, time(), perf_counter()))
+        self._thread = threading.Thread(target=self._run, name='MedocJournal', daemon=True)
+        self._thread.start()
+
+    def record(self, direction, frame):
+        """
+        Queue one frame for writing; direction is MedocJournal.SENT or MedocJournal.RECEIVED.
+        """
+        self._queue.put((direction, perf_counter(), frame))
+
+    def _run(self):
+        last_flush = perf_counter()
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                break
+            if item:
+                direction, timestamp, frame = item
+                self._file.write(self.record_header.pack(direction, timestamp, len(frame)))
+                self._file.write(frame)
+            if perf_counter() - last_flush > self.flush_interval:
+                self._file.flush()
+                last_flush = perf_counter()
+        self._file.close()
+
+    def close(self):
+        """
+        Write out everything queued so far and close the file.
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+
+class MedocJournalReader():
+    """
+    Memory-maps a MedocJournal file for fast replay and summaries.
+    e.g. : for timestamp, direction, decoded in MedocJournalReader(path).replay(): print(timestamp, decoded)
+           summarizeJournals(glob.glob('data/*/*/*.journal'))
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(path) else b''
+
+    def close(self):
+        if isinstance(self._mmap, mmap.mmap):
+            self._mmap.close()
+
+    def records(self):
+        """
+        Yields (perf_counter() timestamp, direction, raw frame as a memoryview) for every record, in order.
+        A journal reopened for appending has several sessions; their file headers are skipped.
+        """
+        data = self._mmap
+        view = memoryview(data)
+        header = MedocJournal.record_header
+        offset = 0
+        end = len(data)
+        while offset < end:
+            if data[offset:offset + 8] == MedocJournal.magic:
+                offset += MedocJournal.file_header.size
+                continue
+            if offset + header.size > end:
+                break
+            direction, timestamp, length = header.unpack_from(data, offset)
+            offset += header.size
+            if offset + length > end:
+                # a record cut short by a crash
+                break
+            yield timestamp, direction, view[offset:offset + length]
+            offset += length
+
+    def replay(self):
+        """
+        Yields (timestamp, 'sent', (command name, parameter)) and (timestamp, 'received', medocResponse) in the order they happened.
+        """
+        for timestamp, direction, frame in self.records():
+            if direction == MedocJournal.SENT:
+                parameter = _command_parameter.unpack_from(frame, _command_header.size)[0] if len(frame) > _command_header.size else None
+                yield timestamp, 'sent', (id_to_command.get(frame[8], frame[8]), parameter)
+            else:
+                yield timestamp, 'received', medocResponse(bytes(frame))
+
+    def summary(self):
+        """
+        Returns:
+            dict: duration, commands sent per type, responses per test state, failed responses per response code,
+                  round-trip latency (each send to the next receive) and the longest silence between records
+        """
+        sent = {}
+        teststates = {}
+        failures = {}
+        round_trips = LatencyHistogram()
+        first = last = pending = None
+        longest_gap = 0.
+        for timestamp, direction, frame in self.records():
+            if first is None:
+                first = timestamp
+            elif timestamp - last > longest_gap:
+                longest_gap = timestamp - last
+            last = timestamp
+            if direction == MedocJournal.SENT:
+                command = id_to_command.get(frame[8], frame[8])
+                sent[command] = sent.get(command, 0) + 1
+                pending = timestamp
+            else:
+                teststate = test_states.get(frame[10], frame[10])
+                teststates[teststate] = teststates.get(teststate, 0) + 1
+                respcode = _response_fields.unpack_from(frame)[5]
+                if respcode:
+                    failed = response_codes.get(respcode, respcode)
+                    failures[failed] = failures.get(failed, 0) + 1
+                if pending is not None:
+                    round_trips.record(timestamp - pending)
+                    pending = None
+        return {'path': self.path, 'duration_s': 0. if first is None else last - first, 'sent': sent, 'teststates': teststates,
+                'failures': failures, 'round_trip': round_trips.snapshot(), 'longest_gap_s': longest_gap}
+
+
+def summarizeJournals(paths):
+    """
+    Summarize many journals, e.g. every session in the data folder, to look for anomalies.
+
+    Returns:
+        list: MedocJournalReader.summary() for each path
+    """
+    summaries = []
+    for path in paths:
+        reader = MedocJournalReader(path)
+        summaries.append(reader.summary())
+        reader.close()
+    return summaries
+
 # converter from bytes to int:
 def intToBytes(integer, nbytes):
     return integer.to_bytes(nbytes, byteorder='big')
@@ -72,82 +485,163 @@ def intToBytes(integer, nbytes):
 def intFromBytes(xbytes):
     return int.from_bytes(xbytes, 'big')
 
-# packs bytes together
-def commandBuilder(command, parameter=None):
+# a response frame is a 4-byte length header followed by at least the 18 status bytes decoded by medocResponse
+response_header_length = 4
+min_response_length = 18
+max_response_length = 4096
+
+def responseLength(header):
+    """
+    Number of response bytes that follow a 4-byte response header.
+    medocResponse reads the header little-endian; fall back to big-endian (the order commandBuilder writes) if that isn't a plausible length.
+
+    Raises:
+        MedocFramingError: if neither byte order gives a plausible length
+    """
+    length = int.from_bytes(header, 'little')
+    if not min_response_length <= length <= max_response_length:
+        length = int.from_bytes(header, 'big')
+        if not min_response_length <= length <= max_response_length:
+            raise MedocFramingError("Corrupt MMS response: header %s announces %d bytes, expected %d-%d"
+                                    % (bytes(header).hex(), int.from_bytes(header, 'little'), min_response_length, max_response_length))
+    return length
+
+# precompiled frame layouts:
+# a command is a big-endian 4-byte length, 4-byte timestamp and 1-byte command id, optionally followed by a 4-byte parameter
+# in the byte order socket.htonl() gives on our (little-endian) stimulus PCs
+_command_header = struct.Struct('>IIB')
+_command_parameter = struct.Struct('<I')
+_command_timestamp = struct.Struct('>I')
+# a response is the 4-byte length, 4-byte timestamp, command, state, test state, response code, test time (ms), temperature (1/100 °C), CoVAS, yes, no
+_response_fields = struct.Struct('<H2x4sBBBHIhBBB')
+
+@functools.lru_cache(maxsize=512, typed=True)
+def _commandTemplate(command, parameter):
+    """
+    The frame for (command, parameter) with a zero timestamp. Cached, since a session only ever sends a handful of distinct commands.
+    """
     if type(command) is str:
         command = command_to_id[command.upper()]
     if type(parameter) is str:
         # then program code, e.g. '00000001'
         parameter = int(parameter, 2)   # Convert to a binary integer (base 2)
     elif type(parameter) is float:
-        parameter = 100*parameter
-#    commandbytes = intToBytes(socket.htons(int(time())), 4)
-    commandbytes = intToBytes(int(time()), 4)
-    commandbytes += intToBytes(int(command), 1)
+        parameter = int(round(100*parameter))
     if parameter:
-        # commandbytes += intToBytes(socket.htonl(int(parameter)), 4) # Append a 4-byte command to the end
-        commandbytes += intToBytes(socket.htonl(parameter), 4) # Append a 4-byte command to the end
-#        commandbytes += intToBytes(int(parameter), 4)
-    return intToBytes(len(commandbytes), 4) + commandbytes # A byte string consisting of 4(length)+
+        frame = bytearray(_command_header.size + _command_parameter.size)
+        _command_parameter.pack_into(frame, _command_header.size, int(parameter))
+    else:
+        frame = bytearray(_command_header.size)
     # prepending the command data with 4-bytes header that indicates the command data length
+    _command_header.pack_into(frame, 0, len(frame) - 4, 0, int(command))
+    return bytes(frame)
+
+# packs bytes together
+def commandBuilder(command, parameter=None):
+    """
+    Build the frame for a command, e.g. commandBuilder('select_tp', 140). Only the timestamp is filled in per call.
+    """
+    frame = bytearray(_commandTemplate(command, parameter))
+    _command_timestamp.pack_into(frame, 4, int(time()))
+    return bytes(frame)
+
+def _attemptTimeout(timeout, deadline):
+    """Socket timeout for one retry attempt: timeout, cut short so the attempt can't outlast the retry deadline (a perf_counter() time)."""
+    remaining = deadline - perf_counter()
+    if remaining <= 0:
+        raise socket.timeout("retry deadline reached")
+    return min(timeout, remaining)
 
 # command sender:
-def sendCommand(command, parameter=None, address=config.address, port=config.port, el=ThermodeEventListener(), verbose=False):
+def sendCommand(command, parameter=None, address=None, port=None, el=ThermodeEventListener(), verbose=False, timeout=5.):
     """
     this functions allows sending commands to the MMS
     e.g. : sendCommand('get_status')
     or sendCommand('select_tp', '01000000')
+    address and port default to config.address and config.port at call time, so they can be changed after import.
+    timeout bounds each connect and read, and is cut short so no attempt runs past config.retry_policy's deadline.
     """
+    if address is None:
+        address = config.address
+    if port is None:
+        port = config.port
     # convert command to bytes:
     commandbytes = commandBuilder(command, parameter=parameter)
     # if config.debug:
     #     print(f'Sending the following bytes: {binascii.hexlify(commandbytes)} -- {len(commandbytes)} bytes')
     # now the connection part:
-    for attemps in range(50):
+    retry_policy = config.retry_policy
+    deadline = perf_counter() + retry_policy.deadline
+    def attempt():
+        s = socket.socket()
         try:
-            s = socket.socket()
+            s.settimeout(_attemptTimeout(timeout, deadline))
+            connecting = perf_counter()
             s.connect((address, port))
-            # s.setblocking(False)    #
-            # s.settimeout(20)
-            # s.setdefaulttimeout(20) 
-            s.send(commandbytes) 
-            # sleep(0.01)
-            data = msg = s.recv(1024)
-            while data:
-                # sleep(0.01)
-                data = s.recv(17)
-#                data = s.recv(34)
-                msg += data
-                resp = medocResponse(msg)
-            if config.debug:
-                # print("Received: ")
-                # print(resp)
-                if (resp.command == 0):
-                    print("Polling while " + resp.teststatestr)
-                else:
-                # if (resp.command != 0):
-                    print("Attempting to " + id_to_command[resp.command] + " while status: " + resp.teststatestr + ". " + resp.respstr)
-            # if (resp.command == 1 and resp.teststatestr == 'IDLE'):
-            #     s.close()
-            #     el.wait_for_seconds(config.timedelayformedoc)
-            #     pass
-            # else:
-            s.close()           # 
-            return resp         # Replaced this break with a return so I can access the response
-        except ConnectionResetError:
-            print("==> ConnectionResetError")
-            attemps += 1
+            metrics.record(commandbytes[8], 'connect', perf_counter() - connecting)
+            # read exactly the length the response header announces, rather than until the MMS closes the socket
+            return transact(MedocFrameReader(s), commandbytes)
+        finally:
+            s.close()
+    try:
+        # a reset MMS is woken up by a single status request (no longer a recursive sendCommand(0))
+        resp = retry_policy.run(attempt, wake=lambda: wakeUp(address, port, deadline=deadline), wait=el.wait_for_seconds)
+    except MedocConnectionError as err:
+        print("==> " + str(err))
+        return None
+    if config.debug:
+        printResponse(resp)
+    return resp
+
+def wakeUp(address=None, port=None, timeout=1., deadline=None):
+    """
+    Send a single GET_STATUS over a fresh connection and ignore the outcome. This bizarrely wakes the MMS up again after a connection reset.
+    Never retries, so it can be called from inside a retry loop.
+    timeout bounds the connect and the read together; pass the retry loop's deadline (a perf_counter() time) so the probe can't outlast it.
+    """
+    if deadline is None:
+        deadline = perf_counter() + timeout
+    try:
+        s = socket.create_connection((config.address if address is None else address, config.port if port is None else port), timeout=_attemptTimeout(timeout, deadline))
+        try:
+            s.settimeout(_attemptTimeout(timeout, deadline))
+            s.sendall(commandBuilder('GET_STATUS'))
+            MedocFrameReader(s).read()
+        finally:
             s.close()
-            sendCommand(0) # This bizarrely wakes it up again for some reason.
-            # s.close()
-            # el.wait_for_seconds(config.timedelayformedoc)
-            # sleep(0.5)
-            pass
-        el.wait_for_seconds(config.timedelayformedoc)
-        # sleep(0.1)         #
-        # removed return statement because it is prematurely instantiated.
+    except (ConnectionError, OSError):
+        pass
 
-def poll_for_change(desired_value,poll_interval=config.timedelayformedoc,poll_max=20,verbose=False,server_lag=1.,reuse_socket=False):
+def transact(reader, commandbytes):
+    """
+    Send a command frame over a MedocFrameReader's socket and read the response, recording send, first_byte and response latencies in metrics.
+    """
+    command = commandbytes[8]
+    journal = config.journal
+    if journal is not None:
+        journal.record(MedocJournal.SENT, commandbytes)
+    start = perf_counter()
+    reader.sock.sendall(commandbytes)
+    sent = perf_counter()
+    resp = reader.read()
+    done = perf_counter()
+    if journal is not None:
+        journal.record(MedocJournal.RECEIVED, resp.response)
+    metrics.record(command, 'send', sent - start)
+    metrics.record(command, 'first_byte', reader.first_byte_time - sent)
+    metrics.record(command, 'response', done - start)
+    return resp
+
+def printResponse(resp):
+    """
+    Print a one-line summary of a response, as shown when config.debug is on.
+    """
+    if (resp.command == 0):
+        print("Polling while " + resp.teststatestr)
+    else:
+        print("Attempting to " + id_to_command[resp.command] + " while status: " + resp.teststatestr + ". " + resp.respstr)
+
+def poll_for_change(desired_value,poll_interval=config.timedelayformedoc,poll_max=20,verbose=False,server_lag=1.,reuse_socket=False,client=None):
     """
     Poll system for a value change. Useful for waiting until the Medoc system has transitioned to a specific state in order to issue another command, but the transition length is unknowable.
 
@@ -158,7 +652,8 @@ def poll_for_change(desired_value,poll_interval=config.timedelayformedoc,poll_ma
         poll_max (int): upper limit on polling attempts; default -1 (unlimited)
         verbose (bool): print poll attempt number and current state
         server_lag (float): sometimes if the socket connection is pinged too quickly after a value change the subsequent command after this method is called can get missed. This adds an additional layer of timing delay before returning from this method to prevent this; default 1s
-        reuse_socket (bool): try to reuse the last created socket connection; *NOT CURRENTLY FUNCTIONAL*
+        reuse_socket (bool): try to reuse the last created socket connection; *NOT CURRENTLY FUNCTIONAL*, pass a MedocClient as client instead
+        client (MedocClient): send GET_STATUS over this client's persistent connection instead of opening a new socket per poll; default None
 
     Returns:
         status (bool): whether desired_value was achieved
@@ -166,11 +661,15 @@ def poll_for_change(desired_value,poll_interval=config.timedelayformedoc,poll_ma
     """
     val = ''
     count = 1
+    polling = perf_counter()
     while val != desired_value:
         if verbose:
             print(("Poll: {}".format(str(count))))
-        response = sendCommand('GET_STATUS')
-        if response.teststatestr:
+        if client is not None:
+            response = client.sendCommand('GET_STATUS')
+        else:
+            response = sendCommand('GET_STATUS')
+        if response is not None and response.teststatestr:
             val = response.teststatestr
         else:
             val = 'RESPONSE_FORMAT_ERROR'
@@ -178,54 +677,1310 @@ def poll_for_change(desired_value,poll_interval=config.timedelayformedoc,poll_ma
             print(("Current value: {}".format(val)))
         sleep(poll_interval)
         count += 1
+        metrics.count('polls')
         if poll_max > 0 and count > poll_max:
             print("Polling limit exceeded")
+            metrics.recordPoll(perf_counter() - polling)
             return False
     sleep(server_lag)
+    metrics.recordPoll(perf_counter() - polling)
     return True
 
+class MedocFrameReader():
+    """
+    Reads length-prefixed MMS responses from a socket: the 4-byte header, then exactly the number of bytes it announces,
+    into a buffer reused across reads, decoding each response once. Doesn't rely on the MMS closing the socket to end a read.
+    """
+    def __init__(self, sock):
+        self.sock = sock
+        self._buffer = bytearray(response_header_length + max_response_length)
+        self._view = memoryview(self._buffer)
+        self.first_byte_time = None     # perf_counter() time the last response's header arrived
+
+    def _fill(self, start, stop):
+        while start < stop:
+            nbytes = self.sock.recv_into(self._view[start:stop])
+            if not nbytes:
+                raise ConnectionResetError("MMS closed the connection")
+            start += nbytes
+
+    def read(self):
+        """
+        Returns:
+            medocResponse: the next response on the socket
+
+        Raises:
+            ConnectionResetError: if the MMS closed the connection
+            MedocFramingError: if the response header announces an impossible length
+        """
+        self._fill(0, response_header_length)
+        self.first_byte_time = perf_counter()
+        end = response_header_length + responseLength(self._view[:response_header_length])
+        self._fill(response_header_length, end)
+        return medocResponse(bytes(self._view[:end]))
+
+    def close(self):
+        self.sock.close()
+
+class MedocClient():
+    """
+    A persistent connection to the MMS, so that each command costs one round trip instead of a TCP handshake plus a round trip.
+    Sockets are kept open in a small pool; concurrent callers (e.g. a polling thread and the trial loop) each borrow their own.
+    A socket the MMS has reset or closed is discarded and the command is resent over a fresh connection, following config.retry_policy.
+    e.g. : client = MedocClient()
+           client.sendCommand('select_tp', thermode_temp2program['47'])
+           client.poll_for_change('RUNNING')
+           client.sendCommand('trigger')
+           client.close()
+    """
+    def __init__(self, address=None, port=None, pool_size=2, timeout=5., retry_policy=None):
+        """
+        Args:
+            address (str): MMS hostName (IP); defaults to config.address
+            port (int): MMS port; defaults to config.port
+            pool_size (int): maximum number of sockets held open at once; default 2
+            timeout (float): seconds to wait on connect/recv before treating the connection as dead; default 5s
+            retry_policy (RetryPolicy): how to retry failed round trips; defaults to config.retry_policy
+        """
+        self.address = config.address if address is None else address
+        self.port = config.port if port is None else port
+        self.timeout = timeout
+        self.retry_policy = retry_policy
+        self._pool = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(pool_size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _connect(self, command=None, timeout=None):
+        connecting = perf_counter()
+        s = socket.create_connection((self.address, self.port), timeout=self.timeout if timeout is None else timeout)
+        if command is not None:
+            metrics.record(command, 'connect', perf_counter() - connecting)
+        # commands are tiny; don't let Nagle hold them back waiting for more data
+        s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return MedocFrameReader(s)
+
+    def _acquire(self, command=None, timeout=None):
+        self._slots.acquire()
+        try:
+            while True:
+                try:
+                    conn = self._pool.get_nowait()
+                except queue.Empty:
+                    return self._connect(command, timeout)
+                # an idle socket should have nothing to read; if it does, the MMS closed or reset it
+                if select.select([conn.sock], [], [], 0)[0]:
+                    conn.close()
+                    continue
+                conn.sock.settimeout(self.timeout if timeout is None else timeout)
+                return conn
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _release(self, conn, discard=False):
+        if discard:
+            conn.close()
+        else:
+            self._pool.put(conn)
+        self._slots.release()
+
+    def sendCommand(self, command, parameter=None, echo=True):
+        """
+        Same as the module-level sendCommand, but over a pooled, persistent connection.
+        e.g. : client.sendCommand('get_status')
+        or client.sendCommand('select_tp', '01000000')
+
+        Args:
+            echo (bool): print the response when config.debug is on; default True. Background samplers pass False, so they don't
+                         print a line per sample
+
+        Raises:
+            MedocConnectionError: if the retry policy gives up on reaching the MMS
+        """
+        commandbytes = commandBuilder(command, parameter=parameter)
+        retry_policy = config.retry_policy if self.retry_policy is None else self.retry_policy
+        deadline = perf_counter() + retry_policy.deadline
+        def attempt():
+            # each attempt gets the client's timeout, or whatever is left before the deadline if that's less
+            conn = self._acquire(commandbytes[8], _attemptTimeout(self.timeout, deadline))
+            try:
+                resp = transact(conn, commandbytes)
+            except BaseException:
+                self._release(conn, discard=True)
+                raise
+            self._release(conn)
+            return resp
+        resp = retry_policy.run(attempt, wake=lambda: wakeUp(self.address, self.port, deadline=deadline))
+        if echo and config.debug:
+            printResponse(resp)
+        return resp
+
+    def poll_for_change(self, desired_value, **kwargs):
+        """
+        Same as the module-level poll_for_change, polling over this client's connection. Takes the same keyword arguments.
+        """
+        return poll_for_change(desired_value, client=self, **kwargs)
+
+    def close(self):
+        """
+        Close every idle pooled socket.
+        """
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+class MedocPipeline():
+    """
+    Sends commands back-to-back over one dedicated connection without waiting for each response, so a burst of N commands
+    (e.g. VAS, T_DOWN, VAS, T_UP) costs one round trip instead of N. Each command returns a concurrent.futures.Future resolving to
+    its medocResponse. A reader thread matches responses to outstanding commands by command id and timestamp, oldest first.
+    Pipelined commands are not resent: T_UP/T_DOWN aren't idempotent, so if the connection drops the outstanding futures fail with
+    MedocConnectionError and the next submit reconnects.
+    Needs an MMS that keeps the connection open between responses. One that closes it after each response (as MedocSimulator does
+    by default) answers only the first command of a burst, and the rest fail with MedocConnectionError; use a MedocClient there.
+    e.g. : with MedocPipeline() as pipeline:
+               futures = pipeline.submitMany([('vas', 4), ('t_down', 500), ('vas', 7), ('t_up', 500)])
+               responses = [f.result() for f in futures]
+    """
+    def __init__(self, address=None, port=None, timeout=5.):
+        """
+        Args:
+            address (str): MMS hostName (IP); defaults to config.address
+            port (int): MMS port; defaults to config.port
+            timeout (float): seconds to wait on connect before giving up; default 5s
+        """
+        self.address = config.address if address is None else address
+        self.port = config.port if port is None else port
+        self.timeout = timeout
+        self._lock = threading.Lock()          # guards _conn and _pending, shared with the reader thread
+        self._send_lock = threading.Lock()     # keeps bursts whole and in the order their commands were added to _pending
+        self._conn = None
+        self._pending = []     # [command id, timestamp bytes, perf_counter() time sent, Future] on self._conn, in the order sent
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _connect(self, command):
+        connecting = perf_counter()
+        try:
+            s = socket.create_connection((self.address, self.port), timeout=self.timeout)
+        except OSError as err:
+            # refused, timed out, unroutable or unresolvable (socket.gaierror)
+            metrics.count('failures')
+            raise MedocConnectionError("Couldn't connect to the MMS at %s:%d: %r" % (self.address, self.port, err)) from err
+        metrics.record(command, 'connect', perf_counter() - connecting)
+        s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # the reader thread blocks until the next response or until close() shuts the socket down
+        s.settimeout(None)
+        conn = MedocFrameReader(s)
+        # each connection has its own outstanding list, so a dying reader can't fail commands sent on its replacement
+        self._pending = []
+        threading.Thread(target=self._run, args=(conn, self._pending), name='MedocPipeline', daemon=True).start()
+        return conn
+
+    def _match(self, pending, resp):
+        with self._lock:
+            for i, (command, timestamp, sent, future) in enumerate(pending):
+                if command == resp.command and timestamp == resp._timestamp:
+                    break
+            else:
+                # the MMS stamps responses with its own clock; fall back to the oldest command of the same type, then the oldest
+                i = next((i for i, outstanding in enumerate(pending) if outstanding[0] == resp.command), 0 if pending else None)
+                if i is None:
+                    return None
+            command, timestamp, sent, future = pending.pop(i)
+        metrics.record(command, 'response', perf_counter() - sent)
+        return future
+
+    def _run(self, conn, pending):
+        journal = config.journal
+        try:
+            while True:
+                resp = conn.read()
+                if journal is not None:
+                    journal.record(MedocJournal.RECEIVED, resp.response)
+                future = self._match(pending, resp)
+                if future is not None:
+                    future.set_result(resp)
+                    if config.debug:
+                        printResponse(resp)
+        except Exception as err:
+            # whatever ends the reader, the commands waiting on it must fail rather than hang
+            self._fail(conn, pending, err)
+
+    def _fail(self, conn, pending, err):
+        with self._lock:
+            if self._conn is conn:
+                self._conn = None
+            failed = pending[:]
+            del pending[:]
+        conn.close()
+        if failed:
+            metrics.count('failures')
+        for command, timestamp, sent, future in failed:
+            future.set_exception(MedocConnectionError("Connection to the MMS lost with %s outstanding: %r" % (id_to_command.get(command, command), err)))
+
+    def submitMany(self, commands):
+        """
+        Write several commands in a single send.
+
+        Args:
+            commands (list): commands as names, or (command, parameter) pairs; parameters as for sendCommand
+
+        Returns:
+            list: a concurrent.futures.Future per command, each resolving to its medocResponse
+
+        Raises:
+            MedocConnectionError: if the MMS can't be reached
+        """
+        if not commands:
+            return []
+        frames = [commandBuilder(*((command,) if isinstance(command, (str, int)) else command)) for command in commands]
+        futures = [concurrent.futures.Future() for _ in frames]
+        with self._send_lock:
+            with self._lock:
+                if self._conn is None:
+                    self._conn = self._connect(frames[0][8])
+                conn = self._conn
+                pending = self._pending
+                sent = perf_counter()
+                for commandbytes, future in zip(frames, futures):
+                    pending.append([commandbytes[8], commandbytes[4:8], sent, future])
+            journal = config.journal
+            if journal is not None:
+                for commandbytes in frames:
+                    journal.record(MedocJournal.SENT, commandbytes)
+            # send without holding _lock: a burst that fills the socket buffer waits for the reader thread to drain responses, and the reader needs _lock to match them
+            try:
+                conn.sock.sendall(b''.join(frames))
+            except OSError as err:
+                self._fail(conn, pending, err)
+        return futures
+
+    def submit(self, command, parameter=None):
+        """
+        Write one command without waiting for the response.
+        e.g. : future = pipeline.submit('t_up', 100)
+
+        Returns:
+            concurrent.futures.Future: resolves to the command's medocResponse
+        """
+        return self.submitMany([(command, parameter)])[0]
+
+    def sendCommand(self, command, parameter=None, timeout=5.):
+        """
+        Submit one command and wait for its response, so a pipeline can stand in for a MedocClient.
+
+        Args:
+            timeout (float): seconds to wait for the response; default 5s
+
+        Raises:
+            socket.timeout: if the response doesn't arrive in time, as for a MedocClient
+        """
+        try:
+            return self.submit(command, parameter).result(timeout)
+        except concurrent.futures.TimeoutError as err:
+            raise socket.timeout("no response to %s within %gs" % (id_to_command.get(command, command), timeout)) from err
+
+    def close(self):
+        """
+        Close the connection; commands still outstanding fail with MedocConnectionError.
+        """
+        with self._lock:
+            conn, pending = self._conn, self._pending
+        if conn is not None:
+            try:
+                conn.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._fail(conn, pending, ConnectionAbortedError("pipeline closed"))
+
+class MedocStatusMonitor():
+    """
+    Polls GET_STATUS on a background thread and keeps the latest medocResponse for any caller, so waiting for a state change
+    costs at most one poll interval plus a learned settle delay, instead of poll_for_change's poll_interval sleeps plus a fixed server_lag.
+    All callers share one status stream rather than each polling the MMS.
+    e.g. : monitor = MedocStatusMonitor(client).start()
+           monitor.sendCommand('select_tp', thermode_temp2program['47'])
+           monitor.wait_for('RUNNING')
+           monitor.sendCommand('trigger')
+           monitor.wait_for('IDLE', timeout=30)
+    """
+    # response codes that mean the MMS hadn't settled into the state we waited for
+    state_errors = (2, 3)
+
+    def __init__(self, client=None, poll_rate=10., min_settle=.05, max_settle=1., settle=.1):
+        """
+        Args:
+            client (MedocClient): client to poll and send commands over; defaults to a new MedocClient()
+            poll_rate (float): GET_STATUS polls per second; default 10
+            min_settle (float): shortest settle delay wait_for will learn; default .05s
+            max_settle (float): longest settle delay (the old fixed server_lag); default 1s
+            settle (float): settle delay to start from; a command rejected for coming too soon doubles it and is resent, so starting
+                            low costs at most one resend instead of a full second on every wait until it is learned; default .1s
+        """
+        self.client = MedocClient() if client is None else client
+        self.interval = 1. / poll_rate
+        self.min_settle = min_settle
+        self.max_settle = max_settle
+        self.settle = min(max(settle, min_settle), max_settle)
+        self.latest = None              # the most recent medocResponse
+        self.latest_time = None         # perf_counter() time it was received
+        self.changed_time = None        # perf_counter() time the test state last changed
+        self._condition = threading.Condition()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='MedocStatusMonitor', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _update(self, resp):
+        now = perf_counter()
+        with self._condition:
+            if self.latest is None or resp.teststate != self.latest.teststate:
+                self.changed_time = now
+            self.latest = resp
+            self.latest_time = now
+            self._condition.notify_all()
+
+    def _run(self):
+        next_poll = perf_counter()
+        while not self._stopped.is_set():
+            try:
+                self._update(self.client.sendCommand('GET_STATUS', echo=False))
+            except Exception as err:
+                # anything from an unreachable host to a malformed frame: keep serving the last known status, the next poll tries again,
+                # and waiters keep waiting for a good status instead of for a thread that has died
+                metrics.count('monitor_errors')
+                print("==> Status monitor: %s: %s" % (type(err).__name__, err))
+            next_poll += self.interval
+            # don't try to catch up on polls missed while the MMS was slow
+            next_poll = max(next_poll, perf_counter())
+            self._stopped.wait(next_poll - perf_counter())
+
+    def status(self):
+        """
+        Returns:
+            medocResponse: the most recent status, without contacting the MMS
+        """
+        with self._condition:
+            return self.latest
+
+    def wait_for(self, test_state, timeout=None):
+        """
+        Block until a status received after this call has the given test state, then until the learned settle delay has passed since the change.
+
+        Args:
+            test_state (str): the test state to wait for, e.g. 'RUNNING' or 'IDLE'
+            timeout (float): seconds to wait for the state; default None (wait indefinitely)
+
+        Returns:
+            status (bool): whether test_state was reached before the timeout
+        """
+        called = perf_counter()
+        with self._condition:
+            reached = self._condition.wait_for(lambda: self.latest_time is not None and self.latest_time >= called
+                                               and self.latest.teststatestr == test_state, timeout)
+            changed_time = self.changed_time
+        if not reached:
+            print("Timed out waiting for " + test_state)
+            return False
+        # time already spent since the change counts toward the settle delay
+        remaining = changed_time + self.settle - perf_counter()
+        if remaining > 0:
+            sleep(remaining)
+        return True
+
+    def sendCommand(self, command, parameter=None):
+        """
+        Send a command over the monitor's client, update the cached status from its response, and learn the settle delay from whether it was accepted.
+        A command rejected for being sent in the wrong state shortly after a state change is resent once after the (now longer) settle delay.
+        """
+        resp = self.client.sendCommand(command, parameter)
+        self._update(resp)
+        since_change = perf_counter() - self.changed_time
+        if resp.respcode in self.state_errors and since_change < self.max_settle:
+            self.settle = min(self.max_settle, 2 * self.settle)
+            sleep(max(0., self.settle - since_change))
+            resp = self.client.sendCommand(command, parameter)
+            self._update(resp)
+        elif resp.respcode == 0:
+            self.settle = max(self.min_settle, .8 * self.settle)
+        return resp
+
+class ThermodeTrialScheduler():
+    """
+    Runs a heat run's trials with each trial's program selected ahead of time, so TRIGGER goes out the moment the trial onset arrives
+    instead of after SELECT_TP and the MMS's transition to RUNNING.
+    The whole run's temperatures are compiled to program codes up front; prefetch() then selects the next program in the background
+    while the current rating/ISI is still on screen.
+    e.g. : scheduler = ThermodeTrialScheduler([47, 48, 46.5], thermode_temp2program, monitor=monitor)
+           for trial in range(len(scheduler)):
+               scheduler.prefetch()                                    # as the ISI/rating screen starts
+               showFixation(win, "ISI", time=isi)
+               scheduler.trigger(onset=onsets[trial], clock=globalClock) # fires at onset, program already RUNNING
+    """
+    def __init__(self, temperatures, temp2program, client=None, monitor=None, ready_timeout=30., poll_interval=config.timedelayformedoc, server_lag=1.):
+        """
+        Args:
+            temperatures (list): the run's temperatures in °C, in trial order
+            temp2program (dict): temperature -> MMS program code, e.g. thermode_temp2program; keys may be numbers or strings like '47.5'
+            client (MedocClient): client to send commands over; defaults to the monitor's client, or a new MedocClient()
+            monitor (MedocStatusMonitor): wait for state changes with this monitor instead of poll_for_change; recommended
+            ready_timeout (float): seconds from prefetch() for the program to be selected and RUNNING, covering both state waits; default 30s
+            poll_interval (float): poll_interval for poll_for_change when no monitor is given
+            server_lag (float): server_lag for poll_for_change when no monitor is given; default 1s
+        """
+        self.temperatures = list(temperatures)
+        self.programs = [self.compile(temp, temp2program) for temp in self.temperatures]
+        self.monitor = monitor
+        if client is None:
+            client = monitor.client if monitor is not None else MedocClient()
+        self.client = client
+        self.ready_timeout = ready_timeout
+        self.poll_interval = poll_interval
+        self.server_lag = server_lag
+        self.index = 0                  # the trial the next trigger() fires
+        self.trigger_times = []         # clock time each TRIGGER was sent
+        self._pending = None
+        self._deadline = None           # perf_counter() time the pending prefetch must be RUNNING by
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='ThermodeTrialScheduler')
+
+    def __len__(self):
+        return len(self.programs)
+
+    @staticmethod
+    def compile(temp, temp2program):
+        """
+        Look up the program code for a temperature, accepting 47, 47.0 or '47' for a key of '47'.
+        """
+        for key in (temp, '%g' % float(temp), str(temp)):
+            if key in temp2program:
+                return temp2program[key]
+        raise KeyError("No thermode program configured for %s°C" % temp)
+
+    def _send(self, command, parameter=None):
+        if self.monitor is not None:
+            return self.monitor.sendCommand(command, parameter)
+        return self.client.sendCommand(command, parameter)
+
+    def _waitFor(self, test_state, deadline):
+        remaining = deadline - perf_counter()
+        if remaining <= 0:
+            reached = False
+        elif self.monitor is not None:
+            reached = self.monitor.wait_for(test_state, timeout=remaining)
+        else:
+            # as many polls as fit before the deadline, so an MMS stuck in another state can't hold the run forever
+            poll_max = max(1, int(np.ceil(remaining / self.poll_interval)))
+            reached = poll_for_change(test_state, poll_interval=self.poll_interval, server_lag=self.server_lag, poll_max=poll_max, client=self.client)
+        if not reached:
+            raise MedocConnectionError("MMS didn't reach %s within %gs of the prefetch" % (test_state, self.ready_timeout))
+
+    def _select(self, program, deadline):
+        # both waits share the one deadline trigger() waits for, so the whole select fits in ready_timeout
+        # the previous stimulation may still be ramping down
+        self._waitFor('IDLE', deadline)
+        resp = self._send('SELECT_TP', program)
+        self._waitFor('RUNNING', deadline)
+        return resp
+
+    def prefetch(self):
+        """
+        Start selecting the next trial's program in the background and return immediately. Call as soon as the previous trial's TRIGGER is out.
+
+        Returns:
+            concurrent.futures.Future: resolves to the SELECT_TP medocResponse once the MMS is RUNNING (waiting for TRIGGER)
+        """
+        if self._pending is None:
+            self._deadline = perf_counter() + self.ready_timeout
+            self._pending = self._executor.submit(self._select, self.programs[self.index], self._deadline)
+        return self._pending
+
+    def trigger(self, onset=None, clock=None):
+        """
+        Fire the next trial. Waits for its prefetch (starting one if prefetch() wasn't called), then for onset, then sends TRIGGER.
+
+        Args:
+            onset (float): time on clock at which to send TRIGGER; default None (send as soon as the program is ready)
+            clock (psychopy.core.Clock): clock onset is measured on, e.g. globalClock; anything with getTime(). Required with onset
+
+        Returns:
+            medocResponse: the response to TRIGGER
+
+        Raises:
+            ValueError: if onset is given without a clock
+            MedocConnectionError: if the program wasn't selected and RUNNING within ready_timeout of its prefetch
+        """
+        if onset is not None and clock is None:
+            raise ValueError("trigger(onset=...) needs the clock onset is measured on")
+        pending = self.prefetch()
+        try:
+            pending.result(max(0., self._deadline - perf_counter()))
+        except concurrent.futures.TimeoutError as err:
+            # still selecting: keep it, so the next prefetch() or trigger() waits on it rather than queueing a second SELECT_TP behind it.
+            # Its waits end at the same deadline, so it fails on its own shortly after
+            if pending.cancel():
+                self._pending = None
+            raise MedocConnectionError("Trial %d's program wasn't ready within %gs" % (self.index + 1, self.ready_timeout)) from err
+        except BaseException:
+            # a failed prefetch isn't reused: the next prefetch() or trigger() selects the program again
+            self._pending = None
+            raise
+        self._pending = None
+        if onset is not None:
+            # sleep most of the way, then spin for the last couple of milliseconds
+            remaining = onset - clock.getTime()
+            if remaining > .002:
+                sleep(remaining - .002)
+            while clock.getTime() < onset:
+                pass
+        if clock is not None:
+            self.trigger_times.append(clock.getTime())
+        resp = self._send('TRIGGER')
+        self.index += 1
+        return resp
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+class ThermodeCalibration():
+    """
+    A QUEST+ style adaptive calibration. Keeps a posterior over the participant's pain threshold and psychometric slope on a NumPy
+    grid and picks each next temperature to minimize the expected entropy of that posterior, so a stable threshold needs fewer heat trials
+    than stepping through every program. Candidate temperatures are the configured programs by default; next() maps the chosen
+    temperature to the nearest program. Each update or pick is a handful of array operations, well under a millisecond.
+    The psychometric function is p(painful) = guess + (1 - guess - lapse) / (1 + exp(-slope * (temp - threshold))).
+    e.g. : calibration = ThermodeCalibration(thermode_temp2program)
+           while not calibration.converged():
+               temp, program = calibration.next()
+               ... select_tp program, trigger, wait ...
+               trial = showRatingScale(win, "Pain", "How painful was that?", unipolarImg, type="unipolar")
+               calibration.update(temp, trial['value'])
+           print(calibration.estimate())
+    """
+    def __init__(self, temp2program, temperatures=None, thresholds=np.arange(40., 50.05, .1), slopes=np.geomspace(.5, 10., 20),
+                 guess=.02, lapse=.02, criterion=0., max_trials=30, min_trials=6, tolerance=.3):
+        """
+        Args:
+            temp2program (dict): temperature -> MMS program code, e.g. thermode_temp2program
+            temperatures (array): temperatures to choose between, in °C; defaults to those in temp2program
+            thresholds (array): grid of thresholds (°C at the curve's midpoint) the posterior covers
+            slopes (array): grid of slopes (per °C) the posterior covers
+            guess (float): chance of reporting pain below threshold; default .02
+            lapse (float): chance of not reporting pain well above threshold; default .02
+            criterion (float): ratings above this count as painful, e.g. 0 on the unipolar scale; default 0
+            max_trials (int): converged() after this many trials regardless; default 30
+            min_trials (int): don't declare convergence before this many trials; default 6
+            tolerance (float): converged() once the threshold's posterior SD is below this, in °C; default .3
+        """
+        self.temp2program = temp2program
+        if temperatures is None:
+            temperatures = sorted(float(temp) for temp in temp2program)
+        self.temperatures = np.asarray(temperatures, dtype=float)
+        self.programs = [self._nearestProgram(temp) for temp in self.temperatures]
+        self.thresholds = np.asarray(thresholds, dtype=float)
+        self.slopes = np.asarray(slopes, dtype=float)
+        self.criterion = criterion
+        self.max_trials = max_trials
+        self.min_trials = min_trials
+        self.tolerance = tolerance
+        # p(painful | temperature, threshold, slope) for every combination, computed once: shape (temperatures, thresholds, slopes)
+        distance = self.temperatures[:, None, None] - self.thresholds[None, :, None]
+        self.likelihood = guess + (1. - guess - lapse) / (1. + np.exp(-self.slopes[None, None, :] * distance))
+        self.posterior = np.full((len(self.thresholds), len(self.slopes)), 1. / (len(self.thresholds) * len(self.slopes)))
+        self.history = []       # (temperature, painful) per trial
+
+    def _nearestProgram(self, temp):
+        keys = list(self.temp2program)
+        nearest = min(keys, key=lambda key: abs(float(key) - temp))
+        return self.temp2program[nearest]
+
+    def _index(self, temp):
+        return int(np.abs(self.temperatures - temp).argmin())
+
+    @staticmethod
+    def _entropy(p):
+        return -np.sum(np.where(p > 0, p * np.log(np.where(p > 0, p, 1.)), 0.), axis=(-2, -1))
+
+    def next(self):
+        """
+        Returns:
+            (float, int): the most informative next temperature and its program code
+        """
+        joint = self.likelihood * self.posterior                 # p(painful, threshold, slope | temperature)
+        p_pain = joint.sum(axis=(1, 2))
+        miss = self.posterior - joint                            # p(not painful, threshold, slope | temperature)
+        expected = p_pain * self._entropy(joint / p_pain[:, None, None]) + \
+            (1. - p_pain) * self._entropy(miss / (1. - p_pain)[:, None, None])
+        best = int(expected.argmin())
+        return float(self.temperatures[best]), self.programs[best]
+
+    def update(self, temp, response):
+        """
+        Fold one trial into the posterior.
+
+        Args:
+            temp (float): temperature delivered, in °C; snapped to the nearest candidate
+            response (bool or float): whether it was painful, or a rating compared with criterion, e.g. showRatingScale(...)['value']
+        """
+        painful = bool(response) if isinstance(response, (bool, np.bool_)) else response > self.criterion
+        likelihood = self.likelihood[self._index(temp)]
+        self.posterior *= likelihood if painful else 1. - likelihood
+        self.posterior /= self.posterior.sum()
+        self.history.append((float(temp), painful))
+
+    def estimate(self):
+        """
+        Returns:
+            dict: posterior mean and SD of threshold and slope, and the number of trials so far
+        """
+        threshold_marginal = self.posterior.sum(axis=1)
+        slope_marginal = self.posterior.sum(axis=0)
+        threshold = float(threshold_marginal @ self.thresholds)
+        slope = float(slope_marginal @ self.slopes)
+        return {'threshold': threshold, 'threshold_sd': float(np.sqrt(threshold_marginal @ (self.thresholds - threshold) ** 2)),
+                'slope': slope, 'slope_sd': float(np.sqrt(slope_marginal @ (self.slopes - slope) ** 2)), 'trials': len(self.history)}
+
+    def temperatureFor(self, probability=.5):
+        """
+        The temperature the current estimate predicts is rated painful with this probability, e.g. to pick each participant's stimuli.
+        """
+        estimate = self.estimate()
+        return estimate['threshold'] + np.log(probability / (1. - probability)) / estimate['slope']
+
+    def converged(self):
+        trials = len(self.history)
+        if trials >= self.max_trials:
+            return True
+        return trials >= self.min_trials and self.estimate()['threshold_sd'] < self.tolerance
+
+class ThermodeGroup():
+    """
+    Controls several MMS units at once, e.g. for bilateral or multi-body-site designs.
+    Commands fan out to every unit in parallel; trigger() releases all TRIGGERs together and reports the inter-device skew.
+    e.g. : thermodes = ThermodeGroup([('10.64.1.10', 20121), ('10.64.1.11', 20121)])
+           thermodes.select_tp([thermode_temp2program['47'], thermode_temp2program['45']])
+           thermodes.poll_for_change('RUNNING')
+           responses = thermodes.trigger()
+           print(thermodes.skews[-1])
+    """
+    def __init__(self, endpoints, pool_size=2):
+        """
+        Args:
+            endpoints (list): one (address, port) tuple or MedocClient per MMS
+            pool_size (int): pool_size of the MedocClients created for (address, port) endpoints; default 2
+        """
+        self.clients = [endpoint if isinstance(endpoint, MedocClient) else MedocClient(*endpoint, pool_size=pool_size) for endpoint in endpoints]
+        self.skews = []                 # seconds between the first and last TRIGGER send, per trigger()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(self.clients), thread_name_prefix='ThermodeGroup')
+
+    def __len__(self):
+        return len(self.clients)
+
+    def _perDevice(self, values):
+        if isinstance(values, (list, tuple)):
+            if len(values) != len(self.clients):
+                raise ValueError("Expected one value per thermode (%d), got %d" % (len(self.clients), len(values)))
+            return list(values)
+        return [values] * len(self.clients)
+
+    def sendCommand(self, command, parameters=None):
+        """
+        Send a command to every unit in parallel.
+
+        Args:
+            command (str or int): the command, as for sendCommand
+            parameters: one parameter for every unit, or a list with one per unit
+
+        Returns:
+            list: the medocResponse from each unit, in endpoint order
+        """
+        return list(self._executor.map(lambda client, parameter: client.sendCommand(command, parameter), self.clients, self._perDevice(parameters)))
+
+    def select_tp(self, programs):
+        """
+        Select a program on every unit in parallel; programs is one code for all units or a list with one per unit.
+        """
+        return self.sendCommand('SELECT_TP', programs)
+
+    def poll_for_change(self, desired_value, **kwargs):
+        """
+        poll_for_change on every unit in parallel; takes the same keyword arguments.
+
+        Returns:
+            status (bool): whether every unit reached desired_value
+        """
+        return all(self._executor.map(lambda client: client.poll_for_change(desired_value, **kwargs), self.clients))
+
+    def _triggerOne(self, client, commandbytes, barrier):
+        # connect (or check the pooled connection) before the barrier, so only the send itself is raced
+        try:
+            conn = client._acquire(commandbytes[8])
+        except BaseException:
+            # release the other units from the barrier instead of leaving them waiting for this one
+            barrier.abort()
+            raise
+        try:
+            barrier.wait()
+        except threading.BrokenBarrierError:
+            client._release(conn)
+            raise
+        journal = config.journal
+        try:
+            if journal is not None:
+                journal.record(MedocJournal.SENT, commandbytes)
+            conn.sock.sendall(commandbytes)
+            sent = perf_counter()
+        except (ConnectionError, socket.timeout) as err:
+            metrics.count(type(err).__name__)
+            client._release(conn, discard=True)
+            # the TRIGGER never left: fall back to the normal retrying path; the late send shows up in the skew
+            sent = perf_counter()
+            return client.sendCommand('TRIGGER'), sent
+        try:
+            resp = conn.read()
+        except (ConnectionError, socket.timeout) as err:
+            metrics.count(type(err).__name__)
+            client._release(conn, discard=True)
+            # the TRIGGER went out and the unit may be heating: sending it again would only be rejected, so report the lost response
+            raise MedocConnectionError("TRIGGER sent but no response: %r" % err) from err
+        if journal is not None:
+            journal.record(MedocJournal.RECEIVED, resp.response)
+        client._release(conn)
+        return resp, sent
+
+    def trigger(self):
+        """
+        Send TRIGGER to every unit with the smallest skew we can manage: frames are built and connections checked out first,
+        then all sends are released together from a barrier. The measured skew is appended to self.skews.
+
+        Returns:
+            list: the medocResponse to TRIGGER from each unit, in endpoint order
+
+        Raises:
+            MedocConnectionError: if a unit can't be reached before the sends are released (then no unit is triggered), or its TRIGGER
+                                  fails; a TRIGGER that was sent but got no response is reported as such, and not sent again
+        """
+        commandbytes = commandBuilder('TRIGGER')
+        # every unit gets its own connect timeout to reach the barrier, plus a second to spare
+        barrier = threading.Barrier(len(self.clients), timeout=max(client.timeout for client in self.clients) + 1.)
+        futures = [self._executor.submit(self._triggerOne, client, commandbytes, barrier) for client in self.clients]
+        results = []
+        failed = []
+        for client, future in zip(self.clients, futures):
+            try:
+                results.append(future.result())
+            except threading.BrokenBarrierError:
+                pass    # released by a unit that failed to connect, or by the barrier timing out
+            except OSError as err:
+                failed.append("%s:%s (%s)" % (client.address, client.port, err))
+        if barrier.broken or failed:
+            metrics.count('trigger_failures')
+            if not failed:
+                failed = ["%s:%s (timed out at the barrier)" % (client.address, client.port) for client in self.clients]
+            if barrier.broken:
+                raise MedocConnectionError("TRIGGER not sent to any thermode; couldn't reach " + ", ".join(failed))
+            raise MedocConnectionError("TRIGGER failed on " + ", ".join(failed))
+        sent = [result[1] for result in results]
+        self.skews.append(max(sent) - min(sent))
+        if config.debug:
+            print("Triggered %d thermodes, skew %.3f ms" % (len(self.clients), 1000 * self.skews[-1]))
+        return [result[0] for result in results]
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        for client in self.clients:
+            client.close()
+
+class MedocTelemetryRecorder():
+    """
+    Samples the MMS at a fixed rate on a background thread and keeps temperature, CoVAS, yes/no, test time and test state
+    in a preallocated NumPy ring buffer, timestamped on the experiment clock. flush() writes the run's trace as a BIDS _physio.tsv.gz.
+    Give it its own MedocClient (or a pool_size > 1) so sampling doesn't queue behind trial commands.
+    e.g. : telemetry = MedocTelemetryRecorder(MedocClient(), clock=globalClock, rate=20).start()
+           ... run trials ...
+           telemetry.flush(bids_data_filename.replace('_events.tsv', '_physio.tsv.gz'), start_time=fmriStart)
+    """
+    columns = ('time', 'temperature', 'covas', 'yes', 'no', 'test_time', 'test_state')
+    formats = ('%.4f', '%.2f', '%d', '%d', '%d', '%.3f', '%d')
+
+    def __init__(self, client=None, clock=None, rate=20., max_duration=1800.):
+        """
+        Args:
+            client (MedocClient): client to sample over; defaults to a new MedocClient()
+            clock (psychopy.core.Clock): clock to timestamp samples on, e.g. globalClock; anything with getTime(); defaults to perf_counter()
+            rate (float): samples per second; default 20
+            max_duration (float): seconds of samples the ring buffer holds before overwriting the oldest; default 1800 (30 minutes)
+        """
+        self.client = MedocClient() if client is None else client
+        self.clock = clock
+        self.rate = rate
+        self.capacity = int(rate * max_duration)
+        self.buffer = np.full((self.capacity, len(self.columns)), np.nan)
+        self.count = 0                  # samples written since the last flush; the newest is at (count - 1) % capacity
+        self.missed = 0                 # sampling deadlines skipped because the MMS answered late
+        self._lock = threading.Lock()   # held while a sample is written, and while flush() takes the buffer
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _now(self):
+        return perf_counter() if self.clock is None else self.clock.getTime()
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='MedocTelemetryRecorder', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        interval = 1. / self.rate
+        next_sample = perf_counter()
+        while not self._stopped.is_set():
+            try:
+                resp = self.client.sendCommand('GET_STATUS', echo=False)
+            except Exception as err:
+                # a missing sample, not a dead recorder: keep sampling whatever went wrong
+                metrics.count('telemetry_errors')
+                print("==> Telemetry: %s: %s" % (type(err).__name__, err))
+                resp = None
+            if resp is not None:
+                with self._lock:
+                    row = self.buffer[self.count % self.capacity]
+                    row[0] = self._now()
+                    row[1] = resp.temp
+                    row[2] = resp.CoVAS
+                    row[3] = resp.yes
+                    row[4] = resp.no
+                    row[5] = resp.testtime
+                    row[6] = resp.teststate
+                    self.count += 1
+            # stay on the original sampling grid; skip deadlines we've already missed rather than bursting to catch up
+            next_sample += interval
+            now = perf_counter()
+            if next_sample < now:
+                skipped = int((now - next_sample) / interval) + 1
+                self.missed += skipped
+                next_sample += skipped * interval
+            self._stopped.wait(next_sample - now)
+
+    def samples(self):
+        """
+        Returns:
+            np.ndarray: the buffered samples in time order, one row per sample and one column per entry in columns
+        """
+        with self._lock:
+            return self._ordered()
+
+    def _ordered(self):
+        count = self.count
+        if count <= self.capacity:
+            return self.buffer[:count].copy()
+        start = count % self.capacity
+        return np.concatenate((self.buffer[start:], self.buffer[:start]))
+
+    def flush(self, path, start_time=0.):
+        """
+        Write the buffered samples as a BIDS physio file (gzipped, headerless TSV) plus its JSON sidecar, then empty the buffer.
+
+        Args:
+            path (str): the _physio.tsv.gz path, e.g. next to the run's _events.tsv
+            start_time (float): clock time of the run's first volume, e.g. fmriStart; times are written relative to it
+        """
+        # take the samples and reset the count in one step, so a sample taken meanwhile lands in the next flush instead of being lost
+        with self._lock:
+            samples = self._ordered()
+            self.count = 0
+        samples[:, 0] -= start_time
+        np.savetxt(path, samples, fmt=self.formats, delimiter='\t')
+        sidecar = {'SamplingFrequency': self.rate,
+                   'StartTime': float(samples[0, 0]) if len(samples) else 0.,
+                   'Columns': list(self.columns)}
+        with open(path.replace('.tsv.gz', '.json'), 'w') as f:
+            json.dump(sidecar, f, indent=2)
+
+class MedocWaveformDriver():
+    """
+    Plays an arbitrary temperature trajectory with T_UP/T_DOWN steps on a fixed deadline grid, for time-varying (e.g. tonic pain)
+    profiles that a pre-programmed TP can't express. The trajectory is quantized to the step resolution and a step is only sent
+    when the quantized target moves, so a slow ramp costs one command per resolution step rather than one per sample.
+    Steps go out through a MedocPipeline, so the control loop never waits on the MMS. Every response's temperature is kept in the
+    achieved-vs-target trace for report(). Once the thermode has settled (no step since the previous reading, and the temperature
+    within resolution of it), the reading is compared with its target and a fraction of the difference is folded into later steps
+    to cancel drift; readings taken mid-ramp are left out, so the thermode's ramp lag isn't mistaken for drift.
+    The MMS must be running a test that accepts T_UP/T_DOWN, e.g. config.vas_search_program selected and triggered.
+    e.g. : t = np.arange(0, 60, .1)
+           driver = MedocWaveformDriver(40 + 2 * np.sin(2 * np.pi * t / 20), sample_rate=10)
+           driver.run()
+           print(driver.report())
+    """
+    columns = ('time', 'target', 'temperature')
+
+    def __init__(self, trajectory, sample_rate, pipeline=None, resolution=.1, correction=.2, max_correction=1., status_interval=.25):
+        """
+        Args:
+            trajectory (array): target temperature in °C at each sample
+            sample_rate (float): samples per second; also the control rate
+            pipeline (MedocPipeline): connection to send steps over; defaults to a new MedocPipeline()
+            resolution (float): smallest step sent, in °C; default .1
+            correction (float): fraction of each settled reading's setpoint error folded into later steps; 0 plays the trajectory open loop; default .2
+            max_correction (float): largest total drift correction, in °C; default 1
+            status_interval (float): seconds without a step after which a GET_STATUS is sent to keep measuring; default .25s
+        """
+        self.targets = np.asarray(trajectory, dtype=float)
+        self.sample_rate = sample_rate
+        self.pipeline = MedocPipeline() if pipeline is None else pipeline
+        self.resolution = resolution
+        self.correction = correction
+        self.max_correction = max_correction
+        self.status_interval = status_interval
+        self.trace = np.full((len(self.targets), len(self.columns)), np.nan)
+        self.count = 0          # rows of trace filled
+        self.commands = 0       # T_UP/T_DOWN steps sent
+        self.missed = 0         # control deadlines skipped because the loop ran late
+        self.offset = 0.        # current drift correction, in °C
+        self._last = None       # (setpoint, temperature) of the previous reading, to tell whether the thermode has settled
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self.targets)
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self.run, name='MedocWaveformDriver', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def wait(self, timeout=None):
+        """Block until the trajectory has finished playing in the background."""
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _measure(self, outstanding, index, started):
+        # fold finished responses into the drift correction and the achieved-vs-target trace
+        while outstanding and outstanding[0][0].done():
+            future, aim, setpoint = outstanding.popleft()
+            try:
+                resp = future.result()
+            except MedocConnectionError as err:
+                print("==> Waveform: " + str(err))
+                continue
+            row = self.trace[self.count]
+            row[0] = perf_counter() - started
+            row[1] = self.targets[index]
+            row[2] = resp.temp
+            self.count += 1
+            last, self._last = self._last, (setpoint, resp.temp)
+            if last is not None and abs(setpoint - last[0]) < self.resolution / 2 and abs(resp.temp - last[1]) < self.resolution:
+                self.offset = min(self.max_correction, max(-self.max_correction, self.offset + self.correction * (aim - resp.temp)))
+
+    def run(self):
+        """
+        Play the trajectory, blocking until it ends or stop() is called.
+        """
+        setpoint = self.pipeline.sendCommand('GET_STATUS').temp
+        # each tick can leave at most one response to measure; size the trace for that
+        self.trace = np.full((len(self.targets), len(self.columns)), np.nan)
+        self.count = 0
+        self.commands = 0
+        self.missed = 0
+        self.offset = 0.
+        self._last = None
+        interval = 1. / self.sample_rate
+        outstanding = collections.deque()
+        started = perf_counter()
+        last_status = started
+        index = 0
+        while index < len(self.targets) and not self._stopped.is_set():
+            self._measure(outstanding, index, started)
+            step = round((self.targets[index] + self.offset - setpoint) / self.resolution) * self.resolution
+            now = perf_counter()
+            if step:
+                setpoint += step
+                outstanding.append((self.pipeline.submit('T_UP' if step > 0 else 'T_DOWN', int(round(abs(step) * 100))), setpoint - self.offset, setpoint))
+                self.commands += 1
+                last_status = now
+            elif now - last_status >= self.status_interval:
+                outstanding.append((self.pipeline.submit('GET_STATUS'), setpoint - self.offset, setpoint))
+                last_status = now
+            # stay on the sample grid; skip samples we're already late for rather than bursting to catch up
+            index += 1
+            deadline = started + index * interval
+            now = perf_counter()
+            if deadline < now:
+                skipped = int((now - deadline) / interval) + 1
+                self.missed += skipped
+                index += skipped
+                deadline += skipped * interval
+            self._stopped.wait(deadline - now)
+        for future, _, _ in outstanding:
+            try:
+                future.result(self.pipeline.timeout)
+            except (MedocConnectionError, concurrent.futures.TimeoutError):
+                pass
+        self._measure(outstanding, min(index, len(self.targets) - 1), started)
+
+    def errors(self):
+        """
+        Returns:
+            np.ndarray: achieved minus target temperature, in °C, for each measurement
+        """
+        trace = self.trace[:self.count]
+        return trace[:, 2] - trace[:, 1]
+
+    def report(self):
+        """
+        Returns:
+            dict: steps sent, deadlines missed, final drift correction and achieved-vs-target error statistics in °C
+        """
+        errors = self.errors()
+        summary = {'samples': len(self.targets), 'commands': self.commands, 'missed': self.missed,
+                   'measurements': len(errors), 'offset': round(self.offset, 3)}
+        if len(errors):
+            summary.update({'mean_error': round(float(errors.mean()), 3),
+                            'rms_error': round(float(np.sqrt(np.mean(errors ** 2))), 3),
+                            'max_abs_error': round(float(np.abs(errors).max()), 3)})
+        return summary
+
+class AsyncMedocClient():
+    """
+    An asyncio-native MMS client, so waiting on the thermode never blocks a thread that should be flipping frames.
+    Holds one persistent connection; concurrent send()s on the same client are serialized.
+    e.g. : thermode = AsyncMedocClient()
+           resp = await thermode.send('select_tp', thermode_temp2program['47'])
+           await thermode.wait_for_state('RUNNING')
+           await thermode.send('trigger')
+    From PsychoPy code, run these on a ThermodeEventLoop instead of awaiting them directly.
+    """
+    def __init__(self, address=None, port=None, timeout=5., retry_policy=None):
+        """
+        Args:
+            address (str): MMS hostName (IP); defaults to config.address
+            port (int): MMS port; defaults to config.port
+            timeout (float): seconds to wait on connect/response before treating the connection as dead; default 5s
+            retry_policy (RetryPolicy): how to retry failed round trips; defaults to config.retry_policy
+        """
+        self.address = config.address if address is None else address
+        self.port = config.port if port is None else port
+        self.timeout = timeout
+        self.retry_policy = retry_policy
+        self._reader = None
+        self._writer = None
+        self._lock = None
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.wait_for(asyncio.open_connection(self.address, self.port), self.timeout)
+        self._writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    async def _disconnect(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def _transact(self, commandbytes):
+        reused = self._writer is not None
+        if reused:
+            # the MMS closes its end after each response; give the loop a chance to see that, then reconnect without counting it a failure
+            await asyncio.sleep(0)
+            if self._reader.at_eof() or self._writer.is_closing():
+                await self._disconnect()
+                reused = False
+        if self._writer is None:
+            await self._connect()
+        journal = config.journal
+        if journal is not None:
+            journal.record(MedocJournal.SENT, commandbytes)
+        try:
+            self._writer.write(commandbytes)
+            await self._writer.drain()
+            header = await self._reader.readexactly(response_header_length)
+        except (asyncio.IncompleteReadError, ConnectionResetError) as err:
+            if reused and not getattr(err, 'partial', b''):
+                # closed while idle, just before we noticed: not a single response byte, so resend once on a fresh connection
+                await self._disconnect()
+                return await self._transact(commandbytes)
+            raise ConnectionResetError("MMS closed the connection") from err
+        try:
+            resp = medocResponse(header + await self._reader.readexactly(responseLength(header)))
+        except asyncio.IncompleteReadError as err:
+            raise ConnectionResetError("MMS closed the connection") from err
+        if journal is not None:
+            journal.record(MedocJournal.RECEIVED, resp.response)
+        return resp
+
+    async def send(self, command, parameter=None):
+        """
+        Send a command and return its medocResponse, reconnecting if the MMS reset or closed the connection.
+        e.g. : await thermode.send('get_status')
+        or await thermode.send('select_tp', '01000000')
+
+        Raises:
+            MedocConnectionError: if the retry policy gives up on reaching the MMS
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        commandbytes = commandBuilder(command, parameter=parameter)
+        async def attempt():
+            start = perf_counter()
+            try:
+                resp = await asyncio.wait_for(self._transact(commandbytes), self.timeout)
+            except BaseException:
+                await self._disconnect()
+                raise
+            metrics.record(commandbytes[8], 'response', perf_counter() - start)
+            return resp
+        retry_policy = config.retry_policy if self.retry_policy is None else self.retry_policy
+        async with self._lock:
+            deadline = perf_counter() + retry_policy.deadline
+            resp = await retry_policy.run_async(attempt, wake=lambda: wakeUp(self.address, self.port, deadline=deadline))
+        if config.debug:
+            printResponse(resp)
+        return resp
+
+    async def wait_for_state(self, desired_value, poll_interval=config.timedelayformedoc, poll_max=20, server_lag=1.):
+        """
+        asyncio equivalent of poll_for_change: poll GET_STATUS until the test state is desired_value, without blocking the event loop.
+
+        Args:
+            desired_value (str): the test state to wait for, e.g. 'RUNNING' or 'IDLE'
+            poll_interval (float): how often to poll; default config.timedelayformedoc
+            poll_max (int): upper limit on polling attempts; -1 for unlimited; default 20
+            server_lag (float): extra delay after the change before returning, see poll_for_change; default 1s
+
+        Returns:
+            status (bool): whether desired_value was achieved
+        """
+        count = 1
+        while True:
+            response = await self.send('GET_STATUS')
+            if response.teststatestr == desired_value:
+                break
+            await asyncio.sleep(poll_interval)
+            count += 1
+            if poll_max > 0 and count > poll_max:
+                print("Polling limit exceeded")
+                return False
+        await asyncio.sleep(server_lag)
+        return True
+
+    async def close(self):
+        await self._disconnect()
+
+
+class ThermodeEventLoop():
+    """
+    Runs an asyncio event loop on a background thread so thermode coroutines can be started from the (synchronous) PsychoPy frame loop.
+    submit() returns a concurrent.futures.Future immediately; keep flipping frames and check future.done(), or see waitForThermode in CANLab_PsychoPy_Utilities.
+    e.g. : loop = ThermodeEventLoop().start()
+           thermode = AsyncMedocClient()
+           future = loop.submit(thermode.send('trigger'))
+    """
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name='ThermodeEventLoop', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def submit(self, coro):
+        """
+        Schedule a coroutine on the background loop and return a concurrent.futures.Future for its result.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """
+        Run a coroutine on the background loop and block until it finishes; for code that has no frames to flip.
+        """
+        return self.submit(coro).result(timeout)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
+
 # printout:
 class medocResponse():
     """
     A container to interpret and store the output response.
+    The status fields are decoded with one precompiled unpack; timestamps, strings and the message are only built when read.
     """
+    __slots__ = ('length', '_timestamp', 'command', 'state', 'teststate', 'respcode', '_testtime', '_temp', 'CoVAS', 'yes', 'no', 'response')
+
     # decoding the bytes we receive:
     def __init__(self, response):
-        self.length = struct.unpack_from('H', response[0:4])[0]
-        self.timestamp = intFromBytes(response[4:8])
-        self.datetime = datetime.fromtimestamp(self.timestamp)
-        self.strtime = self.datetime.strftime("%Y-%m-%d %H:%M:%S")
-        self.command = intFromBytes(response[8:9])
-        self.state = intFromBytes(response[9:10])
-        self.teststate = intFromBytes(response[10:11])
+        (self.length, self._timestamp, self.command, self.state, self.teststate, self.respcode,
+         self._testtime, self._temp, self.CoVAS, self.yes, self.no) = _response_fields.unpack_from(response)
+        # store the whole response
+        self.response = response
+
+    @property
+    def timestamp(self):
+        return intFromBytes(self._timestamp)
+
+    @property
+    def datetime(self):
+        return datetime.fromtimestamp(self.timestamp)
+
+    @property
+    def strtime(self):
+        return self.datetime.strftime("%Y-%m-%d %H:%M:%S")
+
+    @property
+    def statestr(self):
         # see if we have a documented state for this response:
-        if self.state in states:
-            self.statestr = states[self.state]
-        else:
-            self.statestr = 'unknown state code'
-            self.teststate = intFromBytes(response[10:11])
-            # see if we have a documented test state for this response:
-        if self.teststate in test_states:
-            self.teststatestr = test_states[self.teststate]
-        else:
-            self.teststatestr = 'unknown test state code'
-        
-        self.respcode = struct.unpack_from('H', response[11:13])[0]
-        if self.respcode in response_codes:
-            self.respstr = response_codes[self.respcode]
-        else:
-            self.respstr = "unknown response code"
-        
+        return states.get(self.state, 'unknown state code')
+
+    @property
+    def teststatestr(self):
+        # see if we have a documented test state for this response:
+        return test_states.get(self.teststate, 'unknown test state code')
+
+    @property
+    def respstr(self):
+        return response_codes.get(self.respcode, "unknown response code")
+
+    @property
+    def testtime(self):
         # the test time is in seconds once divided by 1000:
-        self.testtime = struct.unpack_from('I', response[13:17])[0] / 1000.
+        return self._testtime / 1000.
+
+    @property
+    def temp(self):
         # the temperature is in °C once divided by 100:
-        self.temp = struct.unpack_from('h', response[17:19])[0] / 100.
-        self.CoVAS = intFromBytes(response[19:20])
-        self.yes = intFromBytes(response[20:21])
-        self.no = intFromBytes(response[21:22])
-        self.message = response[22:self.length]
-        # store the whole response
-        self.response = response
+        return self._temp / 100.
+
+    @property
+    def message(self):
+        return self.response[_response_fields.size:self.length]
+
     def __repr__(self):
         msg = ""
         msg += f"timestamp : {self.strtime}\n"
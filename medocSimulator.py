@@ -0,0 +1,272 @@
+# medocSimulator.py
+# A stand-in for the Medoc MMS external control server, for developing and benchmarking medocControl without the thermode.
+from time import time, perf_counter, sleep
+import socket
+import socketserver
+import struct
+import threading
+import queue
+import random
+import argparse
+
+from medocControl import id_to_command
+
+# states and test states, as decoded by medocResponse
+IDLE, READY, TEST_IN_PROGRESS = 0, 1, 2
+TEST_IDLE, TEST_RUNNING, TEST_PAUSED, TEST_READY = 0, 1, 2, 3
+
+OK = 0
+ILLEGAL_PARAMETER = 1
+ILLEGAL_STATE = 2
+NOT_PROPER_TEST_STATE = 3
+
+_command_header = struct.Struct('>I')       # the 4-byte length commandBuilder prepends
+_command_parameter = struct.Struct('<I')    # htonl'd by commandBuilder, so little-endian on the wire
+_response_body = struct.Struct('>IBBB')     # timestamp, command, state, test state
+_response_status = struct.Struct('<HIhBBB') # response code, test time (ms), temperature (1/100 °C), CoVAS, yes, no
+
+
+class MedocSimulator():
+    """
+    A pure-Python MMS that speaks the framing commandBuilder produces and answers with responses medocResponse decodes.
+
+    The machine starts IDLE, becomes READY after startup_delay, and enters TEST IN PROGRESS (test state RUNNING) select_delay after a SELECT_TP.
+    A TRIGGER then ramps the temperature to the program's target over ramp_time, holds it for stimulation_time, ramps back
+    down, and returns to READY/IDLE. Commands sent in the wrong state get the same failure codes the MMS uses.
+
+    e.g. : with MedocSimulator(select_delay=.2) as mms:
+               config.address, config.port = mms.address
+               sendCommand('select_tp', 140)
+    """
+    def __init__(self, address='127.0.0.1', port=0, programs=None, baseline_temp=32., startup_delay=0., select_delay=.5, ramp_time=1.,
+                 stimulation_time=2., close_after_response=True, reset_every=0, reset_probability=0., seed=None, latency=0., step_gain=1.):
+        """
+        Args:
+            address (str): interface to listen on; default localhost
+            port (int): port to listen on; default 0 (any free port, see self.address)
+            programs (dict): program code (int) -> target temperature in °C; programs not listed heat to 47°C
+            baseline_temp (float): resting thermode temperature in °C; default 32
+            startup_delay (float): seconds from IDLE to READY after the simulator starts; default 0
+            select_delay (float): seconds from SELECT_TP until the test state is RUNNING; default .5s
+            ramp_time (float): seconds to ramp between baseline and target temperature, each way; default 1s
+            stimulation_time (float): seconds to hold the target temperature; default 2s
+            close_after_response (bool): close the connection after each response, one connection per command as the module-level sendCommand uses; default True
+            reset_every (int): reset (RST) the connection instead of answering every Nth command; default 0 (never)
+            reset_probability (float): chance of resetting the connection instead of answering any command; default 0
+            seed (int): seed for reset_probability
+            latency (float): seconds each response spends "on the wire" before the client sees it; commands keep being read meanwhile,
+                             as over a real network; default 0
+            step_gain (float): fraction of each T_UP/T_DOWN step the thermode actually achieves, to model drift; default 1
+        """
+        self.programs = programs if programs is not None else {}
+        self.baseline_temp = baseline_temp
+        self.startup_delay = startup_delay
+        self.select_delay = select_delay
+        self.ramp_time = ramp_time
+        self.stimulation_time = stimulation_time
+        self.close_after_response = close_after_response
+        self.reset_every = reset_every
+        self.reset_probability = reset_probability
+        self.latency = latency
+        self.step_gain = step_gain
+        self.commands_received = 0
+        self.resets_injected = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._started = perf_counter()
+        self._selected_at = None
+        self._triggered_at = None
+        self._target_temp = baseline_temp
+        self._temp_offset = 0.
+        self.covas = 0
+        self.yes = 0
+        self.no = 0
+        self._server = _MedocServer((address, port), _MedocHandler)
+        self._server.simulator = self
+        self._thread = None
+
+    @property
+    def address(self):
+        """(host, port) the simulator is listening on."""
+        return self._server.server_address
+
+    def start(self):
+        self._started = perf_counter()
+        self._thread = threading.Thread(target=self._server.serve_forever, name='MedocSimulator', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # state machine
+    def _status(self, now):
+        """Return (state, teststate, test time in s, temperature in °C) at perf_counter() time now."""
+        if now - self._started < self.startup_delay:
+            return IDLE, TEST_IDLE, 0., self.baseline_temp + self._temp_offset
+        if self._selected_at is None or now - self._selected_at < self.select_delay:
+            return READY, TEST_IDLE, 0., self.baseline_temp + self._temp_offset
+        if self._triggered_at is None:
+            return TEST_IN_PROGRESS, TEST_RUNNING, 0., self.baseline_temp + self._temp_offset
+        elapsed = now - self._triggered_at
+        rise = self._target_temp - self.baseline_temp
+        if elapsed < self.ramp_time:
+            temp = self.baseline_temp + rise * elapsed / self.ramp_time
+        elif elapsed < self.ramp_time + self.stimulation_time:
+            temp = self._target_temp
+        elif elapsed < 2 * self.ramp_time + self.stimulation_time:
+            temp = self._target_temp - rise * (elapsed - self.ramp_time - self.stimulation_time) / self.ramp_time
+        else:
+            # test finished, back to waiting for external control
+            self._selected_at = self._triggered_at = None
+            return READY, TEST_IDLE, 0., self.baseline_temp + self._temp_offset
+        return TEST_IN_PROGRESS, TEST_RUNNING, elapsed, temp + self._temp_offset
+
+    def execute(self, command, parameter):
+        """Apply one command to the simulated MMS and return the response frame."""
+        with self._lock:
+            now = perf_counter()
+            state, teststate, _, _ = self._status(now)
+            respcode = OK
+            name = id_to_command.get(command)
+            if name is None:
+                respcode = ILLEGAL_PARAMETER
+            elif name == 'SELECT_TP':
+                if state != READY or teststate != TEST_IDLE:
+                    respcode = ILLEGAL_STATE
+                else:
+                    self._selected_at = now
+                    self._target_temp = self.programs.get(parameter, 47.)
+            elif name in ('TRIGGER', 'START'):
+                if teststate != TEST_RUNNING or self._triggered_at is not None:
+                    respcode = NOT_PROPER_TEST_STATE
+                else:
+                    self._triggered_at = now
+            elif name in ('STOP', 'ABORT'):
+                if state != TEST_IN_PROGRESS:
+                    respcode = ILLEGAL_STATE
+                self._selected_at = self._triggered_at = None
+            elif name in ('T_UP', 'T_DOWN'):
+                step = self.step_gain * (parameter or 0) / 100.
+                self._temp_offset += step if name == 'T_UP' else -step
+            elif name in ('VAS', 'COVAS'):
+                self.covas = min(int(parameter or 0), 255)
+            elif name == 'YES':
+                self.yes = 1
+            elif name == 'NO':
+                self.no = 1
+            state, teststate, testtime, temp = self._status(now)
+            body = _response_body.pack(int(time()), command, state, teststate)
+            body += _response_status.pack(respcode, int(testtime * 1000), int(round(temp * 100)), self.covas, self.yes, self.no)
+            self.yes = self.no = 0
+            return struct.pack('<I', len(body)) + body
+
+    def _shouldReset(self):
+        with self._lock:
+            self.commands_received += 1
+            reset = (self.reset_every and self.commands_received % self.reset_every == 0) or \
+                (self.reset_probability and self._random.random() < self.reset_probability)
+            if reset:
+                self.resets_injected += 1
+            return bool(reset)
+
+
+class _MedocServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _MedocHandler(socketserver.BaseRequestHandler):
+    def _send(self, response, due):
+        if due is None:
+            self.request.sendall(response)
+            return
+        # delayed responses go out in order from one sender thread, like bytes through a link with fixed latency
+        if self._outbox is None:
+            self._outbox = queue.SimpleQueue()
+            self._sender = threading.Thread(target=self._sendLater, daemon=True)
+            self._sender.start()
+        self._outbox.put((response, due))
+
+    def _sendLater(self):
+        while True:
+            response, due = self._outbox.get()
+            if response is None:
+                return
+            delay = due - perf_counter()
+            if delay > 0:
+                sleep(delay)
+            try:
+                self.request.sendall(response)
+            except OSError:
+                return
+
+    def _recvExactly(self, nbytes):
+        msg = b''
+        while len(msg) < nbytes:
+            data = self.request.recv(nbytes - len(msg))
+            if not data:
+                return None
+            msg += data
+        return msg
+
+    def handle(self):
+        simulator = self.server.simulator
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._outbox = None
+        try:
+            self._serve(simulator)
+        finally:
+            if self._outbox is not None:
+                # let responses still on the wire arrive before the connection closes
+                self._outbox.put((None, None))
+                self._sender.join()
+
+    def _serve(self, simulator):
+        while True:
+            header = self._recvExactly(_command_header.size)
+            if header is None:
+                return
+            body = self._recvExactly(_command_header.unpack(header)[0])
+            if body is None:
+                return
+            command = body[4]
+            parameter = _command_parameter.unpack_from(body, 5)[0] if len(body) >= 9 else None
+            if simulator._shouldReset():
+                # SO_LINGER with a zero timeout makes close() send RST, which the client sees as ConnectionResetError
+                self.request.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+                self.request.close()
+                return
+            self._send(simulator.execute(command, parameter), perf_counter() + simulator.latency if simulator.latency else None)
+            if simulator.close_after_response:
+                return
+
+
+if __name__ == "__main__":
+    from medocControl import config
+    parser = argparse.ArgumentParser(description="Run a simulated Medoc MMS for testing medocControl without the thermode.")
+    parser.add_argument('--address', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=config.port)
+    parser.add_argument('--select-delay', type=float, default=.5)
+    parser.add_argument('--ramp-time', type=float, default=1.)
+    parser.add_argument('--stimulation-time', type=float, default=2.)
+    parser.add_argument('--keep-alive', action='store_true', help="keep connections open between commands")
+    parser.add_argument('--reset-every', type=int, default=0)
+    parser.add_argument('--reset-probability', type=float, default=0.)
+    parser.add_argument('--latency', type=float, default=0., help="seconds added to every response, as a network would")
+    args = parser.parse_args()
+    mms = MedocSimulator(args.address, args.port, select_delay=args.select_delay, ramp_time=args.ramp_time,
+                         stimulation_time=args.stimulation_time, close_after_response=not args.keep_alive,
+                         reset_every=args.reset_every, reset_probability=args.reset_probability, latency=args.latency)
+    print("Simulated MMS listening on %s:%d" % mms.address)
+    try:
+        mms._server.serve_forever()
+    except KeyboardInterrupt:
+        mms.stop()